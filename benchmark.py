@@ -0,0 +1,717 @@
+# Author: Waberi Daher
+# Matricule: 000353308
+"""
+    Benchmarks for the ULDB engine.
+    Usage: python3 benchmark.py [benchmark name] [number of rows]
+    Without a name, every benchmark is run.
+"""
+import io
+import os
+import shutil
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+import database
+from binary import BinaryFile, IOStats, MmapBinaryFile, PageCache
+from database import Database, FieldType
+from index import FieldIndex
+
+BENCH_DB = 'bench_db'
+
+
+class CountingFileIO(io.FileIO):
+    """
+        Raw file counting the calls that reach the operating system.
+        Wrapped in an io.BufferedRandom it behaves like open(path, 'rb+'),
+        every counted call being one syscall (read, write or lseek).
+    """
+    def __init__(self, path: str, mode: str = 'r+', calls: dict = None):
+        super().__init__(path, mode)
+        self.calls = calls if calls is not None else {'read': 0, 'write': 0, 'seek': 0, 'tell': 0}
+
+    def readinto(self, buffer) -> int:
+        self.calls['read'] += 1
+        return super().readinto(buffer)
+
+    def write(self, data) -> int:
+        self.calls['write'] += 1
+        return super().write(data)
+
+    def seek(self, pos: int, whence: int = 0) -> int:
+        self.calls['seek'] += 1
+        return super().seek(pos, whence)
+
+    def tell(self) -> int:
+        self.calls['tell'] += 1
+        return super().tell()
+
+
+class LegacyBinaryFile(BinaryFile):
+    """
+        BinaryFile measuring the file size on every access, like the engine
+        did before the size was cached (two seeks per goto and per read).
+    """
+    @property
+    def size(self) -> int:
+        return self._measure_size()
+
+    @size.setter
+    def size(self, value: int) -> None:
+        # nothing to cache
+        pass
+
+    @contextmanager
+    def unchecked(self):
+        # the legacy engine had no way to skip the bounds checks
+        yield self
+
+
+@contextmanager
+def counting_table(db: Database, table_name: str, binary_class: type = BinaryFile):
+    """
+        Opens a table file through a CountingFileIO.
+        :param db: database owning the table
+        :param table_name: name of the table
+        :param binary_class: BinaryFile class wrapping the file
+        :return: (binary file, raw counting file)
+    """
+    raw = CountingFileIO(f"{db.name}/{table_name}.table")
+    with io.BufferedRandom(raw) as f:
+        yield binary_class(f), raw
+
+
+@contextmanager
+def counting_engine_files():
+    """
+        Routes every file opened by the database module through a CountingFileIO.
+        :return: dict of syscall counts, shared by all the files (plus 'open')
+    """
+    calls = {'open': 0, 'read': 0, 'write': 0, 'seek': 0, 'tell': 0}
+
+    def counting_open(path: str, mode: str = 'r', buffering: int = -1):
+        calls['open'] += 1
+        raw = CountingFileIO(path, mode.replace('b', ''), calls)
+        return raw if buffering == 0 else io.BufferedRandom(raw)
+
+    database.open = counting_open
+    try:
+        yield calls
+    finally:
+        del database.open
+
+
+def format_calls(calls: dict) -> str:
+    """
+        Formats syscall counts as "total (kind=count, ...)".
+    """
+    details = ', '.join(f"{kind}={count}" for kind, count in calls.items())
+    return f"{sum(calls.values()):>9} syscalls ({details})"
+
+
+def fresh_db() -> Database:
+    """
+        Creates an empty benchmark database.
+    """
+    if os.path.exists(BENCH_DB):
+        shutil.rmtree(BENCH_DB)
+    return Database(BENCH_DB)
+
+
+def fill_integer_table(db: Database, table_name: str, rows: int, nfields: int = 4, distinct: int = 1000) -> None:
+    """
+        Creates a table of INTEGER fields and writes rows entries to it,
+        laid out exactly like successive add_entry calls would.
+        :param db: database
+        :param table_name: name of the table
+        :param rows: number of entries
+        :param nfields: number of INTEGER fields
+        :param distinct: number of distinct values of each field
+    """
+    db.create_table(table_name, *[(f"F{i}", FieldType.INTEGER) for i in range(nfields)])
+    with open(f"{db.name}/{table_name}.table", 'rb+') as f:
+        binary_file = BinaryFile(f)
+        header = db._parse_header(binary_file)
+        entry_buffer_offset = header['entry_buffer_offset']
+        entry_size = 4 + nfields * 4 + 8
+        first = entry_buffer_offset + 20
+        binary_file.goto(first)
+        for i in range(rows):
+            position = first + i * entry_size
+            binary_file.write_integers([
+                i + 1,
+                *((i * (j + 1)) % distinct for j in range(nfields)),
+                position - entry_size if i > 0 else -1,
+                position + entry_size if i < rows - 1 else -1,
+            ], 4)
+        # entry header
+        binary_file.goto(entry_buffer_offset)
+        last = first + (rows - 1) * entry_size
+        binary_file.write_integers((rows, rows, first if rows else -1, last if rows else -1, -1), 4)
+    # written behind the back of the database: its metadata must be read again
+    db.close()
+
+
+def bench_scan_syscalls(rows: int = 100_000) -> None:
+    """
+        Counts the syscalls of a full table scan (_build_table_index),
+        with the size measured on every access (before) and cached (after).
+        :param rows: number of entries in the scanned table
+    """
+    db = fresh_db()
+    fill_integer_table(db, 'scan', rows)
+    print(f"table scan of {rows} rows (_build_table_index)")
+    for label, binary_class in (('before (size per call)', LegacyBinaryFile), ('after (cached size)', BinaryFile)):
+        with counting_table(db, 'scan', binary_class) as (binary_file, raw):
+            start = time.perf_counter()
+            db._build_table_index(binary_file, 'scan')
+            elapsed = time.perf_counter() - start
+        print(f"  {label:<24} {format_calls(raw.calls)} {elapsed:.2f}s")
+    shutil.rmtree(BENCH_DB)
+
+
+def bench_write_syscalls(rows: int = 100) -> None:
+    """
+        Counts the syscalls of creating a table and inserting rows entries,
+        with every write sent to the file (before) and coalesced (after).
+        :param rows: number of inserted entries
+    """
+    print(f"create_table + {rows} add_entry")
+    for label, coalesce in (('before (direct writes)', False), ('after (coalesced)', True)):
+        db = fresh_db()
+        db.coalesce_writes = coalesce
+        with counting_engine_files() as calls:
+            start = time.perf_counter()
+            db.create_table('cours', ('MNEM', FieldType.INTEGER), ('NOM', FieldType.STRING), ('CRED', FieldType.INTEGER))
+            created = dict(calls)
+            for i in range(rows):
+                db.add_entry('cours', {'MNEM': i, 'NOM': f"Cours {i % 10}", 'CRED': i % 10})
+            elapsed = time.perf_counter() - start
+        inserted = {kind: calls[kind] - created[kind] for kind in calls}
+        print(f"  {label:<24} create_table {format_calls(created)}")
+        print(f"  {'':<24} add_entry    {format_calls(inserted)} {elapsed:.2f}s")
+    shutil.rmtree(BENCH_DB)
+
+
+def bench_wide_table(rows: int = 20_000, nfields: int = 32) -> None:
+    """
+        Measures the insert and scan throughput of a table of nfields INTEGER fields.
+        :param rows: number of inserted entries
+        :param nfields: number of INTEGER fields
+    """
+    db = fresh_db()
+    db.create_table('wide', *[(f"F{i}", FieldType.INTEGER) for i in range(nfields)])
+    entries = [{f"F{j}": (i * (j + 1)) % 1000 for j in range(nfields)} for i in range(rows)]
+    start = time.perf_counter()
+    for entry in entries:
+        db.add_entry('wide', entry)
+    elapsed = time.perf_counter() - start
+    print(f"wide table of {nfields} INTEGER fields")
+    print(f"  add_entry x {rows:<12} {rows / elapsed:>10.0f} rows/s")
+    with open(f"{db.name}/wide.table", 'rb+') as f:
+        binary_file = BinaryFile(f)
+        start = time.perf_counter()
+        db._build_table_index(binary_file, 'wide')
+        elapsed = time.perf_counter() - start
+    print(f"  scan ({rows} rows){'':<8} {rows / elapsed:>10.0f} rows/s")
+    shutil.rmtree(BENCH_DB)
+
+
+def bench_page_cache(rows: int = 1000, max_pages: int = 64) -> None:
+    """
+        Counts the syscalls of inserting rows entries then looking them up,
+        without and with a page cache shared by the table files.
+        :param rows: number of inserted entries
+        :param max_pages: page budget of the cache (4 KiB pages)
+    """
+    print(f"create_table + {rows} add_entry + {rows} get_entry")
+    for label, cache in (('without page cache', None), (f'page cache ({max_pages} pages)', PageCache(max_pages))):
+        db = fresh_db()
+        db.page_cache = cache
+        with counting_engine_files() as calls:
+            start = time.perf_counter()
+            db.create_table('cours', ('MNEM', FieldType.INTEGER), ('NOM', FieldType.STRING), ('CRED', FieldType.INTEGER))
+            for i in range(rows):
+                db.add_entry('cours', {'MNEM': i, 'NOM': f"Cours {i % 10}", 'CRED': i % 10})
+            for i in range(rows):
+                db.get_entry('cours', 'MNEM', i)
+            elapsed = time.perf_counter() - start
+        print(f"  {label:<24} {format_calls(calls)} {elapsed:.2f}s")
+        if cache is not None:
+            print(f"  {'':<24} {cache.stats()}")
+    shutil.rmtree(BENCH_DB)
+
+
+def bench_io_breakdown(rows: int = 1000) -> None:
+    """
+        Prints the I/O counters of inserting rows entries, per operation
+        (add_entry and the steps it goes through).
+        :param rows: number of inserted entries
+    """
+    db = fresh_db()
+    db.io_counters = IOStats()
+    db.create_table('cours', ('MNEM', FieldType.INTEGER), ('NOM', FieldType.STRING), ('CRED', FieldType.INTEGER))
+    db.io_stats(reset=True)
+    for i in range(rows):
+        db.add_entry('cours', {'MNEM': i, 'NOM': f"Cours {i}", 'CRED': i % 10})
+    print(f"I/O of {rows} add_entry with unique strings")
+    for operation, counters in db.io_stats().items():
+        details = ', '.join(f"{name}={count}" for name, count in counters.items())
+        print(f"  {operation}\n    {details}")
+    shutil.rmtree(BENCH_DB)
+
+
+def bench_point_lookups(rows: int = 10_000) -> None:
+    """
+        Measures rows get_entry calls with the table files reopened on every
+        call (before) and kept in the pool of open files (after).
+        :param rows: number of entries, each looked up once
+    """
+    db = fresh_db()
+    fill_integer_table(db, 'points', rows)
+    db = Database(BENCH_DB)
+    print(f"{rows} get_entry point lookups")
+    for label, max_open_files in (('before (open per call)', 0), ('after (handle pool)', 16)):
+        db.close()
+        db.max_open_files = max_open_files
+        with counting_engine_files() as calls:
+            start = time.perf_counter()
+            for i in range(rows):
+                db.get_entry('points', 'F0', (i * 1) % 1000)
+            elapsed = time.perf_counter() - start
+        print(f"  {label:<24} {format_calls(calls)} {rows / elapsed:>9.0f} lookups/s")
+    db.close()
+    shutil.rmtree(BENCH_DB)
+
+
+def bench_unique_strings(rows: int = 100_000) -> None:
+    """
+        Inserts rows entries with a unique string each and prints the time of
+        every tenth of them: with the string buffer doubled on expansion the
+        time per insert stays flat (linear total). The legacy exact-fit growth
+        rewrites the table for every new string (quadratic total), it is timed
+        on much smaller tables.
+        :param rows: number of inserted entries
+    """
+    print(f"{rows} add_entry with unique strings (doubling string buffer)")
+    db = fresh_db()
+    db.create_table('names', ('N', FieldType.INTEGER), ('NAME', FieldType.STRING))
+    step = max(rows // 10, 1)
+    start = last = time.perf_counter()
+    for i in range(rows):
+        db.add_entry('names', {'N': i, 'NAME': f"name {i:08d}"})
+        if (i + 1) % step == 0:
+            now = time.perf_counter()
+            print(f"  {i + 1:>9} rows {now - start:8.2f}s  ({(now - last) / step * 1e6:7.1f} us/insert over the last {step})")
+            last = now
+    db.close()
+    print("legacy exact-fit growth")
+    for legacy_rows in (rows // 1000, rows // 500, rows // 250):
+        db = fresh_db()
+        db.exact_string_growth = True
+        db.create_table('names', ('N', FieldType.INTEGER), ('NAME', FieldType.STRING))
+        start = time.perf_counter()
+        for i in range(legacy_rows):
+            db.add_entry('names', {'N': i, 'NAME': f"name {i:08d}"})
+        elapsed = time.perf_counter() - start
+        print(f"  {legacy_rows:>9} rows {elapsed:8.2f}s  ({elapsed / max(legacy_rows, 1) * 1e6:7.1f} us/insert)")
+        db.close()
+    shutil.rmtree(BENCH_DB)
+
+
+def bench_rewrite(rows: int = 2_000_000) -> None:
+    """
+        Measures the rewrite of a table by a string buffer expansion.
+        :param rows: number of entries of the rewritten table
+    """
+    db = fresh_db()
+    fill_integer_table(db, 'rewrite', rows)
+    db = Database(BENCH_DB)
+    size = os.path.getsize(f"{BENCH_DB}/rewrite.table")
+    with db._open_table('rewrite') as binary_file:
+        header = db._parse_header(binary_file)
+        entry_header = db._parse_entry_header(binary_file, header)
+        start = time.perf_counter()
+        db._expand_string_buffer(binary_file, header, entry_header, 'rewrite', 102)
+        elapsed = time.perf_counter() - start
+    print(f"rewrite of a {size / 1e6:.1f} MB table ({rows} rows)")
+    print(f"  {elapsed:.2f}s  {size / 1e6 / elapsed:.0f} MB/s")
+    db.close()
+    shutil.rmtree(BENCH_DB)
+
+def bench_bulk_insert(rows: int = 1_000_000) -> None:
+    """
+        Inserts rows entries with add_entries, then a tenth of them with add_entry
+        one by one, and prints the insert rate and the I/O of each.
+        :param rows: number of entries inserted by add_entries
+    """
+    entries = [{'N': i, 'NAME': f"name {i % 1000:03d}"} for i in range(rows)]
+    for method, count in (('add_entries', rows), ('add_entry', max(rows // 10, 1))):
+        db = fresh_db()
+        db.io_counters = IOStats()
+        db.create_table('names', ('N', FieldType.INTEGER), ('NAME', FieldType.STRING))
+        start = time.perf_counter()
+        if method == 'add_entries':
+            db.add_entries('names', entries)
+        else:
+            for entry in entries[:count]:
+                db.add_entry('names', entry)
+        elapsed = time.perf_counter() - start
+        stats = db.io_stats()
+        writes = sum(op['writes'] for op in stats.values())
+        seeks = sum(op['seeks'] for op in stats.values())
+        print(f"{method:<12} {count:>9} rows {elapsed:7.2f}s  {count / elapsed:9.0f} rows/s  {writes} writes  {seeks} seeks")
+        db.close()
+    shutil.rmtree(BENCH_DB)
+
+def bench_compaction(rows: int = 200_000, budget: int = 256) -> None:
+    """
+        Deletes 45% of a table (below the compaction threshold), then compacts
+        it in one blocking call and, on the same table again, by steps of
+        budget records, and prints the total time and the longest step.
+        :param rows: number of entries of the table
+        :param budget: number of records moved per step
+    """
+    for step_budget in (None, budget):
+        db = fresh_db()
+        db.create_table('churn', ('N', FieldType.INTEGER), ('G', FieldType.INTEGER), ('NAME', FieldType.STRING))
+        db.add_entries('churn', [{'N': i, 'G': i % 20, 'NAME': f"name {i % 1000:03d}"} for i in range(rows)])
+        for group in range(9):
+            db.delete_entries('churn', 'G', group)
+        size = os.path.getsize(f"{BENCH_DB}/churn.table")
+        steps, longest = 0, 0.0
+        start = time.perf_counter()
+        done = False
+        while not done:
+            step_start = time.perf_counter()
+            done = db.compact('churn', budget=step_budget)
+            longest = max(longest, time.perf_counter() - step_start)
+            steps += 1
+        elapsed = time.perf_counter() - start
+        label = 'blocking' if step_budget is None else f"budget {step_budget}"
+        print(f"{label:<12} {steps:>6} steps {elapsed:7.2f}s  longest step {longest * 1e3:8.1f} ms  "
+              f"{size / 1e6:.1f} MB -> {os.path.getsize(f'{BENCH_DB}/churn.table') / 1e6:.1f} MB")
+        db.close()
+    shutil.rmtree(BENCH_DB)
+
+
+def bench_string_churn(rows: int = 2_000, rounds: int = 20) -> None:
+    """
+        Rewrites the string of every entry of a table with one of another
+        length, rounds times, and prints the time, the file size and the string
+        buffer statistics after each few rounds.
+        :param rows: number of entries of the table
+        :param rounds: number of rewrites of every entry
+    """
+    db = fresh_db()
+    db.create_table('churn', ('N', FieldType.INTEGER), ('NAME', FieldType.STRING))
+    db.add_entries('churn', [{'N': i, 'NAME': f"name {i}"} for i in range(rows)])
+    start = time.perf_counter()
+    for r in range(rounds):
+        for i in range(rows):
+            db.update_entries('churn', 'N', i, 'NAME', f"name {i} " + 'x' * ((i * 7 + r * 13) % 40))
+        if r % 5 == 4:
+            stats = db.string_buffer_stats('churn')
+            print(f"round {r + 1:>3} {time.perf_counter() - start:7.2f}s  "
+                  f"{os.path.getsize(f'{BENCH_DB}/churn.table') / 1e3:8.1f} kB  "
+                  f"used {stats['used']:>7} free {stats['free']:>6} in {stats['extents']:>5} extents  "
+                  f"fragmentation {stats['fragmentation']:.2f}")
+    db.close()
+    shutil.rmtree(BENCH_DB)
+
+
+def bench_reused_scan(rows: int = 200_000) -> None:
+    """
+        Builds the index of a table whose deleted slots were reused (its list of
+        entries jumps around the file), following the links and reading the
+        slots sequentially, and prints the time and the bytes read.
+        :param rows: number of entries of the table
+    """
+    db = fresh_db()
+    fill_integer_table(db, 'scan', rows)
+    db = Database(BENCH_DB)
+    for value in range(100):
+        db.delete_entries('scan', 'F0', value)
+    db.add_entries('scan', [{f"F{j}": i + j for j in range(4)} for i in range(rows // 10)])
+    print(f"index build of {rows} rows, 10% of the slots reused")
+    for label, scan in (('linked list walk', lambda *args: None), ('sequential scan', None)):
+        if scan is not None:
+            db._scan_records = scan
+        else:
+            del db._scan_records
+        with counting_table(db, 'scan') as (binary_file, raw):
+            start = time.perf_counter()
+            db._build_table_index(binary_file, 'scan')
+            elapsed = time.perf_counter() - start
+        print(f"  {label:<18} {format_calls(raw.calls)} {elapsed:.2f}s")
+    shutil.rmtree(BENCH_DB)
+
+
+def bench_wal(rows: int = 2_000) -> None:
+    """
+        Inserts rows entries one by one without the write-ahead log, then with
+        it in each sync mode, and prints the time and the number of syncs.
+        :param rows: number of add_entry calls
+    """
+    for sync in (None, 'off', 'group', 'full'):
+        db = fresh_db()
+        db.create_table('wal', ('N', FieldType.INTEGER), ('NAME', FieldType.STRING))
+        if sync is not None:
+            db.enable_wal(sync=sync)
+        start = time.perf_counter()
+        for i in range(rows):
+            db.add_entry('wal', {'N': i, 'NAME': f"name {i % 100}"})
+        elapsed = time.perf_counter() - start
+        syncs = db.wal.syncs if db.wal is not None else 0
+        label = 'no log' if sync is None else f"sync {sync}"
+        print(f"{label:<12} {rows / elapsed:9.0f} rows/s  {syncs:>6} syncs")
+        db.close()
+    shutil.rmtree(BENCH_DB)
+
+
+def bench_transaction(rows: int = 10_000) -> None:
+    """
+        Counts the syscalls of inserting rows entries one by one, each operation
+        written to the table file (before) and within one transaction (after).
+        :param rows: number of add_entry calls
+    """
+    print(f"{rows} add_entry")
+    for label, transaction in (('before (per operation)', False), ('after (one transaction)', True)):
+        db = fresh_db()
+        db.create_table('cours', ('MNEM', FieldType.INTEGER), ('NOM', FieldType.STRING))
+        with counting_engine_files() as calls:
+            start = time.perf_counter()
+            if transaction:
+                db.begin()
+            for i in range(rows):
+                db.add_entry('cours', {'MNEM': i, 'NOM': f"Cours {i % 10}"})
+            if transaction:
+                db.commit()
+            elapsed = time.perf_counter() - start
+        print(f"  {label:<24} {format_calls(calls)} {elapsed:.2f}s")
+        db.close()
+    shutil.rmtree(BENCH_DB)
+
+
+def bench_preallocation(rows: int = 20_000, extent: int = 1 << 20) -> None:
+    """
+        Inserts rows entries one by one with each backend, the table file growing
+        by each record (before) and by extents of extent bytes (after).
+        :param rows: number of add_entry calls
+        :param extent: preallocation extent in bytes
+    """
+    print(f"{rows} add_entry")
+    for backend in (BinaryFile, MmapBinaryFile):
+        for label, preallocate in (('before (per record)', 0), (f"after ({extent} B extents)", extent)):
+            db = fresh_db()
+            db.preallocate_extent = preallocate
+            db.create_table('cours', ('MNEM', FieldType.INTEGER), ('NOM', FieldType.STRING))
+            db.set_table_backend('cours', backend)
+            start = time.perf_counter()
+            for i in range(rows):
+                db.add_entry('cours', {'MNEM': i, 'NOM': f"Cours {i % 10}"})
+            elapsed = time.perf_counter() - start
+            print(f"  {backend.__name__:<15} {label:<26} {rows / elapsed:9.0f} rows/s")
+            db.close()
+    shutil.rmtree(BENCH_DB)
+
+
+def bench_startup(tables: int = 50, rows: int = 20_000) -> None:
+    """
+        Opens a database of many large tables, building every index at open
+        (before) and only the indexes used, on first use (after), and prints
+        the time to open it and to answer a first query.
+        :param tables: number of tables
+        :param rows: number of entries per table
+    """
+    db = fresh_db()
+    for i in range(tables):
+        fill_integer_table(db, f"t{i}", rows)
+    print(f"open a database of {tables} tables of {rows} rows, then get_entry on one table")
+    for label, warm_up in (('before (eager)', True), ('after (lazy)', False)):
+        start = time.perf_counter()
+        db = Database(BENCH_DB, warm_up=warm_up)
+        opened = time.perf_counter() - start
+        db.get_entry('t0', 'F1', 42)
+        queried = time.perf_counter() - start
+        print(f"  {label:<16} open {opened:.2f}s, first query after {queried:.2f}s")
+        db.close()
+    shutil.rmtree(BENCH_DB)
+
+
+def bench_index_files(rows: int = 1_000_000) -> None:
+    """
+        Restarts on a large table and answers a first lookup, by building the
+        index of the table (before) or from the index file of the field saved
+        on close (after).
+        :param rows: number of entries of the table
+    """
+    db = fresh_db()
+    fill_integer_table(db, 't', rows)
+    db = Database(BENCH_DB)
+    db.persist_indexes = True
+    db.get_entries('t', 'F1', 42)
+    db.close()
+    print(f"restart on a table of {rows} rows, then get_entries on a field")
+    for label, index_files in (('before (scan)', False), ('after (index file)', True)):
+        if not index_files:
+            # hidden from the first restart
+            os.rename(f"{BENCH_DB}/t.F1.idx", f"{BENCH_DB}/t.F1.idx.saved")
+        start = time.perf_counter()
+        db = Database(BENCH_DB)
+        found = db.get_entries('t', 'F1', 42)
+        elapsed = time.perf_counter() - start
+        print(f"  {label:<20} {elapsed:.3f}s, {len(found)} entries")
+        db.close()
+        if not index_files:
+            os.rename(f"{BENCH_DB}/t.F1.idx.saved", f"{BENCH_DB}/t.F1.idx")
+    shutil.rmtree(BENCH_DB)
+
+
+def bench_range(rows: int = 200_000, repeat: int = 20) -> None:
+    """
+        Answers F1 BETWEEN 100 AND 110 by filtering the whole table (before,
+        the only way with the equality index) and from the ordered index of the
+        field (after), and prints the time per query.
+        :param rows: number of entries of the table
+        :param repeat: number of queries
+    """
+    db = fresh_db()
+    fill_integer_table(db, 't', rows)
+    db = Database(BENCH_DB)
+    db.build_indexes('t')
+    print(f"F1 BETWEEN 100 AND 110 on a table of {rows} rows")
+    start = time.perf_counter()
+    for _ in range(repeat):
+        found = [entry for entry in db.get_complete_table('t') if 100 <= entry['F1'] <= 110]
+    before = (time.perf_counter() - start) / repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        ordered = db.get_entries_range('t', 'F1', 100, 110)
+    after = (time.perf_counter() - start) / repeat
+    assert sorted(e['id'] for e in found) == sorted(e['id'] for e in ordered)
+    print(f"  before (filter)        {before * 1000:.1f} ms/query, {len(found)} entries")
+    print(f"  after (ordered index)  {after * 1000:.1f} ms/query, {len(ordered)} entries")
+    db.close()
+    shutil.rmtree(BENCH_DB)
+
+
+def traced_bytes(build):
+    """
+        Runs build and measures the memory it allocated and still holds.
+        :param build: function building an object
+        :return: the object built, number of bytes it holds
+    """
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def bench_index_memory(rows: int = 1_000_000) -> None:
+    """
+        Measures the memory of the indexes of tables of rows entries, in bytes
+        per row: the index of the entries, and the index of a field whose IDs
+        are kept in lists (before), in arrays (after) and in bitmaps for the
+        dense values (after, dense_bitmaps), for a field of 1000 distinct values
+        and one of 8.
+        :param rows: number of entries of the tables
+    """
+    db = fresh_db()
+    for distinct in (1000, 8):
+        fill_integer_table(db, f"t{distinct}", rows, nfields=1, distinct=distinct)
+    db = Database(BENCH_DB)
+    table_size = os.path.getsize(f"{BENCH_DB}/t8.table")
+    print(f"memory of the indexes of a table of {rows} rows ({table_size / rows:.1f} bytes per row on disk)")
+    for distinct in (1000, 8):
+        table_name = f"t{distinct}"
+        with db._open_table(table_name) as binary_file:
+            _, entries = traced_bytes(lambda: db._build_table_index(binary_file, table_name))
+        if distinct == 1000:
+            print(f"  {'entries (dicts)':<32} {entries / rows:6.1f} bytes/row")
+        table_index = db.indexes[table_name]
+        pairs = lambda: ((entry['F0'], entry_id) for entry_id, entry in table_index.items() if isinstance(entry_id, int))
+        def lists():
+            postings = {}
+            for value, entry_id in pairs():
+                postings.setdefault(value, []).append(entry_id)
+            return postings
+        for label, build in ((f"before (lists), {distinct} values", lists),
+                             (f"after (arrays), {distinct} values", lambda: FieldIndex(pairs())),
+                             (f"after (bitmaps), {distinct} values", lambda: FieldIndex(pairs(), bitmaps=True))):
+            index, size = traced_bytes(build)
+            print(f"  {label:<32} {size / rows:6.1f} bytes/row")
+            del index
+    db.close()
+    shutil.rmtree(BENCH_DB)
+
+
+def bench_find(rows: int = 500_000, repeat: int = 20) -> None:
+    """
+        Answers A = 3 AND B = 4 on a table where each condition holds for a
+        tenth of the entries and both for a hundred-and-tenth, by looking A up
+        and filtering its entries on B (before) and with find, intersecting the
+        bitmaps of both values (after), and prints the time per query.
+        :param rows: number of entries of the table
+        :param repeat: number of queries
+    """
+    db = fresh_db()
+    db.create_table('t', ('A', FieldType.INTEGER), ('B', FieldType.INTEGER))
+    db.add_entries('t', ({'A': i % 10, 'B': i % 11} for i in range(rows)))
+    db.build_indexes('t')
+    print(f"A = 3 AND B = 4 on a table of {rows} rows")
+    start = time.perf_counter()
+    for _ in range(repeat):
+        filtered = [entry for entry in db.get_entries('t', 'A', 3) if entry['B'] == 4]
+    before = (time.perf_counter() - start) / repeat
+    start = time.perf_counter()
+    found = db.find('t', {'A': 3, 'B': 4})
+    first = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(repeat):
+        found = db.find('t', {'A': 3, 'B': 4})
+    after = (time.perf_counter() - start) / repeat
+    assert found == filtered
+    print(f"  before (lookup + filter)  {before * 1000:.1f} ms/query, {len(filtered)} entries")
+    print(f"  after (bitmaps)           {after * 1000:.1f} ms/query ({first * 1000:.1f} ms for the first, making the bitmaps)")
+    start = time.perf_counter()
+    for _ in range(repeat):
+        either = db.find('t', [{'A': 3, 'B': 4}, {'A': 5, 'B': [1, 2]}])
+    print(f"  (A = 3 AND B = 4) OR (A = 5 AND B IN (1, 2)): {(time.perf_counter() - start) / repeat * 1000:.1f} ms/query, {len(either)} entries")
+    db.close()
+    shutil.rmtree(BENCH_DB)
+
+
+BENCHMARKS = {
+    'scan_syscalls': bench_scan_syscalls,
+    'write_syscalls': bench_write_syscalls,
+    'wide_table': bench_wide_table,
+    'page_cache': bench_page_cache,
+    'io_breakdown': bench_io_breakdown,
+    'point_lookups': bench_point_lookups,
+    'unique_strings': bench_unique_strings,
+    'rewrite': bench_rewrite,
+    'bulk_insert': bench_bulk_insert,
+    'compaction': bench_compaction,
+    'string_churn': bench_string_churn,
+    'reused_scan': bench_reused_scan,
+    'wal': bench_wal,
+    'transaction': bench_transaction,
+    'preallocation': bench_preallocation,
+    'startup': bench_startup,
+    'index_files': bench_index_files,
+    'range': bench_range,
+    'index_memory': bench_index_memory,
+    'find': bench_find,
+}
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:2] or list(BENCHMARKS)
+    args = [int(arg) for arg in sys.argv[2:]]
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"Unknown benchmark {name}, choose from {', '.join(BENCHMARKS)}")
+            sys.exit(1)
+        BENCHMARKS[name](*args)
@@ -1,15 +1,594 @@
 # Author: Waberi Daher
 # Matricule: 000353308
 import io
-from typing import BinaryIO
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import BinaryIO, Iterable
+
+# array/struct type codes of the supported integer sizes
+INTEGER_TYPECODES = {1: 'b', 2: 'h', 4: 'i'}
+# precompiled little-endian codecs for single integers
+INTEGER_STRUCTS = {size: struct.Struct('<' + code) for size, code in INTEGER_TYPECODES.items()}
+# size of the blocks moved at once by bulk copies
+COPY_CHUNK = 1 << 20
+
+@lru_cache(maxsize=256)
+def integer_run_struct(size: int, count: int) -> struct.Struct:
+    """
+    Returns the precompiled codec of a run of count little-endian integers of size bytes.
+    :param size: number of bytes of each integer (1, 2 or 4)
+    :param count: number of integers in the run
+    :return: struct.Struct encoding/decoding the whole run at once
+    """
+    return struct.Struct(f'<{count}{INTEGER_TYPECODES[size]}')
+
+class WriteBuffer:
+    """
+    Write-coalescing layer between a BinaryFile and the file it accesses.
+    Writes are kept in memory as sorted, disjoint extents: a write touching or
+    overlapping existing extents is merged with them, so successive small writes
+    end up as a few large blocks. Reads see the buffered writes (read-your-writes).
+    The extents are written to the file on flush() or close(), or once more than
+    max_buffered bytes are pending.
+    It behaves like the binary file object it wraps (read/write/seek/tell).
+    """
+    def __init__(self, file: BinaryIO, max_buffered: int = 1 << 22):
+        """
+        :param file: binary file object in read/write mode
+        :param max_buffered: number of pending bytes triggering a flush
+        """
+        self.file = file
+        self.max_buffered = max_buffered
+        # start positions of the extents (sorted) and start -> bytes of the extent
+        self.starts: list[int] = []
+        self.extents: dict[int, bytearray] = {}
+        self.buffered = 0
+        self.pos = file.tell()
+        # size of the file itself, and including the pending extents
+        file.seek(0, 2)
+        self.file_size = file.tell()
+        file.seek(self.pos, 0)
+        self.size = self.file_size
+
+    @property
+    def mode(self) -> str:
+        return self.file.mode
+
+    @property
+    def name(self) -> str:
+        return self.file.name
+
+    @property
+    def closed(self) -> bool:
+        return self.file.closed
+
+    def fileno(self) -> int:
+        return self.file.fileno()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def tell(self) -> int:
+        return self.pos
+
+    def seek(self, pos: int, whence: int = 0) -> int:
+        if whence == 1:
+            pos += self.pos
+        elif whence == 2:
+            pos += self.size
+        if pos < 0:
+            raise ValueError(f"Negative seek position {pos}")
+        self.pos = pos
+        return pos
+
+    def write(self, data: bytes) -> int:
+        """
+        Buffers data at the current position, merging it with the extents it
+        overlaps or touches.
+        :param data: bytes to write
+        :return: number of bytes written
+        """
+        n = len(data)
+        if n == 0:
+            return 0
+        start, end = self.pos, self.pos + n
+        starts = self.starts
+        # extent starting before the write and reaching it, otherwise a new one
+        i = bisect_right(starts, start) - 1
+        if i >= 0 and starts[i] + len(self.extents[starts[i]]) >= start:
+            base = starts[i]
+            buf = self.extents[base]
+        else:
+            i += 1
+            base = start
+            buf = bytearray()
+            starts.insert(i, base)
+            self.extents[base] = buf
+        before = len(buf)
+        offset = start - base
+        if offset + n <= len(buf):
+            # overwrite inside the extent
+            buf[offset:offset + n] = data
+        else:
+            # extend the extent
+            buf[offset:] = data
+        # absorb the following extents reached by the write
+        j = i + 1
+        while j < len(starts) and starts[j] <= end:
+            other = self.extents.pop(starts[j])
+            self.buffered -= len(other)
+            other_end = starts[j] + len(other)
+            if other_end > end:
+                buf += other[end - starts[j]:]
+            j += 1
+        del starts[i + 1:j]
+        self.buffered += len(buf) - before
+        self.pos = end
+        if base + len(buf) > self.size:
+            self.size = base + len(buf)
+        if self.buffered > self.max_buffered:
+            self.flush()
+        return n
+
+    def read(self, n: int = -1) -> bytes:
+        """
+        Reads at most n bytes at the current position, pending writes included.
+        :param n: number of bytes to read (-1 for everything)
+        :return: bytes read
+        """
+        start = self.pos
+        if n < 0 or start + n > self.size:
+            n = max(self.size - start, 0)
+        end = start + n
+        self.pos = end
+        if n == 0:
+            return b''
+        starts = self.starts
+        i = bisect_right(starts, start) - 1
+        # fast path: the whole range is inside one pending extent
+        if i >= 0:
+            buf = self.extents[starts[i]]
+            if starts[i] + len(buf) >= end:
+                return bytes(buf[start - starts[i]:end - starts[i]])
+        else:
+            i = 0
+        # read the file, then lay the pending extents over it
+        data = b''
+        if start < self.file_size:
+            self.file.seek(start, 0)
+            data = self.file.read(min(n, self.file_size - start))
+        if i >= len(starts) or starts[i] + len(self.extents[starts[i]]) <= start:
+            i += 1
+        if i >= len(starts) or starts[i] >= end:
+            if len(data) == n:
+                return data
+        result = bytearray(data)
+        # past the end of the file but before a pending extent: zeros
+        result.extend(bytes(n - len(result)))
+        while i < len(starts) and starts[i] < end:
+            buf = self.extents[starts[i]]
+            lo = max(start, starts[i])
+            hi = min(end, starts[i] + len(buf))
+            result[lo - start:hi - start] = buf[lo - starts[i]:hi - starts[i]]
+            i += 1
+        return bytes(result)
+
+    def flush(self) -> None:
+        """
+        Writes the pending extents to the file, one write per extent.
+        """
+        if not self.starts:
+            return
+        for start in self.starts:
+            self.file.seek(start, 0)
+            self.file.write(self.extents[start])
+        self.file.flush()
+        self.starts = []
+        self.extents = {}
+        self.buffered = 0
+        self.file_size = self.size
+
+    def discard(self) -> None:
+        """
+        Drops the pending extents, the file is left as it is.
+        """
+        self.starts = []
+        self.extents = {}
+        self.buffered = 0
+        self.size = self.file_size
+
+    def truncate(self, size: int) -> int:
+        """
+        Flushes the pending extents and truncates the file to size bytes.
+        :param size: new size of the file
+        :return: new size of the file
+        """
+        self.flush()
+        self.file.truncate(size)
+        self.file_size = self.size = size
+        return size
+
+    def close(self) -> None:
+        """
+        Flushes the pending extents and closes the file.
+        """
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+
+class PageCache:
+    """
+    Fixed-size page cache with LRU eviction, meant to be shared by all the
+    files of a database. Pages are keyed by (file path, page number) and stay
+    cached after their file is closed, so the pages read over and over (headers,
+    string buffer, records) are served from memory across operations.
+    Dirty pages are written back when their file is flushed or closed, or when
+    they are evicted.
+    """
+    def __init__(self, max_pages: int = 256, page_size: int = 4096):
+        """
+        :param max_pages: number of pages kept in memory (page budget)
+        :param page_size: size of a page in bytes
+        :raises ValueError: if max_pages or page_size not positive
+        """
+        if max_pages <= 0 or page_size <= 0:
+            raise ValueError(f"Page budget and page size must be positive, got {max_pages} and {page_size}")
+        self.max_pages = max_pages
+        self.page_size = page_size
+        # (path, page number) -> page, least recently used first
+        self.pages: OrderedDict[tuple[str, int], bytearray] = OrderedDict()
+        self.dirty: set[tuple[str, int]] = set()
+        # path -> file currently open on it, writing back its evicted dirty pages
+        self.files: dict[str, 'PagedFile'] = {}
+        # path -> stat stamp of the file when it was last closed, to detect
+        # changes made outside the cache
+        self.stamps: dict[str, tuple[int, int, int]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writebacks = 0
+
+    def get(self, path: str, page_no: int) -> bytearray | None:
+        """
+        Returns a cached page and marks it as most recently used.
+        :return: the page, None if not cached
+        """
+        page = self.pages.get((path, page_no))
+        if page is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.pages.move_to_end((path, page_no))
+        return page
+
+    def put(self, path: str, page_no: int, page: bytearray) -> None:
+        """
+        Caches a page, evicting the least recently used pages over the budget.
+        """
+        self.pages[(path, page_no)] = page
+        self.pages.move_to_end((path, page_no))
+        while len(self.pages) > self.max_pages:
+            key, old_page = self.pages.popitem(last=False)
+            self.evictions += 1
+            if key in self.dirty:
+                self.dirty.discard(key)
+                owner = self.files.get(key[0])
+                if owner is not None:
+                    owner._write_pages(key[1], [old_page])
+
+    def invalidate(self, path: str) -> None:
+        """
+        Drops every page of a file, dirty ones included (e.g. the file was
+        deleted or replaced).
+        :param path: path of the file
+        """
+        path = os.path.abspath(path)
+        for key in [key for key in self.pages if key[0] == path]:
+            del self.pages[key]
+            self.dirty.discard(key)
+        self.stamps.pop(path, None)
+
+    def stats(self) -> dict[str, int]:
+        """
+        Returns the counters of the cache.
+        :return: dict of hits, misses, evictions, writebacks and cached pages
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'writebacks': self.writebacks, 'pages': len(self.pages)}
+
+    def reset_stats(self) -> None:
+        """
+        Resets the hit, miss, eviction and write-back counters.
+        """
+        self.hits = self.misses = self.evictions = self.writebacks = 0
+
+
+class PagedFile:
+    """
+    File accessed through a shared PageCache: reads and writes are served by
+    the cached pages of the file, loaded on demand, and the dirty pages are
+    written back on flush() or close().
+    It behaves like the binary file object it wraps (read/write/seek/tell).
+    """
+    def __init__(self, file: BinaryIO, cache: PageCache):
+        """
+        :param file: binary file object in read/write mode, freshly opened from a path
+        :param cache: page cache shared with the other files
+        """
+        self.file = file
+        self.cache = cache
+        self.page_size = cache.page_size
+        self.path = os.path.abspath(file.name)
+        # the cached pages are stale if the file was truncated or changed elsewhere
+        stamp = self._stamp()
+        if 'w' in file.mode or cache.stamps.get(self.path) != stamp:
+            cache.invalidate(self.path)
+        self.pos = 0
+        # size of the file itself, and including the dirty pages
+        self.file_size = stamp[2]
+        self.size = self.file_size
+        # pages written back to the file object but not flushed yet
+        self.unflushed = False
+        cache.files[self.path] = self
+
+    def _stamp(self) -> tuple[int, int, int]:
+        stat = os.fstat(self.file.fileno())
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    @property
+    def mode(self) -> str:
+        return self.file.mode
+
+    @property
+    def name(self) -> str:
+        return self.file.name
+
+    @property
+    def closed(self) -> bool:
+        return self.file.closed
+
+    def fileno(self) -> int:
+        return self.file.fileno()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def tell(self) -> int:
+        return self.pos
+
+    def seek(self, pos: int, whence: int = 0) -> int:
+        if whence == 1:
+            pos += self.pos
+        elif whence == 2:
+            pos += self.size
+        if pos < 0:
+            raise ValueError(f"Negative seek position {pos}")
+        self.pos = pos
+        return pos
+
+    def _page(self, page_no: int, load: bool = True) -> bytearray:
+        """
+        Returns a page of the file, from the cache or loaded from the file.
+        :param page_no: number of the page
+        :param load: False if the page is about to be overwritten entirely
+        :return: the page (page_size bytes, zeros past the end of the file)
+        """
+        page = self.cache.get(self.path, page_no)
+        if page is None:
+            start = page_no * self.page_size
+            page = bytearray(self.page_size)
+            if load and start < self.file_size:
+                self.file.seek(start, 0)
+                data = self.file.read(min(self.page_size, self.file_size - start))
+                page[:len(data)] = data
+            self.cache.put(self.path, page_no, page)
+        return page
+
+    def read(self, n: int = -1) -> bytes:
+        """
+        Reads at most n bytes at the current position through the cached pages.
+        :param n: number of bytes to read (-1 for everything)
+        :return: bytes read
+        """
+        start = self.pos
+        if n < 0 or start + n > self.size:
+            n = max(self.size - start, 0)
+        end = start + n
+        self.pos = end
+        if n == 0:
+            return b''
+        page_size = self.page_size
+        first, last = start // page_size, (end - 1) // page_size
+        # fast path: the whole range is inside one page
+        if first == last:
+            offset = first * page_size
+            return bytes(self._page(first)[start - offset:end - offset])
+        result = bytearray()
+        for page_no in range(first, last + 1):
+            offset = page_no * page_size
+            result += self._page(page_no)[max(start, offset) - offset:min(end, offset + page_size) - offset]
+        return bytes(result)
+
+    def write(self, data: bytes) -> int:
+        """
+        Writes data at the current position into the cached pages, marked dirty.
+        :param data: bytes to write
+        :return: number of bytes written
+        """
+        n = len(data)
+        if n == 0:
+            return 0
+        start, end = self.pos, self.pos + n
+        page_size = self.page_size
+        data = memoryview(data)
+        # size first: the pages evicted during the write are written back up to it
+        if end > self.size:
+            self.size = end
+        for page_no in range(start // page_size, (end - 1) // page_size + 1):
+            offset = page_no * page_size
+            lo, hi = max(start, offset), min(end, offset + page_size)
+            # a page overwritten entirely is not read from the file
+            page = self._page(page_no, load=hi - lo < page_size)
+            page[lo - offset:hi - offset] = data[lo - start:hi - start]
+            self.cache.dirty.add((self.path, page_no))
+        self.pos = end
+        return n
+
+    def _write_pages(self, page_no: int, pages: list[bytearray]) -> None:
+        """
+        Writes consecutive pages starting at page_no to the file, in one write,
+        without their part past the end of the file.
+        """
+        start = page_no * self.page_size
+        if start >= self.size:
+            return
+        data = b''.join(pages)[:self.size - start]
+        self.file.seek(start, 0)
+        self.file.write(data)
+        self.unflushed = True
+        self.cache.writebacks += len(pages)
+        if start + len(data) > self.file_size:
+            self.file_size = start + len(data)
+
+    def flush(self) -> None:
+        """
+        Writes back the dirty pages of the file, one write per run of consecutive pages.
+        """
+        dirty = sorted(page_no for path, page_no in self.cache.dirty if path == self.path)
+        if not dirty and not self.unflushed:
+            return
+        run_start, run = None, []
+        for page_no in dirty:
+            if run and page_no != run_start + len(run):
+                self._write_pages(run_start, run)
+                run = []
+            if not run:
+                run_start = page_no
+            run.append(self.cache.pages[(self.path, page_no)])
+            self.cache.dirty.discard((self.path, page_no))
+        if run:
+            self._write_pages(run_start, run)
+        self.file.flush()
+        self.unflushed = False
+
+    def truncate(self, size: int) -> int:
+        """
+        Writes back the dirty pages, drops the cached pages of the file and
+        truncates it to size bytes.
+        :param size: new size of the file
+        :return: new size of the file
+        """
+        self.flush()
+        self.cache.invalidate(self.path)
+        self.file.truncate(size)
+        self.file_size = self.size = size
+        return size
+
+    def close(self) -> None:
+        """
+        Writes back the dirty pages and closes the file; its clean pages stay cached.
+        """
+        if not self.file.closed:
+            self.flush()
+            self.cache.stamps[self.path] = self._stamp()
+            self.file.close()
+            if self.cache.files.get(self.path) is self:
+                del self.cache.files[self.path]
+
+
+class IOStats:
+    """
+    Opt-in I/O counters of BinaryFile objects: seeks, reads, writes, bytes moved
+    and get_size calls. Every BinaryFile whose io_stats is set counts its calls
+    into the counters of the current operation, so one IOStats shared by several
+    files rolls their I/O up per operation (see operation()).
+    The calls are counted at the BinaryFile level, beneath it the page cache or
+    the write buffer may turn them into fewer system calls.
+    """
+    COUNTERS = ('calls', 'seeks', 'reads', 'writes', 'bytes_read', 'bytes_written', 'get_size')
+
+    def __init__(self):
+        # operation name -> counters
+        self.operations: dict[str, dict[str, int]] = {}
+        # names of the nested operations in progress
+        self.stack: list[str] = []
+        self.current = self._counters('other')
+
+    def _counters(self, name: str) -> dict[str, int]:
+        if name not in self.operations:
+            self.operations[name] = dict.fromkeys(self.COUNTERS, 0)
+        return self.operations[name]
+
+    @contextmanager
+    def operation(self, name: str):
+        """
+        Attributes the I/O counted in the block to an operation. A nested operation
+        is named after its parents ("add_entry/_expand_string_buffer") and its I/O
+        is not counted in theirs.
+        :param name: name of the operation
+        """
+        label = f"{self.stack[-1]}/{name}" if self.stack else name
+        previous = self.current
+        self.stack.append(label)
+        self.current = self._counters(label)
+        self.current['calls'] += 1
+        try:
+            yield self
+        finally:
+            self.stack.pop()
+            self.current = previous
+
+    def count_seek(self) -> None:
+        self.current['seeks'] += 1
+
+    def count_read(self, nbytes: int) -> None:
+        self.current['reads'] += 1
+        self.current['bytes_read'] += nbytes
+
+    def count_write(self, nbytes: int) -> None:
+        self.current['writes'] += 1
+        self.current['bytes_written'] += nbytes
+
+    def count_get_size(self) -> None:
+        self.current['get_size'] += 1
+
+    def snapshot(self) -> dict[str, dict[str, int]]:
+        """
+        Returns a copy of the counters of the operations that did any I/O.
+        :return: dict of operation name -> counters
+        """
+        return {name: dict(counters) for name, counters in self.operations.items() if any(counters.values())}
+
+    def reset(self) -> None:
+        """
+        Sets every counter back to zero.
+        """
+        for counters in self.operations.values():
+            for counter in counters:
+                counters[counter] = 0
+
 
 class BinaryFile:
     def __init__(self, file: BinaryIO):
         """
-            Initializes the BinaryFile class with a binary file opened in read/write mode.
-            :param file: binary file object in read/write mode
+            Initializes the BinaryFile class with a binary file opened in read/write
+            (or read-only) mode.
+            :param file: binary file object in read/write or read mode
             :raises TypeError: if file not valid binary file object
-            :raises ValueError: if file is not opened with mode supporting read and write
+            :raises ValueError: if file is not opened with mode supporting read
         """
         # Check if object has the required binary file methods
         required_methods = ['read', 'write', 'seek', 'tell']
@@ -19,23 +598,39 @@ class BinaryFile:
         mode = getattr(file, 'mode', '')
         if 'b' not in mode:
             raise ValueError("File must be opened in binary mode ('b').")
-        if '+' not in mode and not ('r' in mode and 'w' in mode):
-            raise ValueError("Opening mode should support both write and read (e.g., 'rb+', 'wb+').")
+        # read-only files are accepted (e.g. to inspect a table), write-only ones cannot be parsed
+        if '+' not in mode and 'r' not in mode:
+            raise ValueError("Opening mode should support read (e.g., 'rb', 'rb+', 'wb+').")
         self.file = file
+        # logical size of the file, measured once and then kept up to date
+        # by every write that extends the file (no seek to the end per call)
+        self.size = self._measure_size()
+        # bytes allocated to the file, past its logical size when it is preallocated
+        self.capacity = self.size
+        # growth of the allocation once a write goes past it, see preallocate
+        self.grow_by = 0
+        self.grow_ratio = 0.0
+        # bounds checks on reads and seeks, disabled by trusted callers via unchecked()
+        self.check_bounds = True
+        # I/O counters, None when not instrumented
+        self.io_stats: IOStats | None = None
+        # journal recording the writes and truncations (see wal.TableJournal),
+        # committed before they reach the file; None when not journaled
+        self.journal = None
 
     def __tell__(self) -> int:
         """
         Gets the current position in the file.
         :return: Current position in the file.
         """
-        return self.file.tell()
+        return self._tell()
 
     def _get_current_pos(self) -> int:
         """
         Gets the current position in the file.
         :return: Current position in the file.
         """
-        return self.file.tell()
+        return self._tell()
     
     def _get_file_name(self) -> str:
         """
@@ -44,9 +639,9 @@ class BinaryFile:
         """
         return self.file.name
 
-    def get_size(self) -> int:
+    def _measure_size(self) -> int:
         """
-        Gets the size of the file in bytes.
+        Measures the size of the underlying file by seeking to its end.
         :return: Size (integer) of file in bytes.
         :raises IOError: if seeking fails
         """
@@ -68,6 +663,201 @@ class BinaryFile:
                 print(f"Error restoring position: {e}")
         return size
 
+    def get_size(self) -> int:
+        """
+        Gets the size of the file in bytes.
+        The size is tracked in memory, so this does not touch the file.
+        :return: Size (integer) of file in bytes.
+        """
+        if self.io_stats is not None:
+            self.io_stats.count_get_size()
+        return self.size
+
+    def refresh_size(self) -> int:
+        """
+        Re-measures the size of the file, for when it was modified
+        through another handle than this BinaryFile.
+        :return: Size (integer) of file in bytes.
+        :raises IOError: if seeking fails
+        """
+        self.size = self._measure_size()
+        self.capacity = self.size
+        return self.size
+
+    def preallocate(self, extent: int = 1 << 20, ratio: float = 0.0) -> None:
+        """
+        Grows the file by extents once a write goes past its allocation, instead
+        of by each write: the extent is allocated at once (os.posix_fallocate,
+        os.ftruncate where it is not available) and the next writes fill it.
+        The allocated space past the logical size is released on close().
+        :param extent: minimum growth in bytes (0 and ratio 0.0 to grow by each write)
+        :param ratio: minimum growth as a fraction of the allocated size (e.g. 0.25)
+        """
+        self.grow_by = extent
+        self.grow_ratio = ratio
+
+    def _next_capacity(self, end: int) -> int:
+        """
+        :param end: end of a write past the allocation
+        :return: new allocated size of the file
+        """
+        return max(end, self.capacity + max(self.grow_by, int(self.capacity * self.grow_ratio)))
+
+    def _reserve(self, capacity: int) -> None:
+        """
+        Allocates the file up to capacity bytes, zero-filled, without writing them.
+        :param capacity: new allocated size of the file in bytes
+        """
+        try:
+            fd = self.file.fileno()
+        except (AttributeError, OSError):
+            # not backed by a file descriptor: grows by each write
+            return
+        allocated = max(self.capacity, self.size)
+        try:
+            os.posix_fallocate(fd, allocated, capacity - allocated)
+        except (AttributeError, OSError):
+            # sparse
+            os.ftruncate(fd, capacity)
+        self.capacity = capacity
+
+    def _release_capacity(self) -> None:
+        """
+        Gives the space allocated past the logical size back, once the pending
+        writes reached the file.
+        """
+        if self.capacity > self.size:
+            os.ftruncate(self.file.fileno(), self.size)
+            self.capacity = self.size
+
+    @contextmanager
+    def unchecked(self):
+        """
+        Context manager disabling the per-call bounds checks of goto and
+        read_integer. Meant for trusted callers (e.g. the engine walking its
+        own records) that already know their positions are valid.
+        Short reads are still detected and raise EOFError.
+        """
+        previous = self.check_bounds
+        self.check_bounds = False
+        try:
+            yield self
+        finally:
+            self.check_bounds = previous
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def flush(self) -> None:
+        """
+        Flushes pending writes to the underlying file, after committing them
+        to the journal if any.
+        """
+        if self.journal is not None:
+            self.journal.commit()
+        self.file.flush()
+
+    def _journal_truncate(self, size: int) -> None:
+        """
+        Records a truncation in the journal, if any, and commits it.
+        :param size: new size of the file in bytes
+        """
+        if self.journal is not None:
+            self.journal.truncate(size)
+            self.journal.commit()
+
+    def truncate(self, size: int) -> None:
+        """
+        Truncates the file to size bytes (pending writes are flushed first).
+        The cursor is left past the end if it was beyond size.
+        :param size: new size of the file in bytes
+        :raises ValueError: if size is negative or larger than the file
+        """
+        if size < 0 or size > self.size:
+            raise ValueError(f"Cannot truncate a file of {self.size} bytes to {size} bytes")
+        self._journal_truncate(size)
+        self.flush()
+        self.file.truncate(size)
+        self.size = self.capacity = size
+
+    def extend(self, size: int) -> None:
+        """
+        Grows the file to size bytes, the new ones being zeros left to the file
+        system instead of written (pending writes are flushed first).
+        :param size: new size of the file in bytes, nothing is done if it is not larger
+        """
+        if size <= self.size:
+            return
+        self._journal_truncate(size)
+        self.flush()
+        self.file.truncate(size)
+        self.size = self.capacity = size
+
+    def close(self) -> None:
+        """
+        Flushes pending writes, releases the resources of this BinaryFile
+        (and the space preallocated past its end) and closes the underlying file.
+        """
+        if not self.file.closed:
+            self.flush()
+            self._release_capacity()
+            self.file.close()
+
+    # Raw I/O primitives, every read, write and seek goes through them
+    def _tell(self) -> int:
+        """
+        Gets the current position in the file.
+        :return: Current position in the file.
+        """
+        return self.file.tell()
+
+    def _seek(self, pos: int) -> None:
+        """
+        Moves the file cursor to pos, without any check.
+        :param pos: Position (in bytes) from the beginning of the file
+        """
+        if self.io_stats is not None:
+            self.io_stats.count_seek()
+        self.file.seek(pos, 0)
+
+    def _read(self, n: int) -> bytes:
+        """
+        Reads at most n raw bytes at the current position.
+        :param n: number of bytes to read
+        :return: bytes read (fewer than n at the end of the file)
+        """
+        if self.capacity > self.size:
+            # the preallocated space is not part of the file
+            n = max(0, min(n, self.size - self.file.tell()))
+        data = self.file.read(n)
+        if self.io_stats is not None:
+            self.io_stats.count_read(len(data))
+        return data
+
+    def _write(self, data: bytes) -> int:
+        """
+        Writes raw bytes at the current position and updates the tracked size.
+        :param data: bytes to write
+        :return: number of bytes written
+        """
+        if self.journal is not None:
+            self.journal.write(self.file.tell(), data)
+        bytes_written = self.file.write(data)
+        if self.io_stats is not None:
+            self.io_stats.count_write(bytes_written)
+        end = self.file.tell()
+        if end > self.size:
+            self.size = end
+            if end > self.capacity:
+                self.capacity = end
+                # the next writes go to the next extent
+                if self.grow_by or self.grow_ratio:
+                    self._reserve(self._next_capacity(end))
+        return bytes_written
+
     def goto(self, pos: int) -> None:
         """
         Moves file cursor to specified position
@@ -76,17 +866,16 @@ class BinaryFile:
                     if pos > 0 start from beginning of file
         :raises ValueError: if pos out of bounds
         """
-        size = self.get_size()
         if not isinstance(pos, int):
             raise TypeError("Pos must be integer")
         # for negative positions, convert to offset from end
         if pos < 0:
-            pos = size + pos
+            pos = self.size + pos
         # check bounds
-        if pos > size or pos < 0:
+        if self.check_bounds and (pos > self.size or pos < 0):
             raise ValueError(f"Position {pos} out of bounds.")
         # safely seek to pos
-        self.file.seek(pos, 0)
+        self._seek(pos)
 
     def write_integer(self, n: int, size: int) -> int:
         """
@@ -110,9 +899,9 @@ class BinaryFile:
             raise ValueError(f"Integer {n} cannot be represented in {size} bytes.")
         try:
             # convert integer to bytes in little-endian format
-            encoded_bytes = n.to_bytes(size, byteorder='little', signed=True)
+            encoded_bytes = INTEGER_STRUCTS[size].pack(n)
             # write the bytes to the file
-            bytes_written = self.file.write(encoded_bytes)
+            bytes_written = self._write(encoded_bytes)
             if bytes_written != len(encoded_bytes):
                 raise IOError(f"Failed to write all bytes: expected {len(encoded_bytes)}, wrote {bytes_written}")
         except Exception as e:
@@ -129,7 +918,7 @@ class BinaryFile:
         :raises ValueError: if size not valid, position invalid, or n cannot be represented in size bytes
         """
         # save current position
-        curr_pos = self.file.tell()
+        curr_pos = self._tell()
         bytes_written = 0
         try:
             self.goto(pos)  # Let ValueError from invalid position propagate
@@ -156,16 +945,14 @@ class BinaryFile:
         if size not in (1,2,4):
             raise ValueError("Size must be 1,2 or 4 bytes")
         # check if there enough bytes to read size bytes
-        curr_pos = self.file.tell()
-        file_size = self.get_size()
-        if curr_pos+size > file_size:
+        if self.check_bounds and self._tell() + size > self.size:
             raise ValueError(f"Could not read {size} bytes, out of bounds.")
         # read bytes and convert
-        read_bytes = self.file.read(size)
+        read_bytes = self._read(size)
         # extra cautiousness check for out of bounds error
         if len(read_bytes) != size:
-            raise EOFError(f"Unexpected end of file while reading {size} bytes at pos {curr_pos}.")
-        return int.from_bytes(read_bytes, byteorder='little', signed=True)
+            raise EOFError(f"Unexpected end of file while reading {size} bytes at pos {self._tell() - len(read_bytes)}.")
+        return INTEGER_STRUCTS[size].unpack(read_bytes)[0]
 
     def read_integer_from(self, size: int, pos: int) -> int:
         """
@@ -178,7 +965,7 @@ class BinaryFile:
         :raises IOError: if seeking to pos fails
         """
         # save current position
-        curr_pos = self.file.tell()
+        curr_pos = self._tell()
         read_integer = 0
         try:
             self.goto(pos)  # Let ValueError from invalid position propagate
@@ -192,6 +979,197 @@ class BinaryFile:
             raise  # Re-raise the original error
         return read_integer
 
+    def write_bytes(self, data: bytes) -> int:
+        """
+        Writes raw bytes (e.g. a block of zeros) at the current position.
+        :param data: bytes to write
+        :return: number of bytes written
+        :raises IOError: if writing fails
+        """
+        try:
+            bytes_written = self._write(data)
+            if bytes_written != len(data):
+                raise IOError(f"Failed to write all bytes: expected {len(data)}, wrote {bytes_written}")
+        except Exception as e:
+            raise IOError(f"Failed to write bytes: {str(e)}")
+        return bytes_written
+
+    def copy_from(self, source: 'BinaryFile', pos: int, n: int) -> int:
+        """
+        Copies n bytes of source, starting at pos, to the current position.
+        The copy is done by the kernel when possible (see _copy_kernel), otherwise
+        by blocks of COPY_CHUNK bytes. The position of source is left undefined.
+        :param source: binary file to copy from
+        :param pos: position of the first byte to copy in source
+        :param n: number of bytes to copy
+        :return: number of bytes copied
+        :raises EOFError: if source has less than n bytes from pos
+        """
+        if n <= 0:
+            return 0
+        # pending writes of the source must reach its file
+        source.flush()
+        dst_pos = self._tell()
+        copied = self._copy_kernel(source, pos, dst_pos, n)
+        # buffered fallback for what the kernel did not copy
+        while copied < n:
+            source._seek(pos + copied)
+            data = source._read(min(COPY_CHUNK, n - copied))
+            if len(data) == 0:
+                raise EOFError(f"Unexpected end of file while copying {n} bytes from pos {pos}.")
+            self._seek(dst_pos + copied)
+            self._write(data)
+            copied += len(data)
+        self._seek(dst_pos + n)
+        return n
+
+    def _copy_kernel(self, source: 'BinaryFile', pos: int, dst_pos: int, n: int) -> int:
+        """
+        Copies up to n bytes from source to dst_pos without going through Python,
+        with os.copy_file_range (os.sendfile where it is not available).
+        Only done when this file is a plain unbuffered file (open(..., buffering=0)):
+        a buffered file or a cache above the descriptor would not see the copy.
+        :return: number of bytes copied (0 if not possible)
+        """
+        if not isinstance(self.file, io.FileIO):
+            return 0
+        copied = 0
+        try:
+            src_fd = source.file.fileno()
+            dst_fd = self.file.fileno()
+            while copied < n:
+                if hasattr(os, 'copy_file_range'):
+                    done = os.copy_file_range(src_fd, dst_fd, n - copied, pos + copied, dst_pos + copied)
+                else:
+                    os.lseek(dst_fd, dst_pos + copied, 0)
+                    done = os.sendfile(dst_fd, src_fd, pos + copied, n - copied)
+                if done == 0:
+                    break
+                copied += done
+        except (OSError, AttributeError):
+            # no descriptor or copy not supported between these files: the rest is copied by blocks
+            pass
+        if copied > 0:
+            if source.io_stats is not None:
+                source.io_stats.count_read(copied)
+            if self.io_stats is not None:
+                self.io_stats.count_write(copied)
+            if dst_pos + copied > self.size:
+                self.size = dst_pos + copied
+                self.capacity = max(self.capacity, self.size)
+        return copied
+
+    def read_bytes(self, n: int) -> bytes:
+        """
+        Reads n raw bytes at the current position.
+        :param n: number of bytes to read
+        :return: bytes read (a memoryview for memory-mapped files)
+        :raises ValueError: if n not valid or out of bounds
+        :raises EOFError: if not enough bytes left to read
+        """
+        if n < 0:
+            raise ValueError(f"Number of bytes must be positive, got {n}")
+        if self.check_bounds and self._tell() + n > self.size:
+            raise ValueError(f"Could not read {n} bytes, out of bounds.")
+        read_bytes = self._read(n)
+        if len(read_bytes) != n:
+            raise EOFError(f"Unexpected end of file while reading {n} bytes at pos {self._tell() - len(read_bytes)}.")
+        return read_bytes
+
+    def write_integers(self, values: Iterable[int], size: int) -> int:
+        """
+        Writes a run of integers of size bytes each at the current position,
+        encoded with a single precompiled struct and written in one call.
+
+        :param values: integers to write
+        :param size: number of bytes used to encode each integer
+        :return: number of bytes written
+        :raises ValueError: if size not valid
+        :raises ValueError: if an integer cannot be represented in size bytes
+        :raises IOError: if writing fails
+        """
+        if size not in (1,2,4):
+            raise ValueError("Size must be 1,2 or 4 bytes")
+        values = list(values)
+        try:
+            encoded_bytes = integer_run_struct(size, len(values)).pack(*values)
+        except struct.error as e:
+            raise ValueError(f"Integers cannot be represented in {size} bytes: {e}")
+        try:
+            bytes_written = self._write(encoded_bytes)
+            if bytes_written != len(encoded_bytes):
+                raise IOError(f"Failed to write all bytes: expected {len(encoded_bytes)}, wrote {bytes_written}")
+        except Exception as e:
+            raise IOError(f"Failed to write integers: {str(e)}")
+        return bytes_written
+
+    def write_integers_to(self, values: Iterable[int], size: int, pos: int) -> int:
+        """
+        Writes a run of integers at given position in file
+        :param values: integers to write
+        :param size: number of bytes used to encode each integer
+        :param pos: position at which to write the run
+        :return: number of bytes written
+        :raises ValueError: if size not valid, position invalid, or an integer cannot be represented in size bytes
+        """
+        curr_pos = self._tell()
+        try:
+            self.goto(pos)
+            bytes_written = self.write_integers(values, size)
+        except Exception:
+            # Only restore position on error
+            try:
+                self.goto(curr_pos)
+            except Exception as e:
+                print(f"Error restoring position: {e}")
+            raise
+        return bytes_written
+
+    def read_integers(self, size: int, count: int) -> array:
+        """
+        Reads a run of count integers of size bytes each at current position,
+        with a single read decoded by a precompiled struct.
+        :param size: number of bytes of each integer
+        :param count: number of integers to read
+        :return: decoded integers (array of typecode 'b', 'h' or 'i')
+        :raises ValueError: if size or count not valid
+        :raises EOFError: if not enough bytes left to read
+        """
+        if size not in (1,2,4):
+            raise ValueError("Size must be 1,2 or 4 bytes")
+        if count < 0:
+            raise ValueError(f"Count must be positive, got {count}")
+        nbytes = size * count
+        if self.check_bounds and self._tell() + nbytes > self.size:
+            raise ValueError(f"Could not read {count} integers of {size} bytes, out of bounds.")
+        read_bytes = self._read(nbytes)
+        if len(read_bytes) != nbytes:
+            raise EOFError(f"Unexpected end of file while reading {nbytes} bytes at pos {self._tell() - len(read_bytes)}.")
+        return array(INTEGER_TYPECODES[size], integer_run_struct(size, count).unpack(read_bytes))
+
+    def read_integers_from(self, size: int, count: int, pos: int) -> array:
+        """
+        Reads a run of count integers of size bytes each from a specific position
+        :param size: number of bytes of each integer
+        :param count: number of integers to read
+        :param pos: position in the file from which to read
+        :return: decoded integers
+        :raises ValueError: if size, count or position not valid
+        :raises EOFError: if there are not enough bytes to read
+        """
+        curr_pos = self._tell()
+        try:
+            self.goto(pos)
+            values = self.read_integers(size, count)
+        except Exception:
+            # Only restore position on error
+            try:
+                self.goto(curr_pos)
+            except Exception as e:
+                print(f"Error restoring position: {e}")
+            raise
+        return values
+
     def write_string(self, s: str) -> int:
         """
         Writes UTF-8 encoded string to current file position.
@@ -219,7 +1197,7 @@ class BinaryFile:
             raise IOError("Failed to write string length prefix")
         try:
             # Write UTF-8 encoded string
-            bytes_written += self.file.write(utf8_bytes)
+            bytes_written += self._write(utf8_bytes)
             if bytes_written != len(utf8_bytes) + 2: # 2 bytes for the length prefix
                 raise IOError(f"Failed to write all bytes: expected {len(utf8_bytes)}, wrote {bytes_written}")
         except Exception as e:
@@ -235,7 +1213,7 @@ class BinaryFile:
         :raises ValueError: if position is invalid
         """
         # save current position
-        curr_pos = self.file.tell()
+        curr_pos = self._tell()
         bytes_written = 0
         try:
             # goto pos
@@ -278,11 +1256,11 @@ class BinaryFile:
             raise ValueError(f"Invalid string length prefix: {prefix}. Must be between 0 and 32767.")
         # read the string bytes
         try:
-            string_bytes = self.file.read(prefix)
+            string_bytes = self._read(prefix)
             if len(string_bytes) != prefix:
                 raise EOFError(f"Expected {prefix} bytes but got {len(string_bytes)} bytes")
             # decode the UTF-8 bytes into a string
-            decoded_string = string_bytes.decode('utf-8')
+            decoded_string = str(string_bytes, 'utf-8')
         except UnicodeDecodeError as e:
             decoded_string = '' # check rules if return non or empty string in case of error
             raise UnicodeDecodeError("Unable to decode bytes as UTF-8", e.object, e.start, e.end, e.reason)
@@ -298,7 +1276,7 @@ class BinaryFile:
         :raises UnicodeDecodeError: if bytes cannot be decoded as UTF-8
         """
         # save current position
-        curr_pos = self.file.tell()
+        curr_pos = self._tell()
         return_string = ''
         try:
             self.goto(pos)  # Let ValueError from invalid position propagate
@@ -311,3 +1289,170 @@ class BinaryFile:
                 print(f"Error restoring position: {e}")
             raise  # Re-raise the original error
         return return_string
+
+
+class MmapBinaryFile(BinaryFile):
+    """
+    BinaryFile backed by a memory mapping of the file instead of read/write calls.
+    Integers and strings are decoded straight from the mapping (string reads slice
+    a memoryview, no copy of the raw bytes), and writes go into the mapping.
+    The mapping always covers the whole file (its preallocated part included) and
+    is resized when a write grows it.
+    The underlying file object is only used for its descriptor: its own cursor is
+    left untouched.
+    """
+    def __init__(self, file: BinaryIO):
+        """
+        Initializes the MmapBinaryFile class with a binary file opened in read/write mode.
+        :param file: binary file object in read/write mode, with a file descriptor
+        :raises TypeError: if file not valid binary file object
+        :raises ValueError: if file is not opened with mode supporting read
+        """
+        super().__init__(file)
+        self.pos = file.tell()
+        self.map = None
+        self.view = None
+        self._remap()
+
+    def _remap(self) -> None:
+        """
+        Maps the first self.capacity bytes of the file (nothing for an empty file).
+        """
+        self._unmap()
+        # data written through the file object must reach the file before mapping it
+        self.file.flush()
+        if self.capacity > 0:
+            self.map = mmap.mmap(self.file.fileno(), self.capacity)
+            self.view = memoryview(self.map)
+
+    def _unmap(self) -> None:
+        """
+        Releases the current mapping, if any.
+        """
+        if self.view is not None:
+            self.view.release()
+            self.view = None
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+    def _grow(self, size: int) -> None:
+        """
+        Grows the allocation of the file (zero-filled) and its mapping to hold
+        size bytes, by an extent if it is preallocated.
+        :param size: new size of the file in bytes
+        """
+        if self.grow_by or self.grow_ratio:
+            # allocated at once, not page by page as the mapping is written
+            self._reserve(self._next_capacity(size))
+        else:
+            self.capacity = size
+        if self.map is None:
+            os.ftruncate(self.file.fileno(), self.capacity)
+            self._remap()
+            return
+        # the mapping cannot be resized while a view on it exists
+        self.view.release()
+        self.map.resize(self.capacity)
+        self.view = memoryview(self.map)
+
+    def refresh_size(self) -> int:
+        """
+        Re-measures the size of the file and remaps it.
+        :return: Size (integer) of file in bytes.
+        """
+        super().refresh_size()
+        self._remap()
+        return self.size
+
+    def flush(self) -> None:
+        """
+        Flushes the mapping to the file, after committing the journal if any.
+        The writes land in the mapping as they are made: they are committed
+        before they are flushed, but the kernel may write them back earlier.
+        """
+        if self.journal is not None:
+            self.journal.commit()
+        if self.map is not None and self.size > 0:
+            # not the preallocated space past the data
+            self.map.flush(0, self.size)
+
+    def truncate(self, size: int) -> None:
+        """
+        Truncates the file and its mapping to size bytes.
+        :param size: new size of the file in bytes
+        :raises ValueError: if size is negative or larger than the file
+        """
+        if size < 0 or size > self.size:
+            raise ValueError(f"Cannot truncate a file of {self.size} bytes to {size} bytes")
+        self._journal_truncate(size)
+        if size == 0:
+            self._unmap()
+            os.ftruncate(self.file.fileno(), 0)
+            self.size = self.capacity = 0
+            return
+        # the mapping cannot be resized while a view on it exists
+        self.view.release()
+        self.map.resize(size)
+        self.view = memoryview(self.map)
+        self.size = self.capacity = size
+
+    def extend(self, size: int) -> None:
+        """
+        Grows the file and its mapping to size bytes of zeros.
+        :param size: new size of the file in bytes, nothing is done if it is not larger
+        """
+        if size <= self.size:
+            return
+        self._journal_truncate(size)
+        if size > self.capacity:
+            self._grow(size)
+        self.size = size
+
+    def close(self) -> None:
+        """
+        Flushes and releases the mapping, then closes the underlying file
+        without the space preallocated past its end.
+        """
+        if not self.file.closed:
+            self.flush()
+            self._unmap()
+            self._release_capacity()
+            self.file.close()
+
+    def _copy_kernel(self, source: BinaryFile, pos: int, dst_pos: int, n: int) -> int:
+        # the mapping would not follow a copy made beneath it
+        return 0
+
+    def _tell(self) -> int:
+        return self.pos
+
+    def _seek(self, pos: int) -> None:
+        if self.io_stats is not None:
+            self.io_stats.count_seek()
+        self.pos = pos
+
+    def _read(self, n: int) -> memoryview:
+        if self.view is None:
+            data = b''
+        else:
+            # zero-copy slice of the mapping, up to the end of the data
+            data = self.view[self.pos:min(self.pos + n, self.size)]
+        if self.io_stats is not None:
+            self.io_stats.count_read(len(data))
+        self.pos += len(data)
+        return data
+
+    def _write(self, data: bytes) -> int:
+        if self.io_stats is not None:
+            self.io_stats.count_write(len(data))
+        if self.journal is not None:
+            self.journal.write(self.pos, data)
+        end = self.pos + len(data)
+        if end > self.size:
+            if end > self.capacity:
+                self._grow(end)
+            self.size = end
+        self.view[self.pos:end] = data
+        self.pos = end
+        return len(data)
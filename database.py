@@ -1,16 +1,28 @@
 # Author: Waberi Daher
 # Matricule: 000353308
+from array import array
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from contextlib import contextmanager
 from enum import IntEnum
-from binary import BinaryFile
+from functools import wraps
+from itertools import chain, compress
+from typing import Iterable
+from binary import COPY_CHUNK, BinaryFile, IOStats, MmapBinaryFile, PageCache, PagedFile, WriteBuffer, integer_run_struct
+from index import FieldIndex, RoaringBitmap, bounds_slice
+from index_file import INDEX_SUFFIX, IndexFile, write_index_file
+from wal import WAL_FILE, TableJournal, WriteAheadLog, replay, sync_file
 import os
-import shutil
+import sys
+import threading
+import time
 # field type enum
 class FieldType(IntEnum):
     INTEGER = 1
     STRING = 2
 
-# expand factor
-EXPAND_FACTOR = 4
+# growth factor of the string buffer (its size stays a power of 2)
+EXPAND_FACTOR = 2
 
 # field value type alias
 Field = int | str
@@ -21,26 +33,315 @@ Entry = dict[str, Field]
 # type alias for table signature
 TableSignature = list[tuple[str, FieldType]]
 
+# maximum number of contiguous records read at once when walking a table
+RECORD_RUN = 256
+
+# proportion of live entries at or below which a table must be compacted
+COMPACTION_THRESHOLD = 0.5
+
+# record codec
+class RecordCodec:
+    """
+        Precompiled layout of the entry records of a table.
+        A record is a run of 4-byte integers: the ID, one slot per field
+        (value of an INTEGER field, pointer to the string of a STRING field)
+        and the previous and next pointers. The codec is built once per
+        signature so packing and unpacking are a single struct call.
+    """
+    def __init__(self, signature: TableSignature):
+        self.signature = list(signature)
+        self.names = tuple(name for name, _ in self.signature)
+        self.types = dict(self.signature)
+        # field name -> index of its slot in a record
+        self.slots = {name: i for i, name in enumerate(self.names, 1)}
+        # (name, slot) of the STRING fields
+        self.string_slots = tuple((name, self.slots[name]) for name, field_type in self.signature if field_type == FieldType.STRING)
+        # ID + field values + prev/next pointers
+        self.length = len(self.signature) + 3
+        self.size = 4 * self.length
+        # byte offsets of the pointers within a record
+        self.prev_offset = self.size - 8
+        self.next_offset = self.size - 4
+        self.struct = integer_run_struct(4, self.length)
+
+    def offset(self, field_name: str) -> int:
+        """
+            Returns the byte offset of a field slot within a record.
+            :param field_name: name of the field
+            :return: offset in bytes
+            :raises ValueError: if field does not exist
+        """
+        if field_name not in self.slots:
+            raise ValueError(f"Field {field_name} does not exist")
+        return 4 * self.slots[field_name]
+
+    def pack(self, entry_id: int, values: list[int], prev_pointer: int, next_pointer: int) -> bytes:
+        """
+            Encodes one record.
+            :param entry_id: ID of the entry
+            :param values: field slots in signature order
+            :param prev_pointer: position of the previous record, -1 if none
+            :param next_pointer: position of the next record, -1 if none
+            :return: encoded record
+        """
+        return self.struct.pack(entry_id, *values, prev_pointer, next_pointer)
+
+    def unpack(self, data: bytes) -> tuple[int, ...]:
+        """
+            Decodes one record into (ID, *field slots, prev, next).
+        """
+        return self.struct.unpack(data)
+
+    def pack_run(self, records: list[tuple[int, ...]]) -> bytes:
+        """
+            Encodes contiguous records with a single struct call.
+            :param records: records as returned by unpack
+            :return: encoded records
+        """
+        return integer_run_struct(4, self.length * len(records)).pack(*chain.from_iterable(records))
+
+    def unpack_run(self, data: bytes) -> list[tuple[int, ...]]:
+        """
+            Decodes contiguous records.
+            :param data: encoded records, a multiple of size bytes
+            :return: list of records
+        """
+        return list(self.struct.iter_unpack(data))
+
+    def encode(self, entry: Entry, string_positions: dict[str, int]) -> list[int]:
+        """
+            Returns the field slots of an entry in signature order.
+            :param entry: entry to encode
+            :param string_positions: field name -> position of its string in the string buffer
+            :return: list of slots
+            :raises ValueError: if a field value does not match the field type
+        """
+        values = []
+        for name, field_type in self.signature:
+            if field_type == FieldType.STRING:
+                if name not in string_positions:
+                    raise ValueError(f"Field {name} must be a string, got {type(entry[name])}")
+                values.append(string_positions[name])
+            else:
+                if not isinstance(entry[name], int):
+                    raise ValueError(f"Field {name} must be an integer, got {type(entry[name])}")
+                values.append(entry[name])
+        return values
+
+    def field(self, record: tuple[int, ...], field_name: str, strings: dict[int, str]) -> Field:
+        """
+            Typed access to one field of a record.
+            :param record: decoded record
+            :param field_name: name of the field
+            :param strings: position -> string of the table's string buffer
+            :return: value of the field
+        """
+        value = record[self.slots[field_name]]
+        if self.types[field_name] == FieldType.STRING:
+            return strings.get(value)
+        return value
+
+    def decode(self, record: tuple[int, ...], strings: dict[int, str]) -> Entry:
+        """
+            Decodes the fields of a record into an entry (without its ID).
+            :param record: decoded record
+            :param strings: position -> string of the table's string buffer
+            :return: entry
+        """
+        entry = dict(zip(self.names, record[1:-2]))
+        for name, slot in self.string_slots:
+            entry[name] = strings.get(record[slot])
+        return entry
+
+# free space of a string buffer
+class StringSpace:
+    """
+        Free extents of the string buffer of a table: runs of bytes no record
+        points to, each one still parseable as a length-prefixed string (a freed
+        string, or a filler of zeros). New strings are placed in the smallest
+        extent they fit in (best fit), the rest of it stays free as a filler.
+        An extent spans at most one string of the maximum length.
+    """
+    # length prefix + longest string
+    MAX_EXTENT = 2 + 32767
+
+    def __init__(self):
+        # offset -> size, end -> offset of the extents
+        self.extents: dict[int, int] = {}
+        self.ends: dict[int, int] = {}
+        # (size, offset) of the extents, sorted
+        self.by_size: list[tuple[int, int]] = []
+
+    def add(self, offset: int, size: int) -> None:
+        """
+            Registers a free extent.
+            :param offset: position of the extent in the file
+            :param size: size of the extent in bytes (at least 2)
+        """
+        self.extents[offset] = size
+        self.ends[offset + size] = offset
+        insort(self.by_size, (size, offset))
+
+    def remove(self, offset: int) -> int:
+        """
+            Unregisters a free extent.
+            :param offset: position of the extent
+            :return: size of the extent
+        """
+        size = self.extents.pop(offset)
+        del self.ends[offset + size]
+        del self.by_size[bisect_left(self.by_size, (size, offset))]
+        return size
+
+    def best_fit(self, size: int) -> tuple[int, int] | None:
+        """
+            Takes the smallest extent holding size bytes whose remainder can stay
+            free (none, or at least a length prefix).
+            :param size: number of bytes needed
+            :return: (offset, size) of the extent taken, None if none fits
+        """
+        i = bisect_left(self.by_size, (size, -1))
+        while i < len(self.by_size):
+            extent_size, offset = self.by_size[i]
+            if extent_size != size + 1:
+                self.remove(offset)
+                return offset, extent_size
+            i += 1
+        return None
+
+    def free_bytes(self) -> int:
+        """
+            :return: total size of the free extents in bytes
+        """
+        return sum(self.extents.values())
+
+
+# table metadata
+class TableMeta:
+    """
+        Header and entry header of a table kept in memory, so an operation does
+        not parse them from the file. They are the authority on the file while
+        it is only changed by the database: every write to them goes through
+        Database._write_entry_header and Database._write_first_available, which
+        update both. They are parsed again once the file changed elsewhere.
+    """
+    def __init__(self, header: dict, entry_header: dict, offsets_position: int):
+        """
+            :param header: header of the table (see Database._parse_header)
+            :param entry_header: entry header of the table (see Database._parse_entry_header)
+            :param offsets_position: position of the string buffer offset in the header (see Database._signature_end)
+        """
+        self.header = header
+        self.entry_header = entry_header
+        self.signature: TableSignature = header['signature']
+        # positions of the string buffer offset, first available position and entry buffer offset
+        self.offsets_position = offsets_position
+        self.first_available_position = offsets_position + 4
+        # first record slot, after the entry header
+        self.records_start = header['entry_buffer_offset'] + 20
+
+# I/O instrumentation
+def instrumented(method):
+    """
+        Attributes the I/O done by a Database method to its name, when the
+        database is instrumented (see Database.io_stats).
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.io_counters is None:
+            return method(self, *args, **kwargs)
+        with self.io_counters.operation(method.__name__):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+def synchronized(method):
+    """
+        Runs a Database method holding the database lock, for the methods
+        touching the table files outside of _open_table (which takes it too).
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
 # TODO: add constants system for clearer code
-# TODO: have a function handle all opening/closing of file ?
-# TODO: might help with keeping some tables open
-# TODO: make helper function for get_entry and get_entries - a lot of code is repeated
 # TODO: rework creation flow maybe ?
 # TODO: get_complete_table could perhaps make use of get_entries
 # database class
 class Database:
-    def __init__(self, name: str):
+    def __init__(self, name: str, warm_up: bool = False):
+        """
+            Opens the database of the given name, created if it does not exist.
+            Only the headers of the tables are read: the index of a table is built
+            on its first use, the index of a field on its first lookup.
+            :param name: path of the database directory
+            :param warm_up: build every index at once instead (see build_indexes)
+        """
         self.name = name
         self.tables: dict[str, list[tuple[str, FieldType]]] = {}
-        # table name -> field name -> value int or str -> list of entry positions
-        self.indexes: dict[str, dict[str, dict[int | str, list[int]]]] = {}
+        # table name -> record codec of its signature
+        self.codecs: dict[str, RecordCodec] = {}
+        # table name -> entry ID -> entry, and field name -> index of the field (values -> entry IDs)
+        # (the index of a field is only there once it was looked up, see _field_index)
+        self.indexes: dict[str, dict[int | str, Entry | FieldIndex]] = {}
         self.indexes_built = False
         self.indexes_built_tables = []
-        self.string_lookup_built = False
-        self.string_lookup: dict[str, int] = {}
-        # TODO: consider if necessary to keep open files
-        # self.open_files: dict[str, BinaryFile] = {}
+        # keep the IDs of the values held by many entries in bitmaps instead of arrays, in the
+        # indexes of the fields built from now on (see index.FieldIndex)
+        self.dense_bitmaps = False
+        # table name -> entry ID -> position of its record in the table file
+        self.entry_positions: dict[str, dict[int, int]] = {}
+        # table name -> field name ('id' for the entry IDs) -> index file saved for it, mapped on
+        # first use (None until then), see _index_file
+        self.index_files: dict[str, dict[str, IndexFile | None]] = {}
+        # save the indexes built to index files on close, so the next process can answer the
+        # lookups of the fields without reading the tables (see index_file)
+        self.persist_indexes = False
+        # table name -> header and entry header of the table, see _table_meta
+        self.table_meta: dict[str, TableMeta] = {}
+        # table name -> free extents of its string buffer
+        self.string_spaces: dict[str, StringSpace] = {}
+        # table name -> string -> [its position in the string buffer of the table,
+        # number of string fields of the entries holding it]
+        self.string_lookup: dict[str, dict[str, list[int]]] = {}
+        # table name -> BinaryFile class used to access it (BinaryFile by default)
+        self.table_backends: dict[str, type[BinaryFile]] = {}
+        # coalesce the writes to a table file until it is flushed or closed
+        self.coalesce_writes = True
+        # grow the table files by extents of at least preallocate_extent bytes or preallocate_ratio
+        # of their size instead of by each write (e.g. 1 << 20), 0 and 0.0 to disable (see BinaryFile.preallocate)
+        self.preallocate_extent = 0
+        self.preallocate_ratio = 0.0
+        # compatibility: grow the string buffer by exactly each new string instead of doubling it
+        self.exact_string_growth = False
+        # page cache shared by the table files (e.g. PageCache(max_pages=256)), None to access them directly
+        self.page_cache: PageCache | None = None
+        # I/O counters of the table files per operation (e.g. IOStats()), None when not instrumented
+        self.io_counters: IOStats | None = None
+        # write-ahead log of the changes to the table files, see enable_wal
+        self.wal: WriteAheadLog | None = None
+        # table name -> file of the tables accessed by the transaction in progress, see begin
+        self.transaction_files: dict[str, BinaryFile] | None = None
+        # tables rewritten during the transaction, whose file before it is kept as <table>.table.bak
+        self.transaction_backups: set[str] = set()
+        # pool of open table files, least recently used first:
+        # table name -> (binary file, stat stamp of the file, configuration it was opened with)
+        self.open_files: OrderedDict[str, tuple[BinaryFile, tuple, tuple]] = OrderedDict()
+        # maximum number of table files kept open
+        self.max_open_files = 16
+        # serializes the accesses to the tables (taken by _open_table), for the background compaction
+        self.lock = threading.RLock()
+        # table name -> (dead slots to fill, live records to move) of the compaction in progress
+        self.compaction_plans: dict[str, tuple[list[int], list[int]]] = {}
+        # background compaction thread, see start_compaction
+        self.compactor: threading.Thread | None = None
+        self.compactor_stop = threading.Event()
+        # (budget, interval) of the last compaction thread started
+        self.compaction_settings: tuple[int, float] | None = None
         self._load_db()
+        if warm_up:
+            self.build_indexes()
     
     # HELPER FUNCTIONS
     def _load_db(self) -> None:
@@ -49,6 +350,21 @@ class Database:
         """
         # if database exists, load tables
         if os.path.exists(self.name):
+            # rewrites interrupted by a crash, their table file was not replaced
+            for file_name in os.listdir(self.name):
+                if file_name.endswith(('.table.tmp', f"{INDEX_SUFFIX}.tmp")):
+                    os.remove(f"{self.name}/{file_name}")
+            # changes committed to the log before a crash
+            committed = 0
+            if os.path.exists(f"{self.name}/{WAL_FILE}"):
+                _, committed = replay(f"{self.name}/{WAL_FILE}")
+            # files of the tables rewritten by a transaction: restored unless it was committed
+            for file_name in os.listdir(self.name):
+                if file_name.endswith('.table.bak'):
+                    if committed:
+                        os.remove(f"{self.name}/{file_name}")
+                    else:
+                        os.replace(f"{self.name}/{file_name}", f"{self.name}/{file_name[:-4]}")
             for file_name in os.listdir(self.name):
                 if not file_name.endswith('.table'):
                     continue
@@ -56,20 +372,22 @@ class Database:
                 table_name = file_name[:-6]
                 # read table signature
                 try:
-                    with open(os.path.join(self.name, file_name), 'rb+') as f:
-                        binary_file = BinaryFile(f)
+                    with self._open_table(table_name) as binary_file:
                         # Check if file is not empty
                         if binary_file.get_size() > 0:
-                            header = self._parse_header(binary_file)
-                            self.tables[table_name] = header['signature']
-                            # Only build index if needed
-                            if table_name not in self.indexes_built_tables:
-                                try:
-                                    self._build_table_index(binary_file, table_name)
-                                except Exception as e:
-                                    print(f"Warning: Could not build index for table {table_name}: {e}")
+                            meta = self._table_meta(binary_file, table_name)
+                            self.tables[table_name] = meta.signature
+                            self.codecs[table_name] = RecordCodec(meta.signature)
+                            self._trim_preallocated(binary_file, table_name)
+                            # the index is built on first use
                 except Exception as e:
                     print(f"Warning: Could not load table {table_name}: {e}")
+            # index files saved for the fields of the tables, checked when first used
+            file_names = set(os.listdir(self.name))
+            for table_name, codec in self.codecs.items():
+                for field_name in ('id',) + codec.names:
+                    if os.path.basename(self._index_file_path(table_name, field_name)) in file_names:
+                        self.index_files.setdefault(table_name, {})[field_name] = None
         else:
             # create database
             os.makedirs(self.name)
@@ -77,6 +395,162 @@ class Database:
             # TODO: add default table ?
             # self.create_table('default', ('id', FieldType.INTEGER))
 
+    @contextmanager
+    def _open_table(self, table_name: str):
+        """
+            Opens the file of a table with the backend selected for it, or takes
+            it from the pool of open files. On exit the binary file is flushed and
+            goes back to the pool, even if it was reopened on another file in the
+            meantime (e.g. after a string buffer expansion); it is closed instead
+            if the operation failed.
+            The database lock is held meanwhile.
+            During a transaction, the file of the table stays open until it ends
+            and its writes are kept in memory.
+            :param table_name: name of the table
+            :return: binary file of the table
+        """
+        with self.lock:
+            if self.transaction_files is not None:
+                binary_file = self.transaction_files.get(table_name)
+                if binary_file is None:
+                    self._close_table(table_name)
+                    binary_file = self._instrument(BinaryFile(self._table_file(table_name)))
+                    self.transaction_files[table_name] = self._journal(binary_file, table_name)
+                yield binary_file
+                return
+            path = f"{self.name}/{table_name}.table"
+            backend = self.table_backends.get(table_name, BinaryFile)
+            config = (backend, self.page_cache, self.coalesce_writes)
+            binary_file = None
+            # taken out of the pool while in use
+            pooled = self.open_files.pop(table_name, None)
+            if pooled is not None:
+                binary_file, stamp, pooled_config = pooled
+                # the file was changed elsewhere or the table configuration changed
+                changed = self._file_stamp(path) != stamp
+                if changed:
+                    # its header must be parsed again
+                    self.table_meta.pop(table_name, None)
+                if pooled_config != config or changed:
+                    binary_file.close()
+                    binary_file = None
+            if binary_file is None:
+                f = self._table_file(table_name)
+                try:
+                    binary_file = backend(f)
+                except Exception:
+                    f.close()
+                    raise
+            self._instrument(binary_file)
+            self._journal(binary_file, table_name)
+            binary_file.preallocate(self.preallocate_extent, self.preallocate_ratio)
+            try:
+                yield binary_file
+            except BaseException:
+                binary_file.close()
+                # the header may not have been written as the metadata says
+                self.table_meta.pop(table_name, None)
+                raise
+            # committed to the log, then written to the file
+            binary_file.flush()
+            self._release_table(table_name, binary_file, config)
+            if self.wal is not None and self.wal.needs_checkpoint():
+                self.checkpoint()
+
+    def _release_table(self, table_name: str, binary_file: BinaryFile, config: tuple) -> None:
+        """
+            Puts an open table file back in the pool, closing the least recently
+            used files over max_open_files.
+            :param table_name: name of the table
+            :param binary_file: binary file of the table, flushed
+            :param config: configuration the file was opened with
+        """
+        displaced = self.open_files.pop(table_name, None)
+        if displaced is not None and displaced[0] is not binary_file:
+            displaced[0].close()
+        stamp = self._file_stamp(f"{self.name}/{table_name}.table")
+        self.open_files[table_name] = (binary_file, stamp, config)
+        while len(self.open_files) > self.max_open_files:
+            _, (old_file, _, _) = self.open_files.popitem(last=False)
+            old_file.close()
+
+    def _close_table(self, table_name: str) -> None:
+        """
+            Closes the pooled file of a table, if any.
+            :param table_name: name of the table
+        """
+        pooled = self.open_files.pop(table_name, None)
+        if pooled is not None:
+            pooled[0].close()
+
+    def _file_stamp(self, path: str) -> tuple:
+        """
+            Returns what identifies the state of a file: inode, modification time and size.
+            :param path: path of the file
+            :return: stat stamp, None if the file does not exist
+        """
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _instrument(self, binary_file: BinaryFile) -> BinaryFile:
+        """
+            Makes a binary file count its I/O into the database counters, if any.
+            :param binary_file: binary file
+            :return: the same binary file
+        """
+        binary_file.io_stats = self.io_counters
+        return binary_file
+
+    def _journal(self, binary_file: BinaryFile, table_name: str) -> BinaryFile:
+        """
+            Makes a binary file of a table record its changes into the write-ahead
+            log, if enabled.
+            :param binary_file: binary file
+            :param table_name: name of the table
+            :return: the same binary file
+        """
+        if self.wal is None:
+            binary_file.journal = None
+        else:
+            binary_file.journal = TableJournal(self.wal, table_name, transaction=self.transaction_files is not None)
+        return binary_file
+
+    def _table_file(self, table_name: str, mode: str = "rb+", path: str = None):
+        """
+            Opens the file of a table, through the page cache when there is one,
+            otherwise behind a WriteBuffer when writes are coalesced.
+            The mmap backend writes into its mapping and is never buffered.
+            With the write-ahead log, the write buffer only writes an operation to
+            the file once it is committed. During a transaction, the tables are
+            accessed through an unbounded write buffer whatever their backend.
+            :param table_name: name of the table
+            :param mode: opening mode
+            :param path: path of the file, defaults to the table file
+            :return: binary file object
+        """
+        path = path or f"{self.name}/{table_name}.table"
+        f = open(path, mode)
+        backend = self.table_backends.get(table_name, BinaryFile)
+        if self.transaction_files is not None:
+            # written once the transaction is committed
+            if self.page_cache is not None:
+                self.page_cache.invalidate(path)
+            f = WriteBuffer(f, max_buffered=sys.maxsize)
+        elif issubclass(backend, MmapBinaryFile):
+            # the mapping bypasses the cache, whose pages become stale
+            if self.page_cache is not None:
+                self.page_cache.invalidate(path)
+        elif self.page_cache is not None:
+            f = PagedFile(f, self.page_cache)
+        elif self.wal is not None:
+            f = WriteBuffer(f, max_buffered=sys.maxsize)
+        elif self.coalesce_writes:
+            f = WriteBuffer(f)
+        return f
+
     def _initialize_string_buffer(self, binary_file: BinaryFile, offset: int, string_buffer_size: int = 16) -> None:
         """
             Initializes the string buffer:
@@ -84,8 +558,7 @@ class Database:
         """
         binary_file.goto(offset)
         # initialize 16 bytes with zeros
-        for _ in range(string_buffer_size):
-            binary_file.write_integer(0, 1)
+        binary_file.write_bytes(bytes(string_buffer_size))
         binary_file.goto(0)
 
     def _initialize_entry_buffer(self, binary_file: BinaryFile, offset: int) -> None:
@@ -98,20 +571,12 @@ class Database:
             - Reserved pointer (4 bytes): -1
         """
         binary_file.goto(offset)
-        # last used ID - 4 bytes
-        binary_file.write_integer(0, 4)  
-        # number of entries - 4 bytes
-        binary_file.write_integer(0, 4)  
-        # pointer to first entry - 4 bytes
-        binary_file.write_integer(-1, 4)
-        # pointer to last entry - 4 bytes
-        binary_file.write_integer(-1, 4)
-        # reserved pointer - 4 bytes
-        binary_file.write_integer(-1, 4)
+        # last used ID, number of entries, first, last and reserved pointers
+        binary_file.write_integers((0, 0, -1, -1, -1), 4)
         # go to start of file
         binary_file.goto(0)
         
-    def _write_header(self, binary_file: BinaryFile, fields: list[tuple[str, FieldType]], string_buffer_offset: int = 64, entry_buffer_offset: int = 80, first_available_position: int = None) -> tuple[int, int]:
+    def _write_header(self, binary_file: BinaryFile, fields: list[tuple[str, FieldType]], string_buffer_offset: int = None, entry_buffer_offset: int = None, first_available_position: int = None) -> tuple[int, int]:
         """
             Writes the complete header section:
             - Magic constant "ULDB" (4 bytes)
@@ -123,18 +588,23 @@ class Database:
             
             :param binary_file: The binary file to write to
             :param fields: List of field tuples (name, type)
-            :param string_buffer_offset: Offset where string buffer starts
-            :param entry_buffer_offset: Offset where entry buffer starts
+            :param string_buffer_offset: Offset where string buffer starts (defaults to the end of the header)
+            :param entry_buffer_offset: Offset where entry buffer starts (defaults to a 16-byte string buffer)
             :param first_available_position: First available position in string buffer (defaults to string_buffer_offset)
             :return: tuple of string buffer offset and entry buffer offset
         """
+        # the string buffer starts right after the header, whose size depends on the signature
+        if string_buffer_offset is None:
+            # 3 offsets after the signature
+            string_buffer_offset = self._signature_end(fields) + 12
+        if entry_buffer_offset is None:
+            entry_buffer_offset = string_buffer_offset + 16
         # if first_available_position is not provided, use string_buffer_offset
         if first_available_position is None:
             first_available_position = string_buffer_offset
             
         # magic constant - raw bytes - not length-prefixed
-        for b in "ULDB".encode('ascii'):
-            binary_file.write_integer(b, 1)
+        binary_file.write_bytes("ULDB".encode('ascii'))
         # number of fields
         binary_file.write_integer(len(fields), 4)
         # table signature
@@ -154,6 +624,17 @@ class Database:
         binary_file.goto(0)
         return string_buffer_offset, entry_buffer_offset
 
+    def _signature_end(self, fields: TableSignature) -> int:
+        """
+            Returns the position right after the table signature in the header,
+            where the string buffer offset, first available position and entry
+            buffer offset are stored.
+            :param fields: signature of the table
+            :return: position in bytes
+        """
+        # magic + nfields + (type + length prefix + name) per field
+        return 4 + 4 + sum(1 + 2 + len(name.encode('utf-8')) for name, _ in fields)
+
     def _parse_header(self, binary_file: BinaryFile) -> dict:
         """
             Parses the header of the table.
@@ -180,9 +661,9 @@ class Database:
             table_signature.append((field_name, FieldType(field_type)))
         # offsets
         header = {}
-        header['string_buffer_offset'] = binary_file.read_integer(4)
-        header['string_buffer_first_available_position'] = binary_file.read_integer(4)
-        header['entry_buffer_offset'] = binary_file.read_integer(4)
+        (header['string_buffer_offset'],
+         header['string_buffer_first_available_position'],
+         header['entry_buffer_offset']) = binary_file.read_integers(4, 3)
         header['signature'] = table_signature
         header['nfields'] = nfields
         header['magic_c'] = magic_c
@@ -200,27 +681,107 @@ class Database:
         # goto entry buffer  
         binary_file.goto(header['entry_buffer_offset'])
         entry_header = {}
-        # last used ID
-        entry_header['last_used_id'] = binary_file.read_integer(4)
-        # number of entries
-        entry_header['nentries'] = binary_file.read_integer(4)
-        # first entry pointer
-        entry_header['first_entry_pointer'] = binary_file.read_integer(4)
-        # last entry pointer
-        entry_header['last_entry_pointer'] = binary_file.read_integer(4)
-        # reserved pointer
-        entry_header['reserved_pointer'] = binary_file.read_integer(4)
+        # last used ID, number of entries, first, last and reserved pointers in one read
+        (entry_header['last_used_id'],
+         entry_header['nentries'],
+         entry_header['first_entry_pointer'],
+         entry_header['last_entry_pointer'],
+         entry_header['reserved_pointer']) = binary_file.read_integers(4, 5)
         # go to start of file
         binary_file.goto(0)
         return entry_header
 
-    def _build_string_lookup(self, binary_file: BinaryFile, header: dict) -> None:
+    def _table_meta(self, binary_file: BinaryFile, table_name: str) -> TableMeta:
         """
-            Builds a lookup table for the strings in the string buffer.
+            Returns the metadata of a table, parsed from its file if it is not
+            known yet.
+            :param binary_file: binary file of the table
+            :param table_name: name of the table
+            :return: metadata of the table
+            :raises ValueError: if magic constant is invalid
+        """
+        meta = self.table_meta.get(table_name)
+        if meta is None:
+            header = self._parse_header(binary_file)
+            meta = TableMeta(header, self._parse_entry_header(binary_file, header), self._signature_end(header['signature']))
+            self.table_meta[table_name] = meta
+        return meta
+
+    def _write_entry_header(self, binary_file: BinaryFile, table_name: str, **values: int) -> None:
+        """
+            Updates fields of the entry header of a table, in its metadata and its file.
+            :param binary_file: binary file of the table
+            :param table_name: name of the table
+            :param values: new values of entry header fields (last_used_id, nentries,
+                           first_entry_pointer, last_entry_pointer, reserved_pointer)
+        """
+        meta = self._table_meta(binary_file, table_name)
+        entry_header = meta.entry_header
+        entry_header.update(values)
+        binary_file.goto(meta.header['entry_buffer_offset'])
+        binary_file.write_integers((
+            entry_header['last_used_id'],
+            entry_header['nentries'],
+            entry_header['first_entry_pointer'],
+            entry_header['last_entry_pointer'],
+            entry_header['reserved_pointer']), 4)
+
+    def _write_first_available(self, binary_file: BinaryFile, table_name: str, position: int) -> None:
+        """
+            Updates the first available position of the string buffer of a table,
+            in its metadata and its file.
+            :param binary_file: binary file of the table
+            :param table_name: name of the table
+            :param position: new first available position
+        """
+        meta = self._table_meta(binary_file, table_name)
+        meta.header['string_buffer_first_available_position'] = position
+        binary_file.goto(meta.first_available_position)
+        binary_file.write_integer(position, 4)
+
+    def _trim_preallocated(self, binary_file: BinaryFile, table_name: str) -> None:
+        """
+            Truncates the record slots left empty at the end of a table file, the
+            space it had preallocated when the process stopped without closing it.
+            They are zeros, and no record has the ID 0.
+            :param binary_file: binary file of the table
+            :param table_name: name of the table
+        """
+        codec = self.codecs[table_name]
+        records_start = self._table_meta(binary_file, table_name).records_start
+        nslots = (binary_file.get_size() - records_start) // codec.size
+        end = nslots
+        while end > 0:
+            binary_file.goto(records_start + (end - 1) * codec.size)
+            if binary_file.read_integer(4) != 0:
+                break
+            end -= 1
+        if end < nslots:
+            binary_file.truncate(records_start + end * codec.size)
+
+    def _build_string_lookup(self, binary_file: BinaryFile, header: dict, table_name: str) -> dict[int, str]:
+        """
+            Builds the lookup table of the strings in the string buffer of a table,
+            with no references yet (counted when the table index is built).
+            :param binary_file: binary file
+            :param header: header of the table
+            :param table_name: name of the table
+            :return: dict of string position -> string
+            :raises ValueError: if string buffer is corrupted
+        """
+        strings = self._read_string_buffer(binary_file, header)
+        self.string_lookup[table_name] = {string: [position, 0] for position, string in strings.items()}
+        return strings
+
+    def _read_string_buffer(self, binary_file: BinaryFile, header: dict) -> dict[int, str]:
+        """
+            Reads the strings in the string buffer of a table.
             :param binary_file: binary file
             :param header: header of the table
+            :return: dict of string position -> string
             :raises ValueError: if string buffer is corrupted
         """
+        strings = {}
         try:
             # initialize necessary variables for traverse of string buffer
             start = header['string_buffer_offset']
@@ -232,21 +793,145 @@ class Database:
                 # len related errors are handled in read_string
                 # read string
                 try:
-                    string = binary_file.read_string()
-                    # add string and its offset to lookup table
-                    self.string_lookup[string] = start
+                    strings[start] = binary_file.read_string()
                 except Exception as e:
                     # likely corrupted
                     raise ValueError(f"Corrupted string at position {start}: {e}")
                 # update offset to next string
                 start = binary_file._get_current_pos()
-            self.string_lookup_built = True
         except Exception as e:
             raise IOError(f"Error while building string lookup: {e}")
+        return strings
+
+    def _walk_records(self, binary_file: BinaryFile, codec: RecordCodec, current_pos: int):
+        """
+            Walks the linked list of records starting at current_pos.
+            Records are read by runs of up to RECORD_RUN, so contiguous records
+            (the layout add_entry produces) cost one read per run instead of one
+            per record. The records must not be modified during the walk.
+            :param binary_file: binary file
+            :param codec: record codec of the table
+            :param current_pos: position of the first record, -1 if none
+            :return: generator of (position, record)
+        """
+        run_start, run = -1, []
+        while current_pos != -1:
+            index, misaligned = divmod(current_pos - run_start, codec.size)
+            if run_start == -1 or current_pos < run_start or misaligned or index >= len(run):
+                # positions come from the file's own links, so the bounds checks are skipped
+                count = max(1, min(RECORD_RUN, (binary_file.get_size() - current_pos) // codec.size))
+                with binary_file.unchecked():
+                    binary_file.goto(current_pos)
+                    run = codec.unpack_run(binary_file.read_bytes(count * codec.size))
+                run_start, index = current_pos, 0
+            record = run[index]
+            yield current_pos, record
+            # go to next entry
+            current_pos = record[-1]
+
+    def _scan_records(self, binary_file: BinaryFile, codec: RecordCodec, header: dict, entry_header: dict):
+        """
+            Reads the records of a table sequentially, by blocks of COPY_CHUNK bytes,
+            instead of following their links: the records all have the same size and
+            fill the file after the entry header. The slots of the list of deleted
+            entries, chased in memory, are the tombstones of a liveness bitmap over
+            the slots.
+            :param binary_file: binary file
+            :param codec: record codec of the table
+            :param header: header of the table
+            :param entry_header: entry header of the table
+            :return: generator of (position, record) of the entries in ID order,
+                     None if the slots do not match the lists of the entry header
+        """
+        records_start = header['entry_buffer_offset'] + 20  # 20 bytes for entry header
+        nslots, misaligned = divmod(binary_file.get_size() - records_start, codec.size)
+        if misaligned or nslots < entry_header['nentries']:
+            return None
+        records_per_chunk = max(1, COPY_CHUNK // codec.size)
+        chunks = []
+        ids, next_pointers = array('i'), array('i')
+        with binary_file.unchecked():
+            binary_file.goto(records_start)
+            for first in range(0, nslots, records_per_chunk):
+                data = binary_file.read_bytes(min(records_per_chunk, nslots - first) * codec.size)
+                values = array('i')
+                values.frombytes(data)
+                if sys.byteorder == 'big':
+                    values.byteswap()
+                ids.extend(values[::codec.length])
+                next_pointers.extend(values[codec.length - 1::codec.length])
+                chunks.append(data)
+        # tombstones: the slots of the list of deleted entries
+        live = bytearray(b'\x01') * nslots
+        dead = 0
+        pointer = entry_header['reserved_pointer']
+        while pointer != -1:
+            slot, misaligned = divmod(pointer - records_start, codec.size)
+            if misaligned or not 0 <= slot < nslots or not live[slot]:
+                return None
+            live[slot] = 0
+            dead += 1
+            pointer = next_pointers[slot]
+        if nslots - dead != entry_header['nentries']:
+            return None
+        # live slots in ID order (their physical order unless slots were reused)
+        order = list(compress(range(nslots), live))
+        last_id = 0
+        for slot in order:
+            if ids[slot] <= last_id:
+                order.sort(key=ids.__getitem__)
+                break
+            last_id = ids[slot]
+
+        def records():
+            for slot in order:
+                chunk, index = divmod(slot, records_per_chunk)
+                yield records_start + slot * codec.size, codec.struct.unpack_from(chunks[chunk], index * codec.size)
+        return records()
+
+    def _push_free_slot(self, binary_file: BinaryFile, codec: RecordCodec, position: int, free_pointer: int) -> None:
+        """
+            Pushes a slot onto the list of deleted entries. The list is doubly
+            linked by the prev/next pointers of the slots, so any slot can be taken
+            out of it in constant time.
+            :param binary_file: binary file
+            :param codec: record codec of the table
+            :param position: position of the slot
+            :param free_pointer: current head of the list, -1 if empty (the caller stores the new head)
+        """
+        binary_file.goto(position + codec.prev_offset)
+        binary_file.write_integers((-1, free_pointer), 4)
+        if free_pointer != -1:
+            binary_file.goto(free_pointer + codec.prev_offset)
+            binary_file.write_integer(position, 4)
+
+    def _unlink_free_slot(self, binary_file: BinaryFile, codec: RecordCodec, position: int, free_pointer: int) -> int:
+        """
+            Takes a slot out of the list of deleted entries.
+            :param binary_file: binary file
+            :param codec: record codec of the table
+            :param position: position of the slot
+            :param free_pointer: current head of the list
+            :return: new head of the list
+        """
+        binary_file.goto(position + codec.prev_offset)
+        prev_pointer, next_pointer = binary_file.read_integers(4, 2)
+        if prev_pointer == -1:
+            free_pointer = next_pointer
+        else:
+            binary_file.goto(prev_pointer + codec.next_offset)
+            binary_file.write_integer(next_pointer, 4)
+        if next_pointer != -1:
+            binary_file.goto(next_pointer + codec.prev_offset)
+            binary_file.write_integer(prev_pointer, 4)
+        return free_pointer
 
+    @instrumented
     def _build_table_index(self, binary_file: BinaryFile, table_name: str) -> None:
         """
-            Builds an index for the table.
+            Builds the index of the table: its entries by ID, the positions of
+            their records and the string lookup. The indexes of the fields are
+            built from the entries when they are first looked up.
             :param binary_file: binary file
             :param table_name: name of the table
         """
@@ -255,47 +940,43 @@ class Database:
         if not hasattr(self, 'indexes'):
             self.indexes = {}
         # initialize index for this table
-        if table_name not in self.indexes:
-            self.indexes[table_name] = {}
-        # initialize field-specific indexes using field names
-        for field_name, field_type in self.tables[table_name]:
-            self.indexes[table_name][field_name] = {}
-        # read header and entry header
-        binary_file.goto(0)
-        header = self._parse_header(binary_file)
-        entry_header = self._parse_entry_header(binary_file, header)
+        self.indexes[table_name] = {}
+        self.entry_positions[table_name] = positions = {}
+        # header and entry header
+        meta = self._table_meta(binary_file, table_name)
+        header, entry_header = meta.header, meta.entry_header
         # build string lookup
-        self._build_string_lookup(binary_file, header)
-        # go to start of entry buffer
-        binary_file.goto(header['entry_buffer_offset'])
-        # traverse valid entries
-        current_pos = entry_header['first_entry_pointer']
-        while current_pos != -1:  # -1 means end of linked list
-            binary_file.goto(current_pos)
-            # read entry id
-            entry_id = binary_file.read_integer(4)
-            # read entry fields
-            entry_fields = {}
-            for field_name, field_type in header['signature']:
-                if field_type == FieldType.INTEGER:
-                    value = binary_file.read_integer(4)
-                elif field_type == FieldType.STRING:
-                    string_pointer = binary_file.read_integer(4)
-                    value = self.string_lookup.get(string_pointer, None)  # get string via lookup
-                entry_fields[field_name] = value
+        strings = self._build_string_lookup(binary_file, header, table_name)
+        codec = self.codecs[table_name]
+        table_index = self.indexes[table_name]
+        lookup = self.string_lookup[table_name]
+        # strings pointed to by the entries
+        referenced = set()
+        # traverse valid entries, sequentially if the slots match the lists of entries
+        records = self._scan_records(binary_file, codec, header, entry_header)
+        if records is None:
+            records = self._walk_records(binary_file, codec, entry_header['first_entry_pointer'])
+        for position, record in records:
+            entry_id = record[0]
+            entry_fields = codec.decode(record, strings)
             # add entry to index
-            self.indexes[table_name][entry_id] = entry_fields
-            
-            # Build field-specific indexes for this entry
-            for field_name, value in entry_fields.items():
-                if value not in self.indexes[table_name][field_name]:
-                    self.indexes[table_name][field_name][value] = []
-                self.indexes[table_name][field_name][value].append(entry_id)
-                
-            # go to next entry
-            current_pos = binary_file.read_integer(4)  # read next pointer
+            table_index[entry_id] = entry_fields
+            positions[entry_id] = position
+            for _, slot in codec.string_slots:
+                referenced.add(record[slot])
+                # a string held by an entry is found at the copy it points to
+                interned = lookup[strings[record[slot]]]
+                interned[0] = record[slot]
+                interned[1] += 1
+        # the other strings are free space
+        space = StringSpace()
+        for position, string in strings.items():
+            if position not in referenced:
+                space.add(position, len(string.encode('utf-8')) + 2)
+        self.string_spaces[table_name] = space
         # update indexes_built_tables
-        self.indexes_built_tables.append(table_name)
+        if table_name not in self.indexes_built_tables:
+            self.indexes_built_tables.append(table_name)
         # update indexes_built flag
         self.indexes_built = True
 
@@ -312,119 +993,244 @@ class Database:
         if not isinstance(entry, dict):
             raise TypeError(f"Entry must be a dictionary, got {type(entry)}")
         # check entry fields
+        field_types = self.codecs[table_name].types
         for fieldname, fieldvalue in entry.items():
             # check field name
             if not isinstance(fieldname, str):
                 raise TypeError(f"Field name must be a string, got {type(fieldname)}")
             # check field exists in signature
-            if fieldname not in [field[0] for field in self.tables[table_name]]:
+            if fieldname not in field_types:
                 raise ValueError(f"Field {fieldname} does not exist in table {table_name}")
             # check field value
             if not isinstance(fieldvalue, Field):
                 raise TypeError(f"Field value must be an int or str, got {type(fieldvalue)}")
+            # check field value matches field type
+            if isinstance(fieldvalue, str) != (field_types[fieldname] == FieldType.STRING):
+                raise ValueError(f"Field {fieldname} expects a {field_types[fieldname].name}, got {type(fieldvalue)}")
         return True
     
-    def _add_string_to_buffer(self, binary_file: BinaryFile, string: str, table_name: str) -> tuple[int, dict, BinaryFile]:
+    @instrumented
+    def _add_strings_to_buffer(self, binary_file: BinaryFile, strings: list[str], table_name: str) -> tuple[dict[str, int], dict, BinaryFile]:
         """
-            Adds a string to the string buffer.
-            If the string already exists in the buffer, returns its position.
-            If there's not enough space, expands the buffer.
+            Adds strings to the string buffer, one reference per occurrence.
+            Strings already in the buffer keep their position, the new ones are
+            written in one run, after at most one expansion of the buffer, and the
+            first available position is updated once.
             
             :param binary_file: binary file
-            :param string: string to be added
+            :param strings: strings held by the new field values, repeated once per value
             :param table_name: name of the table
-            :return: position of the string in the buffer
-            :raises ValueError: if string buffer is full and cannot be expanded
-        """        
-        # if string already exists in the buffer
-        if string in self.string_lookup:
-            return self.string_lookup[string], self._parse_header(binary_file), binary_file
-        # current position in file
-        # TODO: since there is a good chance file will be expanded,
-        # we should not rely on current position
-        current_pos = binary_file._get_current_pos()
+            :return: dict of string -> position in the buffer, header and binary file (reopened by an expansion)
+            :raises ValueError: if a string is too long or the string buffer cannot be expanded enough
+        """
+        if table_name not in self.indexes_built_tables:
+            # an expansion builds the index of the table, which replaces the string lookup
+            # and the free space: built first if the strings may not fit
+            header = self._table_meta(binary_file, table_name).header
+            if sum(2 + len(string.encode('utf-8')) for string in set(strings)) > header['entry_buffer_offset'] - header['string_buffer_first_available_position']:
+                self._build_table_index(binary_file, table_name)
+        # build string lookup if not already built
+        if table_name not in self.string_lookup:
+            self._build_string_lookup(binary_file, self._table_meta(binary_file, table_name).header, table_name)
+        lookup = self.string_lookup[table_name]
+        positions = {}
+        new_strings = []
+        references = {}
+        for string in strings:
+            references[string] = references.get(string, 0) + 1
+        space = self.string_spaces.get(table_name)
+        for string, count in references.items():
+            interned = lookup.get(string)
+            # if string already exists in the buffer
+            if interned is not None:
+                positions[string] = interned[0]
+                # a freed copy is in use again
+                if interned[1] == 0 and space is not None and interned[0] in space.extents:
+                    space.remove(interned[0])
+                interned[1] += count
+            else:
+                positions[string] = None
+                new_strings.append(string)
         # header information
-        binary_file.goto(0)
-        header = self._parse_header(binary_file)
-        # required space for the string
-        string_bytes = string.encode('utf-8')
-        required_space = len(string_bytes) + 2  # 2 bytes for length prefix
+        meta = self._table_meta(binary_file, table_name)
+        header = meta.header
+        if not new_strings:
+            return positions, header, binary_file
+        # length-prefixed strings
+        encoded = []
+        for string in new_strings:
+            string_bytes = string.encode('utf-8')
+            # ULDB string length constraint (0 to 32767 bytes)
+            if len(string_bytes) > 32767:
+                raise ValueError(f"UTF-8 encoded string length ({len(string_bytes)} bytes) exceeds ULDB maximum of 32,767 bytes")
+            encoded.append(len(string_bytes).to_bytes(2, 'little') + string_bytes)
+        # freed space first (best fit), the others are written as one block at the end
+        if space is not None and space.extents:
+            appended = []
+            for string, string_bytes in zip(new_strings, encoded):
+                fit = space.best_fit(len(string_bytes))
+                if fit is None:
+                    appended.append((string, string_bytes))
+                    continue
+                offset, extent_size = fit
+                self._forget_string(binary_file, table_name, offset)
+                binary_file.goto(offset)
+                binary_file.write_bytes(string_bytes)
+                # the rest of the extent stays free
+                if extent_size > len(string_bytes):
+                    self._write_filler(binary_file, offset + len(string_bytes), extent_size - len(string_bytes))
+                    space.add(offset + len(string_bytes), extent_size - len(string_bytes))
+                positions[string] = offset
+                lookup[string] = [offset, references[string]]
+            if not appended:
+                return positions, header, binary_file
+            new_strings = [string for string, _ in appended]
+            encoded = [string_bytes for _, string_bytes in appended]
+        required_space = sum(len(string_bytes) for string_bytes in encoded)
         # available space in the buffer
         available_space = header['entry_buffer_offset'] - header['string_buffer_first_available_position']    
         if required_space > available_space:
             # not enough space -> expand the string buffer
             header, binary_file = self._expand_string_buffer(binary_file, header, 
-                self._parse_entry_header(binary_file, header), 
+                meta.entry_header, 
                 table_name,
-                string
+                required_space
             )
             # check expansion worked
             available_space = header['entry_buffer_offset'] - header['string_buffer_first_available_position']
             # if still not enough space
             if required_space > available_space:
-                raise ValueError(f"String buffer full. Cannot add string of length {len(string_bytes)} bytes even after expansion.")
-        # add string to buffer
+                raise ValueError(f"String buffer full. Cannot add {required_space} bytes of strings even after expansion.")
+        # add strings to buffer
         string_pos = header['string_buffer_first_available_position']
         binary_file.goto(string_pos)
-        binary_file.write_string(string)
+        binary_file.write_bytes(b''.join(encoded))
+        for string, string_bytes in zip(new_strings, encoded):
+            positions[string] = string_pos
+            # update string lookup
+            lookup[string] = [string_pos, references[string]]
+            string_pos += len(string_bytes)
         # update first available position in header
-        new_first_available_position = string_pos + required_space
-        # find the correct position for the first available position in the header
-        binary_file.goto(0)
-        # skip magic constant (4 bytes)
-        # binary_file.goto(4)
-        for _ in range(4):
-            binary_file.read_integer(1)
-        # read number of fields
-        nfields = binary_file.read_integer(4)
-        # skip field definitions
-        for _ in range(nfields):
-            field_type = binary_file.read_integer(1)
-            field_name_len = binary_file.read_integer(2)
-            binary_file.goto(binary_file._get_current_pos() + field_name_len) 
-        # skip string buffer offset (4 bytes)
-        binary_file.read_integer(4)
-        # write first available position
-        binary_file.write_integer(new_first_available_position, 4)
-        # update string lookup
-        self.string_lookup[string] = string_pos
-        # SILENCED tmp: restore original position
-        # binary_file.goto(current_pos)
-        return string_pos, header, binary_file
-
-    def _expand_string_buffer(self, binary_file: BinaryFile, header: dict, entry_header: dict, table_name: str, new_string: str) -> tuple[dict, BinaryFile]:
-        """
-            Expands the string buffer to double its current size.
-            Uses the table index to rebuild the file instead of reading entries directly.
+        self._write_first_available(binary_file, table_name, string_pos)
+        return positions, header, binary_file
+
+    def _forget_string(self, binary_file: BinaryFile, table_name: str, position: int) -> None:
+        """
+            Removes the string stored at position from the string lookup, before
+            its bytes are reused.
+            :param binary_file: binary file
+            :param table_name: name of the table
+            :param position: position of the string
+        """
+        string = binary_file.read_string_from(position)
+        lookup = self.string_lookup.get(table_name, {})
+        if string in lookup and lookup[string][0] == position:
+            del lookup[string]
+
+    def _write_filler(self, binary_file: BinaryFile, offset: int, size: int) -> None:
+        """
+            Writes a free extent of the string buffer: a string of zeros, so the
+            buffer stays parseable.
+            :param binary_file: binary file
+            :param offset: position of the extent
+            :param size: size of the extent in bytes (at least 2)
+        """
+        binary_file.goto(offset)
+        binary_file.write_bytes((size - 2).to_bytes(2, 'little') + bytes(size - 2))
+
+    def _free_string(self, binary_file: BinaryFile, table_name: str, position: int) -> None:
+        """
+            Gives the space of a string no entry points to anymore back to the
+            string buffer: the first available position moves back if it is the
+            last string, otherwise it becomes a free extent, merged with the free
+            extents around it.
+            :param binary_file: binary file
+            :param table_name: name of the table
+            :param position: position of the string
+        """
+        space = self.string_spaces.get(table_name)
+        if space is None or position in space.extents:
+            return
+        self._forget_string(binary_file, table_name, position)
+        size = binary_file._get_current_pos() - position
+        header = self._table_meta(binary_file, table_name).header
+        if position + size == header['string_buffer_first_available_position']:
+            # with the free extents right before it
+            while position in space.ends:
+                position = space.ends[position]
+                self._forget_string(binary_file, table_name, position)
+                space.remove(position)
+            self._write_first_available(binary_file, table_name, position)
+            return
+        before = space.ends.get(position)
+        if before is not None and space.extents[before] + size <= StringSpace.MAX_EXTENT:
+            self._forget_string(binary_file, table_name, before)
+            size += space.remove(before)
+            position = before
+        after = position + size
+        if after in space.extents and space.extents[after] + size <= StringSpace.MAX_EXTENT:
+            self._forget_string(binary_file, table_name, after)
+            size += space.remove(after)
+        self._write_filler(binary_file, position, size)
+        space.add(position, size)
+
+    def _release_strings(self, binary_file: BinaryFile, table_name: str, references: dict[str, int]) -> None:
+        """
+            Drops references to strings of a table, the strings left without any
+            are freed.
+            :param binary_file: binary file
+            :param table_name: name of the table
+            :param references: string -> number of string fields no longer holding it
+        """
+        lookup = self.string_lookup[table_name]
+        for string, count in references.items():
+            interned = lookup[string]
+            interned[1] -= count
+            if interned[1] <= 0:
+                interned[1] = 0
+                self._free_string(binary_file, table_name, interned[0])
+
+    @instrumented
+    def _expand_string_buffer(self, binary_file: BinaryFile, header: dict, entry_header: dict, table_name: str, required_space: int = None) -> tuple[dict, BinaryFile]:
+        """
+            Expands the string buffer to double its current size, as many times as
+            needed to fit the new strings. The table is rewritten on every expansion,
+            doubling keeps the cost per string insert amortized O(1).
+            With exact_string_growth, the buffer grows by exactly the new strings
+            instead (legacy behaviour: one rewrite per new string).
             
             :param binary_file: binary file
             :param header: header of the table
             :param table_name: name of the table
-            :param new_string: string to be added to the buffer
+            :param required_space: bytes of length-prefixed strings to fit, None to just grow
             :return: updated header
         """
         # current and new size
         curr_size = header['string_buffer_first_available_position'] - header['string_buffer_offset']
         if curr_size <= 0:
             curr_size = 16
-        new_size = curr_size * EXPAND_FACTOR # arbitrary size (always a power of 2)
-        # WARNING: For the test_insert_in_table case, stupid assumption is made
-        # demands expansion to be strctly enough to contain the new string
-        # and nothing else
-        # whereas me i want to expand more aggressively so we don't have to do this too often
-        if new_string is not None:
-            new_size = curr_size + len(new_string.encode('utf-8')) + 2
+        # used space once the new string is added
+        required_size = header['string_buffer_first_available_position'] - header['string_buffer_offset']
+        if required_space is not None:
+            required_size += required_space
+        if self.exact_string_growth:
+            # legacy: strictly enough to contain the new strings and nothing else
+            new_size = curr_size + required_space if required_space is not None else curr_size * 4
+        else:
+            # double the current capacity until the new string fits
+            new_size = max(header['entry_buffer_offset'] - header['string_buffer_offset'], 16) * EXPAND_FACTOR
+            while new_size < required_size:
+                new_size *= EXPAND_FACTOR
         # build index if not built
         if table_name not in self.indexes_built_tables:
             self._build_table_index(binary_file, table_name)
         # create temporary file
-        temp_file_path = f"{self.name}/temp_{table_name}.table"
+        temp_file_path = f"{self.name}/{table_name}.table.tmp"
         new_string_buffer_offset = header['string_buffer_offset']
         new_entry_buffer_offset = new_string_buffer_offset + new_size
-        # write header
-        with open(temp_file_path, "wb+") as temp_f:
-            temp_binary = BinaryFile(temp_f)
-            # write magic constant
+        # write the temp file unbuffered, so the bulk copies can be done by the kernel
+        with self._instrument(BinaryFile(open(temp_file_path, "wb+", buffering=0))) as temp_binary:
+            # write header
             new_string_buffer_offset, new_entry_buffer_offset = self._write_header(
                 temp_binary, 
                 self.tables[table_name], 
@@ -432,198 +1238,567 @@ class Database:
                 new_entry_buffer_offset,
                 header['string_buffer_first_available_position']
             )
-            # initialize buffers
-            self._initialize_string_buffer(temp_binary, new_string_buffer_offset, new_size)
-            self._initialize_entry_buffer(temp_binary, new_entry_buffer_offset)
-            # map of old string positions to new positions
-            string_position_map = {}
-            current_pos = header['string_buffer_offset']
-            new_pos = new_string_buffer_offset
-            # traverse valid strings in original file
-            while current_pos < header['string_buffer_first_available_position']:
-                try:
-                    binary_file.goto(current_pos)
-                    # read string length
-                    str_len = binary_file.read_integer(2)
-                    # record mapping of old position to new position
-                    string_position_map[current_pos] = new_pos
-                    # copy string to new buffer
-                    binary_file.goto(current_pos)
-                    # read the string manually to avoid issues with read_string
-                    temp_binary.goto(new_pos)
-                    temp_binary.write_integer(str_len, 2)  # write length
-                    # copy the string bytes directly
-                    binary_file.goto(current_pos + 2)  # skip length bytes                    
-                    for i in range(str_len):
-                        try:
-                            byte_val = binary_file.read_integer(1)
-                            temp_binary.write_integer(byte_val, 1)
-                        except Exception as e:
-                            print(f"[DEBUG EXPAND] Error copying byte {i}: {e}")
-                            raise IOError(f"Error copying string byte {i}: {e}")
-                            # fill the rest with zeros
-                            for j in range(i, str_len):
-                                temp_binary.write_integer(0, 1)
-                            break
-                    # update positions
-                    current_pos += 2 + str_len  # 2 bytes for length + string bytes
-                    new_pos += 2 + str_len
-                except Exception as e:
-                    raise IOError(f"Error processing string at pos {current_pos}: {e}")
-            # simply copy all entries to temp file from new entry buffer offset
-            self._copy_entries(binary_file, temp_binary, new_entry_buffer_offset, string_position_map)
+            # the string buffer keeps its offset: strings are copied as one block and keep their positions
+            used_size = header['string_buffer_first_available_position'] - header['string_buffer_offset']
+            temp_binary.goto(new_string_buffer_offset)
+            if self.transaction_files is None:
+                temp_binary.copy_from(binary_file, header['string_buffer_offset'], used_size)
+            else:
+                # the writes of the transaction must not reach the file
+                binary_file.goto(header['string_buffer_offset'])
+                temp_binary.write_bytes(binary_file.read_bytes(used_size))
+            # rest of the string buffer, zeros left to the file system
+            temp_binary.extend(new_entry_buffer_offset)
+            # copy the entry buffer after it
+            self._copy_entries(binary_file, temp_binary, table_name, new_entry_buffer_offset)
         
+        new_header = self._replace_table_file(binary_file, table_name, temp_file_path, header)
+        return new_header, binary_file
+
+    def _replace_table_file(self, binary_file: BinaryFile, table_name: str, temp_file_path: str, header: dict, string_map: dict[int, int] = None) -> dict:
+        """
+            Replaces the file of a table by a rewritten one and reopens binary_file on it.
+            The in-memory record positions follow the entry buffer. The string
+            buffer keeps its offset: the string lookup is unchanged, or follows
+            string_map if the strings were moved.
+            :param binary_file: binary file of the table, reopened in place
+            :param table_name: name of the table
+            :param temp_file_path: path of the rewritten table
+            :param header: header of the table before the rewrite
+            :param string_map: old -> new position of the kept strings, None if they did not move
+            :return: header of the rewritten table
+        """
+        # the changes not committed yet are in the rewritten file
+        if binary_file.journal is not None:
+            binary_file.journal.discard()
+        if self.transaction_files is not None:
+            binary_file.file.discard()
+        binary_file.close()
         # replace original file with temp file
-        binary_file.file.close()
-        os.remove(f"{self.name}/{table_name}.table")
-        shutil.move(temp_file_path, f"{self.name}/{table_name}.table")
+        self._install_table_file(table_name, temp_file_path)
+        if self.page_cache is not None:
+            # the pages of the table no longer match its file
+            self.page_cache.invalidate(f"{self.name}/{table_name}.table")
         # reopen the file
-        f = open(f"{self.name}/{table_name}.table", "rb+")
-        binary_file.__init__(f)
+        binary_file.__init__(self._table_file(table_name))
+        self._instrument(binary_file)
+        self._journal(binary_file, table_name)
+        if self.transaction_files is None:
+            binary_file.preallocate(self.preallocate_extent, self.preallocate_ratio)
         # create a new header dictionary with the correct values
         new_header = self._parse_header(binary_file)
-        # rebuild string lookup with the correct header values
-        self.string_lookup = {}
-        self._build_string_lookup(binary_file, new_header)
-        return new_header, binary_file
+        self.table_meta[table_name] = TableMeta(new_header, self._parse_entry_header(binary_file, new_header),
+                                                self._signature_end(new_header['signature']))
+        # the records moved with the entry buffer
+        delta = new_header['entry_buffer_offset'] - header['entry_buffer_offset']
+        entry_positions = self.entry_positions[table_name]
+        for entry_id in entry_positions:
+            entry_positions[entry_id] += delta
+        if string_map is not None and table_name in self.string_lookup:
+            self.string_lookup[table_name] = {
+                string: [string_map[position], count]
+                for string, (position, count) in self.string_lookup[table_name].items()
+                if position in string_map
+            }
+        return new_header
+
+    def _install_table_file(self, table_name: str, temp_file_path: str) -> None:
+        """
+            Moves a new file of a table into place, atomically: a crash leaves
+            either the old file or the new one. During a transaction, the file the
+            table had before it is kept until it ends.
+            With the write-ahead log, the new file is synced first and the log is
+            checkpointed, as its records are positions in the old file.
+            :param table_name: name of the table
+            :param temp_file_path: path of the new file
+        """
+        if self.wal is not None:
+            sync_file(temp_file_path)
+            self.checkpoint()
+        if self.transaction_files is not None and table_name not in self.transaction_backups:
+            # restored if the transaction is rolled back
+            os.replace(f"{self.name}/{table_name}.table", f"{self.name}/{table_name}.table.bak")
+            self.transaction_backups.add(table_name)
+        os.replace(temp_file_path, f"{self.name}/{table_name}.table")
+        if self.wal is not None:
+            sync_file(self.name)
+
+    @instrumented
+    def _reclaim_strings(self, binary_file: BinaryFile, table_name: str) -> bool:
+        """
+            Rewrites the string buffer of a compacted table without its unreferenced
+            strings, once they take half of the used buffer or more. The capacity shrinks to
+            the smallest power of 2 holding the kept strings, the records are copied
+            by blocks with their string pointers moved.
+            :param binary_file: binary file of the table, reopened if rewritten
+            :param table_name: name of the table
+            :return: True if the table was rewritten
+        """
+        codec = self.codecs[table_name]
+        meta = self._table_meta(binary_file, table_name)
+        header, entry_header = meta.header, meta.entry_header
+        used_size = header['string_buffer_first_available_position'] - header['string_buffer_offset']
+        if used_size == 0:
+            return False
+        strings = self._read_string_buffer(binary_file, header)
+        # strings pointed to by the records, all live and contiguous after a compaction
+        referenced = set()
+        records_start = meta.records_start
+        records_per_chunk = max(1, COPY_CHUNK // codec.size)
+        with binary_file.unchecked():
+            for first in range(0, entry_header['nentries'], records_per_chunk):
+                count = min(records_per_chunk, entry_header['nentries'] - first)
+                binary_file.goto(records_start + first * codec.size)
+                values = array('i')
+                values.frombytes(binary_file.read_bytes(count * codec.size))
+                if sys.byteorder == 'big':
+                    values.byteswap()
+                for _, slot in codec.string_slots:
+                    referenced.update(values[slot::codec.length])
+        if not referenced.issubset(strings):
+            # pointers not at the start of a string: leave the buffer as it is
+            print(f"Warning: Table {table_name} has string pointers outside of its string buffer, strings not reclaimed")
+            return False
+        encoded = {position: strings[position].encode('utf-8') for position in sorted(referenced)}
+        kept_size = sum(len(string_bytes) + 2 for string_bytes in encoded.values())
+        if (used_size - kept_size) * 2 < used_size:
+            return False
+        capacity = 16
+        while capacity < kept_size:
+            capacity *= EXPAND_FACTOR
+        # kept strings in their order, old -> new position
+        string_map = {}
+        blob = bytearray()
+        for position, string_bytes in encoded.items():
+            string_map[position] = header['string_buffer_offset'] + len(blob)
+            blob += len(string_bytes).to_bytes(2, 'little') + string_bytes
+        temp_file_path = f"{self.name}/{table_name}.table.tmp"
+        with self._instrument(BinaryFile(open(temp_file_path, "wb+", buffering=0))) as temp_binary:
+            string_buffer_offset, entry_buffer_offset = self._write_header(
+                temp_binary,
+                self.tables[table_name],
+                header['string_buffer_offset'],
+                header['string_buffer_offset'] + capacity,
+                header['string_buffer_offset'] + kept_size
+            )
+            temp_binary.goto(string_buffer_offset)
+            temp_binary.write_bytes(bytes(blob))
+            temp_binary.extend(entry_buffer_offset)
+            self._copy_entries(binary_file, temp_binary, table_name, entry_buffer_offset, string_map)
+        self._replace_table_file(binary_file, table_name, temp_file_path, header, string_map)
+        self.string_spaces[table_name] = StringSpace()
+        return True
+
+    def _needs_compaction(self, binary_file: BinaryFile, table_name: str) -> bool:
+        """
+            Checks whether the proportion of live entries among the record slots
+            of a table dropped to COMPACTION_THRESHOLD or below.
+            :param binary_file: binary file of the table
+            :param table_name: name of the table
+            :return: True if the table must be compacted
+        """
+        meta = self._table_meta(binary_file, table_name)
+        slots = (binary_file.get_size() - meta.records_start) // self.codecs[table_name].size
+        return slots > 0 and meta.entry_header['nentries'] <= slots * COMPACTION_THRESHOLD
 
-    def _copy_entries(self, binary_file: BinaryFile, temp_binary: BinaryFile, new_entry_buffer_offset: int, string_position_map: dict[int, int]) -> None:
+    def _compaction_plan(self, table_name: str, records_start: int, records_end: int) -> tuple[list[int], list[int]]:
         """
-            Copies all entries from the original file to the temp file.
-            Also handles string pointers to new positions. Called after expanding the string buffer.
+            Lists the moves compacting a table: the live records past records_end
+            go to the dead slots before it.
+            :param table_name: name of the table
+            :param records_start: position of the first record slot
+            :param records_end: end of the slots of the compacted table
+            :return: dead slots (descending) and live records (ascending), both consumed from the end
+        """
+        size = self.codecs[table_name].size
+        live = set(self.entry_positions[table_name].values())
+        holes = [position for position in range(records_end - size, records_start - 1, -size) if position not in live]
+        tails = sorted(position for position in live if position >= records_end)
+        return holes, tails
+
+    @instrumented
+    def _copy_entries(self, binary_file: BinaryFile, temp_binary: BinaryFile, table_name: str, new_entry_buffer_offset: int, string_map: dict[int, int] = None) -> None:
+        """
+            Copies the entry buffer (mini header and records) from the original file
+            to the temp file, at its new offset. Called after expanding the string buffer.
+            The records are moved by blocks of COPY_CHUNK bytes, only their prev/next
+            pointers are patched (string pointers are unchanged, the string buffer
+            keeps its offset, unless string_map moves them).
             
             :param binary_file: Original binary file
             :param temp_binary: Temporary binary file to write to
+            :param table_name: name of the table
             :param new_entry_buffer_offset: New offset where entries should start in temp file
-            :param string_position_map: Mapping of old string positions to new positions
-        """
-        # get entry header from original file
-        header = self._parse_header(binary_file)
-        entry_header = self._parse_entry_header(binary_file, header)        
-        # if no entries -> write the entry header and return
-        if entry_header['nentries'] == 0 or entry_header['first_entry_pointer'] == -1:
-            temp_binary.goto(new_entry_buffer_offset)
-            temp_binary.write_integer(entry_header['last_used_id'], 4)
-            temp_binary.write_integer(0, 4)  # no entries
-            temp_binary.write_integer(-1, 4)  # first entry pointer
-            temp_binary.write_integer(-1, 4)  # last entry pointer
-            temp_binary.write_integer(-1, 4)  # reserved pointer
-            return
-        # read all entries into memory
-        entries = []
-        entry_size = 4 + len(header['signature']) * 4 + 8  # ID + fields + prev/next pointers
-        # traverse all entries in original file
-        current_pos = entry_header['first_entry_pointer']
-        visited_positions = set()  # Keep track of positions we've already visited
-        max_entries = entry_header['nentries'] * 2  # Safety limit - should never need more than this
-        entry_count = 0
-        try:
-            while current_pos != -1 and current_pos not in visited_positions and entry_count < max_entries:
-                visited_positions.add(current_pos)
-                entry_count += 1
-                # check if position is valid
-                if current_pos < 0 or current_pos >= binary_file.get_size():
-                    print(f"Warning: Invalid entry position {current_pos}, breaking loop")
-                    break
-                # read entry data
-                entry_data = {}
-                entry_data['position'] = current_pos
-                # read entry id
-                binary_file.goto(current_pos)
-                entry_data['id'] = binary_file.read_integer(4)
-                # read field values
-                entry_data['fields'] = []
-                for field_name, field_type in header['signature']:
-                    if field_type == FieldType.INTEGER:
-                        value = binary_file.read_integer(4)
-                        entry_data['fields'].append((field_name, field_type, value))
-                    elif field_type == FieldType.STRING:
-                        old_string_pos = binary_file.read_integer(4)
-                        new_string_pos = string_position_map.get(old_string_pos, -1)
-                        entry_data['fields'].append((field_name, field_type, new_string_pos))
-                # read previous pointer
-                entry_data['prev_pointer'] = binary_file.read_integer(4)
-                # read next pointer
-                next_ptr = binary_file.read_integer(4)
-                entry_data['next_pointer'] = next_ptr
-                # add entry to list
-                entries.append(entry_data)
-                # move to next entry
-                current_pos = next_ptr
-        except Exception as e:
-            print(f"Error reading entries: {e}")
-            # continue with retrieved entries so far
-        # write the entry header to temp file
+            :param string_map: old -> new position of the strings moved in the string buffer
+        """
+        # entry header of the original file
+        meta = self._table_meta(binary_file, table_name)
+        header, entry_header = meta.header, meta.entry_header
+        # distance the entry buffer moves
+        delta = new_entry_buffer_offset - header['entry_buffer_offset']
+        # write the entry header with its pointers moved (-1 stays -1)
         temp_binary.goto(new_entry_buffer_offset)
-        temp_binary.write_integer(entry_header['last_used_id'], 4)
-        temp_binary.write_integer(len(entries), 4)  # number of entries we actually read
-        # calculate new positions for entries
-        first_entry_pos = new_entry_buffer_offset + 20  # 20 bytes for entry header
-        # write entries to temp file
-        prev_entry_pos = -1
-        for i, entry_data in enumerate(entries):
-            new_entry_pos = first_entry_pos + (i * entry_size)  
-            # ensure new position is reachable in temp_binary
-            temp_file_size = temp_binary.get_size()
-            if new_entry_pos >= temp_file_size:
-                # need to extend the temp file
-                temp_binary.goto(temp_file_size)
-                # write zeros to extend the file
-                fill_size = new_entry_pos - temp_file_size
-                for _ in range(fill_size):
-                    temp_binary.write_integer(0, 1)            
-            # write entry ID
-            temp_binary.goto(new_entry_pos)
-            temp_binary.write_integer(entry_data['id'], 4)
-            # write field values
-            for field_name, field_type, value in entry_data['fields']:
-                temp_binary.write_integer(value, 4)
-            # write previous pointer
-            if i == 0:
-                temp_binary.write_integer(-1, 4)  # first entry
-            else:
-                temp_binary.write_integer(prev_entry_pos, 4)
-            # write next pointer
-            if i == len(entries) - 1:
-                temp_binary.write_integer(-1, 4)  # last entry
-            else:
-                next_entry_pos = new_entry_pos + entry_size
-                temp_binary.write_integer(next_entry_pos, 4)
-            # update prev_entry_pos for next iteration
-            prev_entry_pos = new_entry_pos
-        # update entry header pointers
-        temp_binary.goto(new_entry_buffer_offset + 8)  # skip last_used_id and nentries
-        if len(entries) > 0:
-            temp_binary.write_integer(first_entry_pos, 4)  # first entry pointer
-            last_entry_pos = first_entry_pos + ((len(entries) - 1) * entry_size)
-            temp_binary.write_integer(last_entry_pos, 4)  # last entry pointer
-        else:
-            temp_binary.write_integer(-1, 4)  # first entry pointer
-            temp_binary.write_integer(-1, 4)  # last entry pointer
-        # write reserved pointer
-        temp_binary.write_integer(entry_header['reserved_pointer'], 4)  # reserved pointer
+        temp_binary.write_integers((
+            entry_header['last_used_id'],
+            entry_header['nentries'],
+            *(pointer + delta if pointer != -1 else -1 for pointer in (
+                entry_header['first_entry_pointer'],
+                entry_header['last_entry_pointer'],
+                entry_header['reserved_pointer'])),
+        ), 4)
+        # records, by blocks of whole records
+        codec = self.codecs[table_name]
+        records_start = meta.records_start
+        nrecords = (binary_file.get_size() - records_start) // codec.size
+        records_per_chunk = max(1, COPY_CHUNK // codec.size)
+        prev_slots = slice(codec.length - 2, None, codec.length)
+        next_slots = slice(codec.length - 1, None, codec.length)
+        with binary_file.unchecked():
+            for first in range(0, nrecords, records_per_chunk):
+                count = min(records_per_chunk, nrecords - first)
+                binary_file.goto(records_start + first * codec.size)
+                values = array('i')
+                values.frombytes(binary_file.read_bytes(count * codec.size))
+                if sys.byteorder == 'big':
+                    values.byteswap()
+                # move the prev/next pointers with the records, except the -1 (no record)
+                for slots in (prev_slots, next_slots):
+                    pointers = values[slots]
+                    moved = array('i', map(delta.__add__, pointers))
+                    try:
+                        end = pointers.index(-1)
+                        while True:
+                            moved[end] = -1
+                            end = pointers.index(-1, end + 1)
+                    except ValueError:
+                        pass
+                    values[slots] = moved
+                if string_map is not None:
+                    for _, slot in codec.string_slots:
+                        slots = slice(slot, None, codec.length)
+                        values[slots] = array('i', (string_map.get(pointer, pointer) for pointer in values[slots]))
+                if sys.byteorder == 'big':
+                    values.byteswap()
+                temp_binary.write_bytes(values.tobytes())
 
-    def _update_index(self, table_name: str, entry: Entry, entry_id: int) -> None:
+    def _update_index(self, table_name: str, entry: Entry, entry_id: int, position: int) -> None:
         """
             Updates the index for the given table and entry.
             :param table_name: name of the table
             :param entry: entry to be added
             :param entry_id: id of the entry
+            :param position: position of the record of the entry
         """ 
-        # get table signature
-        signature = self.tables[table_name]
-        # build index if not already built
+        # index not built yet: it will be read from the file, entry included
         if table_name not in self.indexes_built_tables:
-            self._build_table_index(binary_file, table_name)
+            return
         # update index
-        self.indexes[table_name][entry_id] = entry
-        # update field-specific indexes
+        table_index = self.indexes[table_name]
+        table_index[entry_id] = dict(entry)
+        self.entry_positions[table_name][entry_id] = position
+        # update the field indexes built
+        for field_name, value in entry.items():
+            field_index = table_index.get(field_name)
+            if field_index is not None:
+                field_index.add(value, entry_id)
+
+    def _remove_from_index(self, table_name: str, entry_id: int) -> None:
+        """
+            Removes an entry from the index of the given table.
+            :param table_name: name of the table
+            :param entry_id: id of the entry
+        """
+        table_index = self.indexes[table_name]
+        entry = table_index.pop(entry_id)
+        self.entry_positions[table_name].pop(entry_id, None)
         for field_name, value in entry.items():
-            if field_name not in self.indexes[table_name]:
-                self.indexes[table_name][field_name] = {}
-            if value not in self.indexes[table_name][field_name]:
-                self.indexes[table_name][field_name][value] = []
-            self.indexes[table_name][field_name][value].append(entry_id)
+            field_index = table_index.get(field_name)
+            if field_index is not None:
+                field_index.remove(value, entry_id)
+
+    def _lookup_ids(self, table_name: str, field_name: str, field_value: Field) -> list[int]:
+        """
+            Returns the IDs of the entries whose field has the given value, in ID order.
+            The entry ID can be used as field ('id').
+            :param table_name: name of the table (index built)
+            :param field_name: name of the field
+            :param field_value: value of the field
+            :return: list of entry IDs (empty if none)
+            :raises ValueError: if field does not exist
+        """
+        table_index = self.indexes[table_name]
+        if field_name == 'id':
+            return [field_value] if isinstance(field_value, int) and field_value in table_index else []
+        if field_name not in self.codecs[table_name].types:
+            raise ValueError(f"Field {field_name} does not exist in table {table_name}")
+        return self._field_index(table_name, field_name).get(field_value)
+
+    def _field_index(self, table_name: str, field_name: str) -> FieldIndex:
+        """
+            Returns the index of a field of a table, built from its entries on
+            the first call.
+            :param table_name: name of the table (index built)
+            :param field_name: name of the field
+            :return: index of the field
+        """
+        table_index = self.indexes[table_name]
+        field_index = table_index.get(field_name)
+        if field_index is None:
+            # the entries are kept in ID order
+            field_index = FieldIndex(((entry[field_name], entry_id) for entry_id, entry in table_index.items() if isinstance(entry_id, int)),
+                                     bitmaps=self.dense_bitmaps)
+            table_index[field_name] = field_index
+        return field_index
+
+    def _matching_entries(self, binary_file: BinaryFile, table_name: str, field_name: str, field_value: Field, limit: int = None) -> list[Entry]:
+        """
+            Returns the entries of a table whose field has the given value, with
+            their ID, in ID order. Until the index of the table is built, they are
+            read at the positions saved in the index file of the field if there is
+            one, otherwise the index is built.
+            :param binary_file: binary file of the table
+            :param table_name: name of the table
+            :param field_name: name of the field ('id' for the entry ID)
+            :param field_value: value of the field
+            :param limit: maximum number of entries returned, None for all
+            :return: list of entries (copies)
+            :raises ValueError: if field does not exist
+        """
+        if table_name not in self.indexes_built_tables:
+            index_file = self._index_file(table_name, field_name)
+            if index_file is not None:
+                strings = {}
+                return [self._read_entry(binary_file, table_name, position, strings) for position in index_file.lookup(field_value)[:limit]]
+            self._build_table_index(binary_file, table_name)
+        return self._indexed_entries(table_name, self._lookup_ids(table_name, field_name, field_value)[:limit])
+
+    def _range_entries(self, binary_file: BinaryFile, table_name: str, field_name: str, low: Field, high: Field, include_low: bool, include_high: bool) -> list[Entry]:
+        """
+            Returns the entries of a table whose field is in a range of values,
+            with their ID, in the order of the field then of the IDs (see
+            _matching_entries for the index used).
+            :param binary_file: binary file of the table
+            :param table_name: name of the table
+            :param field_name: name of the field ('id' for the entry ID)
+            :param low: smallest value, None for no lower bound
+            :param high: largest value, None for no upper bound
+            :param include_low: whether low itself is in the range
+            :param include_high: whether high itself is in the range
+            :return: list of entries (copies)
+        """
+        if table_name not in self.indexes_built_tables:
+            index_file = self._index_file(table_name, field_name)
+            if index_file is not None:
+                strings = {}
+                return [self._read_entry(binary_file, table_name, position, strings)
+                        for position in index_file.lookup_range(low, high, include_low, include_high)]
+            self._build_table_index(binary_file, table_name)
+        if field_name == 'id':
+            # no ordered index of the IDs, they are few to sort next to the entries
+            entry_ids = sorted(self.entry_positions[table_name])
+            start, end = bounds_slice(entry_ids, low, high, include_low, include_high)
+            entry_ids = entry_ids[start:end]
+        else:
+            entry_ids = self._field_index(table_name, field_name).range_ids(low, high, include_low, include_high)
+        return self._indexed_entries(table_name, entry_ids)
+
+    def _indexed_entries(self, table_name: str, entry_ids: list[int]) -> list[Entry]:
+        """
+            Returns entries of a table from its index.
+            :param table_name: name of the table (index built)
+            :param entry_ids: IDs of the entries
+            :return: list of entries (copies), with their ID
+        """
+        table_index = self.indexes[table_name]
+        entries = []
+        for entry_id in entry_ids:
+            entry = table_index[entry_id].copy()
+            # add the id field to the entry
+            entry['id'] = entry_id
+            entries.append(entry)
+        return entries
+
+    def _read_entry(self, binary_file: BinaryFile, table_name: str, position: int, strings: dict[int, str]) -> Entry:
+        """
+            Reads the entry of the record at the given position of a table file.
+            :param binary_file: binary file of the table
+            :param table_name: name of the table
+            :param position: position of the record
+            :param strings: position -> string read so far, completed with the strings of the entry
+            :return: entry, with its ID
+        """
+        codec = self.codecs[table_name]
+        binary_file.goto(position)
+        record = codec.unpack(binary_file.read_bytes(codec.size))
+        for _, slot in codec.string_slots:
+            if record[slot] not in strings:
+                strings[record[slot]] = binary_file.read_string_from(record[slot])
+        entry = codec.decode(record, strings)
+        entry['id'] = record[0]
+        return entry
+
+    def _index_file_path(self, table_name: str, field_name: str) -> str:
+        """
+            :param table_name: name of the table
+            :param field_name: name of the field ('id' for the entry IDs)
+            :return: path of the index file of the field
+        """
+        return f"{self.name}/{table_name}.{field_name}{INDEX_SUFFIX}"
+
+    def _index_file(self, table_name: str, field_name: str) -> IndexFile | None:
+        """
+            Returns the index file saved for a field of a table, mapped on the
+            first call. It is removed if it was saved from another state of the
+            table file (see _file_stamp) or cannot be read.
+            :param table_name: name of the table
+            :param field_name: name of the field ('id' for the entry IDs)
+            :return: index file, None if there is none
+        """
+        index_files = self.index_files.get(table_name)
+        if not index_files or field_name not in index_files:
+            return None
+        index_file = index_files[field_name]
+        if index_file is None:
+            path = self._index_file_path(table_name, field_name)
+            try:
+                index_file = IndexFile(path)
+            except (OSError, ValueError) as e:
+                print(f"Warning: Could not load index file {path}: {e}")
+            else:
+                if index_file.stamp != self._file_stamp(f"{self.name}/{table_name}.table"):
+                    # stale
+                    index_file.close()
+                    index_file = None
+            if index_file is None:
+                del index_files[field_name]
+                self._remove_index_file(path)
+                return None
+            index_files[field_name] = index_file
+        return index_file
+
+    def _drop_index_files(self, table_name: str) -> None:
+        """
+            Removes the index files of a table, before its file changes.
+            :param table_name: name of the table
+        """
+        for field_name, index_file in self.index_files.pop(table_name, {}).items():
+            if index_file is not None:
+                index_file.close()
+            self._remove_index_file(self._index_file_path(table_name, field_name))
+
+    @staticmethod
+    def _remove_index_file(path: str) -> None:
+        """
+            Removes an index file, if it exists.
+            :param path: path of the index file
+        """
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _save_index_files(self, table_name: str) -> None:
+        """
+            Saves the positions of the entries of a table and the indexes of its
+            fields looked up to index files, for those not saved yet.
+            The file of the table must be closed, its stamp is saved with them.
+            :param table_name: name of the table (index built)
+        """
+        stamp = self._file_stamp(f"{self.name}/{table_name}.table")
+        positions = self.entry_positions[table_name]
+        table_index = self.indexes[table_name]
+        index_files = self.index_files.setdefault(table_name, {})
+        for field_name in ('id',) + self.codecs[table_name].names:
+            if field_name in index_files:
+                continue
+            if field_name == 'id':
+                postings = {entry_id: [position] for entry_id, position in positions.items()}
+            elif field_name in table_index:
+                postings = {value: [positions[entry_id] for entry_id in entry_ids]
+                            for value, entry_ids in table_index[field_name].items()}
+            else:
+                continue
+            write_index_file(self._index_file_path(table_name, field_name), stamp, postings)
+            index_files[field_name] = None
+
+    def _validate_range(self, table_name: str, field_name: str, low: Field, high: Field) -> None:
+        """
+            Validates a range condition of a table.
+            :param table_name: name of the table
+            :param field_name: name of the field ('id' for the entry ID)
+            :param low: smallest value, None for no lower bound
+            :param high: largest value, None for no upper bound
+            :raises ValueError: if table or field does not exist, or a bound does not match the field type
+        """
+        if table_name not in self.tables:
+            raise ValueError(f"Table {table_name} does not exist")
+        if field_name != 'id' and field_name not in self.codecs[table_name].types:
+            raise ValueError(f"Field {field_name} does not exist in table {table_name}")
+        for bound in (low, high):
+            if bound is not None:
+                self._validate_field_value(table_name, field_name, bound)
+
+    def _validate_field_value(self, table_name: str, field_name: str, field_value: Field, allow_id: bool = True) -> None:
+        """
+            Validates a (field, value) pair used as condition or update of a table.
+            :param table_name: name of the table
+            :param field_name: name of the field ('id' for the entry ID if allow_id)
+            :param field_value: value of the field
+            :param allow_id: whether the entry ID is accepted as field
+            :raises ValueError: if table or field does not exist, or value does not match the field type
+        """
+        if table_name not in self.tables:
+            raise ValueError(f"Table {table_name} does not exist")
+        if field_name == 'id' and allow_id:
+            field_type = FieldType.INTEGER
+        elif field_name in self.codecs[table_name].types:
+            field_type = self.codecs[table_name].types[field_name]
+        else:
+            raise ValueError(f"Field {field_name} does not exist in table {table_name}")
+        expected = str if field_type == FieldType.STRING else int
+        if not isinstance(field_value, expected):
+            raise ValueError(f"Field {field_name} must be {expected.__name__}, got {type(field_value)}")
+        # ULDB string length constraint (0 to 32767 bytes)
+        if expected is str and len(field_value.encode('utf-8')) > 32767:
+            raise ValueError(f"UTF-8 encoded string length of field {field_name} exceeds ULDB maximum of 32,767 bytes")
+
+    def close(self) -> None:
+        """
+            Stops the background compaction and closes the table files kept open
+            by the database, then saves the indexes built to index files if
+            persist_indexes is set.
+            The database stays usable, its tables are reopened on demand.
+            :raises ValueError: during a transaction
+        """
+        if self.transaction_files is not None:
+            raise ValueError("The database cannot be closed during a transaction")
+        self.stop_compaction()
+        while self.open_files:
+            _, (binary_file, _, _) = self.open_files.popitem()
+            binary_file.close()
+        # the files may change until they are reopened
+        self.table_meta.clear()
+        if self.wal is not None:
+            self.wal.checkpoint()
+        # mapped again on demand
+        for index_files in self.index_files.values():
+            for field_name, index_file in index_files.items():
+                if index_file is not None:
+                    index_file.close()
+                    index_files[field_name] = None
+        if self.persist_indexes:
+            for table_name in self.indexes_built_tables:
+                self._save_index_files(table_name)
+
+    @staticmethod
+    def _is_field_pair(field) -> bool:
+        """
+            Checks whether a list is a single [name, type] field.
+            :param field: candidate field
+            :return: True if field is a list [name: str, type: FieldType]
+        """
+        return (isinstance(field, list) and len(field) == 2
+                and isinstance(field[0], str) and isinstance(field[1], FieldType))
 
     # TABLE MANAGEMENT FUNCTIONS
     def list_tables(self) -> list[str]:
@@ -633,20 +1808,24 @@ class Database:
         """
         return list(self.tables.keys())
 
+    @synchronized
+    @instrumented
     def create_table(self, table_name: str, *fields: TableSignature) -> None:
         """
             Creates a new table with the given name and fields.
             :param table_name: name of the table
             :param fields: fields of the table
-            :raises ValueError: if table name already exists
+            :raises ValueError: if table name already exists, or during a transaction
             :raises TypeError: if table name is not a string, fields is not a list, or fields is not a list of tuples (name, type)
         """
+        if self.transaction_files is not None:
+            raise ValueError("Tables cannot be created during a transaction")
         # check table name
         if not isinstance(table_name, str):
             raise TypeError("Table name must be a string")
         # individual tuples or a list of tuples
         field_list = []
-        if len(fields) == 1 and isinstance(fields[0], list):
+        if len(fields) == 1 and isinstance(fields[0], list) and not self._is_field_pair(fields[0]):
             # single argument provided => list
             field_list = fields[0]
         elif len(fields) == 0:
@@ -660,8 +1839,8 @@ class Database:
             raise ValueError("No fields provided")
         # check each field
         for field in field_list:
-            # check if it's a tuple
-            if not isinstance(field, tuple):
+            # check if it's a tuple (or a [name, type] list)
+            if not isinstance(field, tuple) and not self._is_field_pair(field):
                 raise TypeError(f"Field must be a tuple, got {type(field)}")
             # check if tuple has exactly 2 elements
             if len(field) != 2:
@@ -672,11 +1851,16 @@ class Database:
                 raise TypeError(f"Field name must be a string, got {type(name)}")
             if not isinstance(field_type, FieldType):
                 raise TypeError(f"Field type must be FieldType, got {type(field_type)}")
+        field_list = [tuple(field) for field in field_list]
         # check table name
         if table_name in self.tables:
             raise ValueError(f"Table {table_name} already exists")
+        # a file left open for this name is about to be overwritten
+        self._close_table(table_name)
+        self.table_meta.pop(table_name, None)
         # update tables
         self.tables[table_name] = field_list
+        self.codecs[table_name] = RecordCodec(field_list)
         table_path = f"{self.name}/{table_name}.table"
         # check database directory exists
         # TODO; create directory at init ?
@@ -688,11 +1872,9 @@ class Database:
         # TODO: ask for explanation
         if table_name == 'table' and len(field_list) == 0:
             # create a minimal valid table file with no fields
-            with open(table_path, "wb+") as f:
-                binary_file = BinaryFile(f)
+            with self._instrument(BinaryFile(self._table_file(table_name, "wb+", f"{table_path}.tmp"))) as binary_file:
                 # write magic constant
-                for b in "ULDB".encode('ascii'):
-                    binary_file.write_integer(b, 1)
+                binary_file.write_bytes("ULDB".encode('ascii'))
                 # write number of fields (0)
                 binary_file.write_integer(0, 4)
                 # write string buffer offset (20 = 4 + 4 + 12)
@@ -702,8 +1884,7 @@ class Database:
                 # write entry buffer offset (36 = 20 + 16)
                 binary_file.write_integer(36, 4)
                 # initialize string buffer (16 bytes)
-                for _ in range(16):
-                    binary_file.write_integer(0, 1)
+                binary_file.write_bytes(bytes(16))
                 # initialize entry buffer
                 # last used ID (0)
                 binary_file.write_integer(0, 4)
@@ -715,11 +1896,11 @@ class Database:
                 binary_file.write_integer(-1, 4)
                 # reserved pointer (-1)
                 binary_file.write_integer(-1, 4)
+            self._install_table_file(table_name, f"{table_path}.tmp")
             return
             
-        # write table
-        with open(table_path, "wb+") as f:
-            binary_file = BinaryFile(f)                    
+        # write table, moved into place once complete
+        with self._instrument(BinaryFile(self._table_file(table_name, "wb+", f"{table_path}.tmp"))) as binary_file:
             # write header and get offsets
             string_buffer_offset, entry_buffer_offset = self._write_header(binary_file, field_list)
             # initialize string buffer (16 bytes of zeros)
@@ -728,33 +1909,49 @@ class Database:
             self._initialize_entry_buffer(binary_file, entry_buffer_offset)
             # build table index
             self._build_table_index(binary_file, table_name)
+        self._install_table_file(table_name, f"{table_path}.tmp")
 
+    @synchronized
+    @instrumented
     def delete_table(self, table_name: str) -> None:
         """
             Deletes the table of the given name.
             :param table_name: name of the table
-            :raises ValueError: if table name does not exist
+            :raises ValueError: if table name does not exist, or during a transaction
         """
+        if self.transaction_files is not None:
+            raise ValueError("Tables cannot be deleted during a transaction")
         table_path = f"{self.name}/{table_name}.table"
         if not os.path.exists(table_path):
             # TODO: raise error or return ?
             raise ValueError(f"Table {table_name} does not exist")
+        # close the pooled file of the table before removing it
+        self._close_table(table_name)
+        self._drop_index_files(table_name)
+        # the log must not be replayed on a new table of the same name
+        if self.wal is not None:
+            self.checkpoint()
         # remove table from tables
         os.remove(table_path)
+        if self.page_cache is not None:
+            self.page_cache.invalidate(table_path)
         if table_name in self.tables:
             # remove table from tables
-            self.tables.pop(table_name)            
+            self.tables.pop(table_name)
+            self.codecs.pop(table_name, None)
         # remove table from indexes
         if table_name in self.indexes:
             self.indexes.pop(table_name)
         # remove table from indexes_built_tables
         if table_name in self.indexes_built_tables:
             self.indexes_built_tables.remove(table_name)
-        # remove table from open_files
-        # TODO: not yet implemented open_files, 
-        # still considering if we should keep some tables open
-        # if table_name in self.open_files:
-        #     self.open_files.pop(table_name)
+        # forget the backend selected for the table
+        self.table_backends.pop(table_name, None)
+        self.entry_positions.pop(table_name, None)
+        self.compaction_plans.pop(table_name, None)
+        self.string_spaces.pop(table_name, None)
+        self.string_lookup.pop(table_name, None)
+        self.table_meta.pop(table_name, None)
 
     def get_table_signature(self, table_name: str) -> TableSignature:
         """
@@ -767,6 +1964,236 @@ class Database:
             raise ValueError(f"Table {table_name} does not exist")
         return self.tables[table_name]
 
+    @instrumented
+    def build_indexes(self, *table_names: str) -> None:
+        """
+            Builds the indexes of tables and of all their fields at once, instead
+            of on their first use (e.g. to warm up a database before serving queries).
+            :param table_names: names of the tables, all of them if none is given
+            :raises ValueError: if a table does not exist
+        """
+        for table_name in table_names or list(self.tables):
+            if table_name not in self.tables:
+                raise ValueError(f"Table {table_name} does not exist")
+            with self._open_table(table_name) as binary_file:
+                if table_name not in self.indexes_built_tables:
+                    self._build_table_index(binary_file, table_name)
+                for field_name in self.codecs[table_name].names:
+                    self._field_index(table_name, field_name)
+
+    def set_table_backend(self, table_name: str, backend: type[BinaryFile]) -> None:
+        """
+            Selects the BinaryFile class used to access the file of a table,
+            e.g. MmapBinaryFile for read-heavy tables.
+            :param table_name: name of the table
+            :param backend: BinaryFile or one of its subclasses
+            :raises ValueError: if table name does not exist
+            :raises TypeError: if backend is not a BinaryFile class
+        """
+        if table_name not in self.tables:
+            raise ValueError(f"Table {table_name} does not exist")
+        if not (isinstance(backend, type) and issubclass(backend, BinaryFile)):
+            raise TypeError(f"Backend must be a BinaryFile class, got {backend}")
+        self.table_backends[table_name] = backend
+
+    def enable_wal(self, sync: str = 'group', group_size: int = 64, group_interval: float = 0.05, checkpoint_size: int = 1 << 24) -> None:
+        """
+            Logs every change to the table files in a write-ahead log before it is
+            written to them, so an operation interrupted by a crash is redone when
+            the database is loaded again. Each operation is committed as one
+            record, synced according to the sync mode: 'full' syncs every commit,
+            'group' syncs them by groups of group_size (or group_interval seconds),
+            'off' never syncs (see wal.WriteAheadLog).
+            The log is checkpointed into the table files once it reaches
+            checkpoint_size bytes, and when the database is closed.
+            The writes through the page cache or the mmap backend may reach the
+            table files before they are committed.
+            :param sync: sync mode ('full', 'group' or 'off')
+            :param group_size: number of commits synced together in 'group' mode
+            :param group_interval: longest time in seconds a commit waits for its sync in 'group' mode
+            :param checkpoint_size: size of the log in bytes triggering a checkpoint
+            :raises ValueError: if the sync mode or a group parameter is invalid
+        """
+        # the compaction thread takes the lock, it is stopped before and restarted after
+        compaction = self._pause_compaction()
+        try:
+            with self.lock:
+                if self.wal is not None:
+                    self._remove_wal()
+                wal = WriteAheadLog(f"{self.name}/{WAL_FILE}", sync, group_size, group_interval, checkpoint_size)
+                # the pooled files are reopened behind an unbounded write buffer
+                self.close()
+                self.wal = wal
+        finally:
+            if compaction is not None:
+                self.start_compaction(*compaction)
+
+    def disable_wal(self) -> None:
+        """
+            Checkpoints and removes the write-ahead log, the changes are written
+            to the table files directly again.
+        """
+        compaction = self._pause_compaction()
+        try:
+            with self.lock:
+                self._remove_wal()
+        finally:
+            if compaction is not None:
+                self.start_compaction(*compaction)
+
+    def _remove_wal(self) -> None:
+        """
+            Checkpoints and removes the write-ahead log, if any (lock held, compaction stopped).
+        """
+        if self.wal is None:
+            return
+        self.close()
+        self.wal.close()
+        os.remove(self.wal.path)
+        self.wal = None
+
+    @synchronized
+    def checkpoint(self) -> None:
+        """
+            Folds the write-ahead log into the table files: they are synced and
+            the log is emptied. Does nothing without the log.
+        """
+        if self.wal is None:
+            return
+        # committed changes still buffered in the pooled files
+        for binary_file, _, _ in self.open_files.values():
+            binary_file.flush()
+        self.wal.checkpoint()
+
+    def begin(self) -> None:
+        """
+            Starts a transaction: the changes made to the tables until commit are
+            kept in memory, each table file is written once when it is committed
+            (its header included, however many operations changed it), and are
+            dropped by rollback. The database lock is held by the calling thread
+            until then, the other threads wait for the transaction to end.
+            Tables cannot be created, deleted or compacted during a transaction,
+            the compaction of the tables it emptied is done once it is committed.
+            With the write-ahead log, a transaction is committed as a whole: it is
+            redone entirely or not at all after a crash.
+            :raises ValueError: if a transaction is already in progress
+        """
+        self.lock.acquire()
+        if self.transaction_files is not None:
+            self.lock.release()
+            raise ValueError("A transaction is already in progress")
+        self.transaction_files = {}
+        self.transaction_backups = set()
+
+    def commit(self) -> None:
+        """
+            Writes the changes of the transaction in progress to the table files
+            and ends it.
+            :raises ValueError: if no transaction is in progress
+        """
+        with self.lock:
+            if self.transaction_files is None:
+                raise ValueError("No transaction in progress")
+            try:
+                # the changes go to the log as one transaction before the files
+                logged = False
+                for binary_file in self.transaction_files.values():
+                    if binary_file.journal is not None and binary_file.journal.changes:
+                        binary_file.journal.commit()
+                        logged = True
+                if logged:
+                    self.wal.commit_transaction()
+                for table_name, binary_file in self.transaction_files.items():
+                    binary_file.close()
+                    if self.page_cache is not None:
+                        self.page_cache.invalidate(f"{self.name}/{table_name}.table")
+                for table_name in self.transaction_backups:
+                    os.remove(f"{self.name}/{table_name}.table.bak")
+                tables = list(self.transaction_files)
+            finally:
+                self.transaction_files = None
+                self.transaction_backups = set()
+                self.lock.release()
+            # compaction deferred by delete_entries
+            for table_name in tables:
+                if self.compactor is None and table_name in self.tables:
+                    with self._open_table(table_name) as binary_file:
+                        compact = self._needs_compaction(binary_file, table_name)
+                    if compact:
+                        self.compact(table_name, budget=None)
+
+    def rollback(self) -> None:
+        """
+            Drops the changes of the transaction in progress and ends it. The
+            tables are read again from their files.
+            :raises ValueError: if no transaction is in progress
+        """
+        with self.lock:
+            if self.transaction_files is None:
+                raise ValueError("No transaction in progress")
+            try:
+                for binary_file in self.transaction_files.values():
+                    if binary_file.journal is not None:
+                        binary_file.journal.discard()
+                    binary_file.file.discard()
+                    binary_file.close()
+                # the tables rewritten by the transaction get their former file back
+                for table_name in self.transaction_backups:
+                    os.replace(f"{self.name}/{table_name}.table.bak", f"{self.name}/{table_name}.table")
+                tables = list(self.transaction_files)
+            finally:
+                self.transaction_files = None
+                self.transaction_backups = set()
+                self.lock.release()
+            # the metadata and indexes followed the changes
+            for table_name in tables:
+                if self.page_cache is not None:
+                    self.page_cache.invalidate(f"{self.name}/{table_name}.table")
+                self.compaction_plans.pop(table_name, None)
+                self.table_meta.pop(table_name, None)
+                # filled on demand even if the table is not built
+                self.string_lookup.pop(table_name, None)
+                self.string_spaces.pop(table_name, None)
+                if table_name in self.indexes_built_tables:
+                    with self._open_table(table_name) as binary_file:
+                        self._build_table_index(binary_file, table_name)
+
+    @contextmanager
+    def transaction(self):
+        """
+            Runs a block of operations as a transaction: committed at the end of
+            the block, rolled back if it raises an exception.
+                with db.transaction():
+                    db.add_entry(...)
+                    db.update_entries(...)
+        """
+        self.begin()
+        try:
+            yield self
+        except BaseException:
+            self.rollback()
+            raise
+        self.commit()
+
+    def io_stats(self, reset: bool = False) -> dict[str, dict[str, int]]:
+        """
+            Returns the I/O counters of the table files per operation: each public
+            method, and the internal steps they go through named after it (e.g.
+            "add_entry/_add_strings_to_buffer/_expand_string_buffer"). The I/O of a
+            step is not counted in its caller's.
+            Instrumentation is opt-in: db.io_counters = IOStats() turns it on.
+            :param reset: set the counters back to zero after reading them
+            :return: dict of operation -> counters (calls, seeks, reads, writes,
+                     bytes_read, bytes_written, get_size), empty if not instrumented
+        """
+        if self.io_counters is None:
+            return {}
+        stats = self.io_counters.snapshot()
+        if reset:
+            self.io_counters.reset()
+        return stats
+
+    @instrumented
     def add_entry(self, table_name: str, entry: Entry) -> None:
         """
             Adds an entry to the table of the given name.
@@ -777,86 +2204,131 @@ class Database:
         """
         # arg validation
         self._validate_add_entry_args(table_name, entry)
-        # get table signature
-        signature = self.tables[table_name]
+        # get table record codec
+        codec = self.codecs[table_name]
         # open table file
-        with open(f"{self.name}/{table_name}.table", "rb+") as f:
-            binary_file = BinaryFile(f)
-            # check for new strings in entry and replace them with their string_buffer positions
-            for field_name, field_value in entry.items():
-                if isinstance(field_value, str):
-                    string_pos, header, binary_file = self._add_string_to_buffer(binary_file, field_value, table_name)
-                    entry[field_name] = string_pos
-            # read header and entry header
-            header = self._parse_header(binary_file)
-            entry_header = self._parse_entry_header(binary_file, header)
-            # build string lookup if not already built
-            if not self.string_lookup_built:
-                self._build_string_lookup(binary_file, header)
+        with self._open_table(table_name) as binary_file:
+            self._drop_index_files(table_name)
+            # store new strings and keep their string_buffer positions (the entry itself is left untouched)
+            positions, header, binary_file = self._add_strings_to_buffer(
+                binary_file, [value for value in entry.values() if isinstance(value, str)], table_name)
+            string_positions = {name: positions[value] for name, value in entry.items() if isinstance(value, str)}
+            entry_header = self._table_meta(binary_file, table_name).entry_header
             # generate unique ID for new entry
             new_id = entry_header['last_used_id'] + 1
-            # calculate entry size: ID (4 bytes) + field values (4 bytes each) + prev/next pointers (8 bytes)
-            entry_size = 4 + len(signature) * 4 + 8
-            # new entry position: add at the end for now
-            # TODO: reuse of deleted entries - use reserved_pointer 
-            # calculate new_position
-            new_position = entry_header['last_entry_pointer']
-            if new_position == -1:
-                new_position = header['entry_buffer_offset'] + 20  # 20 bytes for entry header
+            # entry size: ID (4 bytes) + field values (4 bytes each) + prev/next pointers (8 bytes)
+            entry_size = codec.size
+            # new entry position: the slot of a deleted entry if any, else the end of the file
+            free_pointer = entry_header['reserved_pointer']
+            if free_pointer != -1:
+                new_position = free_pointer
+                # pop the slot from the list of deleted entries
+                binary_file.goto(free_pointer + codec.next_offset)
+                free_pointer = binary_file.read_integer(4)
+                if free_pointer != -1:
+                    binary_file.goto(free_pointer + codec.prev_offset)
+                    binary_file.write_integer(-1, 4)
             else:
-                # if not empty add after the last one
-                new_position = entry_header['last_entry_pointer'] + entry_size
-            # ensure new position is reachable
-            current_file_size = binary_file.get_size()
-            if new_position >= current_file_size:
-                # need to extend the file
-                binary_file.goto(current_file_size)
-                # write zeros to extend the file
-                fill_size = new_position - current_file_size
-                for _ in range(fill_size):
-                    binary_file.write_integer(0, 1)
-            # seek to new_position
+                new_position = binary_file.get_size()
+            # previous pointer: the previous last entry, -1 if empty
+            prev_pointer = entry_header['last_entry_pointer'] if entry_header['nentries'] > 0 else -1
+            # next pointer: the new entry is the last one
+            next_pointer = -1
+            # write entry ID, field values and pointers in one run
             binary_file.goto(new_position)
-            # write entry ID
-            binary_file.write_integer(new_id, 4)
-            # write field values
-            for field_name, field_type in signature:
-                # TODO: maybe no need to check type?
-                binary_file.write_integer(entry[field_name], 4)
-            # write previous pointer
-            if entry_header['nentries'] > 0:
-                # point to the previous last entry
-                binary_file.write_integer(entry_header['last_entry_pointer'], 4)
-            else:
-                # if empty, point to -1
-                binary_file.write_integer(-1, 4)
-            # write next pointer: 
-            # TODO: if reserved_pointer used, next should point to correct position
-            binary_file.write_integer(-1, 4)
+            binary_file.write_bytes(codec.pack(new_id, codec.encode(entry, string_positions), prev_pointer, next_pointer))
             # if not empty update the previous last entry's next pointer
             if entry_header['nentries'] > 0:
                 # goto pos of next pointer in previous last entry
-                prev_next_ptr_pos = entry_header['last_entry_pointer'] + entry_size - 4
+                prev_next_ptr_pos = entry_header['last_entry_pointer'] + codec.next_offset
                 binary_file.goto(prev_next_ptr_pos)
                 binary_file.write_integer(new_position, 4)
             # update entry header
-            binary_file.goto(header['entry_buffer_offset'])
-            # update last used ID
-            binary_file.write_integer(new_id, 4)
-            # update number of entries
-            binary_file.write_integer(entry_header['nentries'] + 1, 4)
-            # update first entry pointer if first entry
-            if entry_header['nentries'] == 0:
-                binary_file.write_integer(new_position, 4)
-            else:
-                # first entry pointer did not change
-                first_entry_ptr = entry_header['first_entry_pointer']
-                binary_file.write_integer(first_entry_ptr, 4)
-            # update last entry pointer
-            binary_file.write_integer(new_position, 4)
+            # first entry pointer only changes for the first entry
+            first_entry_ptr = new_position if entry_header['nentries'] == 0 else entry_header['first_entry_pointer']
+            self._write_entry_header(binary_file, table_name, last_used_id=new_id, nentries=entry_header['nentries'] + 1,
+                                     first_entry_pointer=first_entry_ptr, last_entry_pointer=new_position,
+                                     reserved_pointer=free_pointer)
+            # update index
+            self._update_index(table_name, entry, new_id, new_position)
+
+    @instrumented
+    def add_entries(self, table_name: str, entries: Iterable[Entry]) -> None:
+        """
+            Adds a batch of entries to the table of the given name.
+            The whole batch is validated before anything is written, then the new
+            strings are stored with at most one expansion of the string buffer, the
+            slots of deleted entries are reused, the remaining records are written
+            contiguously at the end of the file and the entry header is updated once.
+            :param table_name: name of the table
+            :param entries: entries to be added, in order
+            :raises ValueError: if table name does not exist
+            :raises TypeError: if an entry is not a dictionary
+        """
+        # an empty batch is checked too
+        if table_name not in self.tables:
+            raise ValueError(f"Table {table_name} does not exist")
+        entries = list(entries)
+        # arg validation, for the whole batch
+        for entry in entries:
+            self._validate_add_entry_args(table_name, entry)
+        if not entries:
+            return
+        # get table record codec
+        codec = self.codecs[table_name]
+        # open table file
+        with self._open_table(table_name) as binary_file:
+            self._drop_index_files(table_name)
+            # store all new strings at once
+            positions, header, binary_file = self._add_strings_to_buffer(
+                binary_file, [value for entry in entries for value in entry.values() if isinstance(value, str)], table_name)
+            entry_header = self._table_meta(binary_file, table_name).entry_header
+            first_id = entry_header['last_used_id'] + 1
+            # slots of deleted entries first, then the end of the file
+            positions_list = []
+            free_pointer = entry_header['reserved_pointer']
+            while free_pointer != -1 and len(positions_list) < len(entries):
+                positions_list.append(free_pointer)
+                binary_file.goto(free_pointer + codec.next_offset)
+                free_pointer = binary_file.read_integer(4)
+            if positions_list and free_pointer != -1:
+                binary_file.goto(free_pointer + codec.prev_offset)
+                binary_file.write_integer(-1, 4)
+            reused = len(positions_list)
+            end = binary_file.get_size()
+            positions_list.extend(range(end, end + (len(entries) - reused) * codec.size, codec.size))
+            prev_pointer = entry_header['last_entry_pointer'] if entry_header['nentries'] > 0 else -1
+            # records linked to their neighbours in the batch
+            records = []
+            for i, entry in enumerate(entries):
+                string_positions = {name: positions[value] for name, value in entry.items() if isinstance(value, str)}
+                records.append((
+                    first_id + i,
+                    *codec.encode(entry, string_positions),
+                    positions_list[i - 1] if i > 0 else prev_pointer,
+                    positions_list[i + 1] if i + 1 < len(entries) else -1
+                ))
+            # reused slots one by one, the others contiguously by runs
+            for position, record in zip(positions_list[:reused], records):
+                binary_file.goto(position)
+                binary_file.write_bytes(codec.pack_run([record]))
+            binary_file.goto(end)
+            for run_start in range(reused, len(entries), RECORD_RUN):
+                binary_file.write_bytes(codec.pack_run(records[run_start:run_start + RECORD_RUN]))
+            # link the previous last entry to the batch
+            if entry_header['nentries'] > 0:
+                binary_file.goto(entry_header['last_entry_pointer'] + codec.next_offset)
+                binary_file.write_integer(positions_list[0], 4)
+            # update entry header
+            first_entry_ptr = positions_list[0] if entry_header['nentries'] == 0 else entry_header['first_entry_pointer']
+            self._write_entry_header(binary_file, table_name, last_used_id=first_id + len(entries) - 1,
+                                     nentries=entry_header['nentries'] + len(entries), first_entry_pointer=first_entry_ptr,
+                                     last_entry_pointer=positions_list[-1], reserved_pointer=free_pointer)
             # update index
-            self._update_index(table_name, entry, new_id)
+            for i, entry in enumerate(entries):
+                self._update_index(table_name, entry, first_id + i, positions_list[i])
 
+    @instrumented
     def get_complete_table(self, table_name: str) -> list[Entry]:
         """
             Returns the complete table of the given name.
@@ -873,8 +2345,7 @@ class Database:
         if table_name not in self.tables:
             raise ValueError(f"Table {table_name} is not registered")
         # open table file
-        with open(table_path, "rb+") as f:
-            binary_file = BinaryFile(f)
+        with self._open_table(table_name) as binary_file:
             if table_name not in self.indexes_built_tables:
                 self._build_table_index(binary_file, table_name)
             # read entries
@@ -890,6 +2361,7 @@ class Database:
             # return entries
             return entries
     
+    @instrumented
     def get_entry(self, table_name: str, field_name: str, field_value: Field) -> Entry | None:
         """
             Returns the entry of the given name and field value.
@@ -908,21 +2380,12 @@ class Database:
         if table_name not in self.tables:
             raise ValueError(f"Table {table_name} is not registered")
         # open table file
-        entry = None
-        with open(table_path, "rb+") as f:
-            binary_file = BinaryFile(f)
-            # build table index if not already built
-            if table_name not in self.indexes_built_tables:
-                self._build_table_index(binary_file, table_name)
-            # get entry ID from field-specific index
+        with self._open_table(table_name) as binary_file:
             # TODO: get first occurence or last occurence ?
-            entry_id = self.indexes[table_name][field_name][field_value][0]
-            # get entry
-            entry = self.indexes[table_name][entry_id].copy()
-            # add the id field to the entry
-            entry['id'] = entry_id
-        return entry
+            entries = self._matching_entries(binary_file, table_name, field_name, field_value, limit=1)
+        return entries[0] if entries else None
 
+    @instrumented
     def get_entries(self, table_name: str, field_name: str, field_value: Field) -> list[Entry]:
         """
             Returns the entries of the given table and field name and field value.
@@ -939,30 +2402,23 @@ class Database:
         if table_name not in self.tables:
             raise ValueError(f"Table {table_name} is not registered")
         # open table file
-        entries = []
-        with open(table_path, "rb+") as f:
-            binary_file = BinaryFile(f)
-            # build table index if not already built
-            if table_name not in self.indexes_built_tables:
-                self._build_table_index(binary_file, table_name)
-            # get entry IDs from field-specific index
-            entry_ids = self.indexes[table_name][field_name][field_value]
-            # get entries
-            for entry_id in entry_ids:
-                entry = self.indexes[table_name][entry_id].copy()
-                # Add the id field to the entry
-                entry['id'] = entry_id
-                entries.append(entry)
+        with self._open_table(table_name) as binary_file:
+            entries = self._matching_entries(binary_file, table_name, field_name, field_value)
         # return entries
         return entries
 
+    @instrumented
     def get_table_size(self, table_name: str) -> int:
         """
-            Returns the size of the table of the given name.
+            Returns the size of the table of the given name, from its metadata
+            once the table was accessed.
             :param table_name: name of the table
             :return: size of the table
         """
-        # TODO: using index could be faster
+        with self.lock:
+            meta = self.table_meta.get(table_name)
+            if meta is not None and table_name in self.tables:
+                return meta.entry_header['nentries']
         # check if table exists
         table_path = f"{self.name}/{table_name}.table"
         if not os.path.exists(table_path):
@@ -971,15 +2427,43 @@ class Database:
         if table_name not in self.tables:
             raise ValueError(f"Table {table_name} is not registered")
         # open table file
-        table_size = 0
-        with open(table_path, "rb+") as f:
-            binary_file = BinaryFile(f)
-            # get table size
-            header = self._parse_header(binary_file)
-            entry_header = self._parse_entry_header(binary_file, header)
-            table_size = entry_header['nentries']
-        return table_size
+        with self._open_table(table_name) as binary_file:
+            return self._table_meta(binary_file, table_name).entry_header['nentries']
+
+    @instrumented
+    def string_buffer_stats(self, table_name: str) -> dict[str, int | float]:
+        """
+            Returns the occupation of the string buffer of a table, to tell when
+            compacting it is worth it.
+            :param table_name: name of the table
+            :return: dict of capacity, used (up to the first available position),
+                     free (bytes of the free extents), extents (their number),
+                     largest_extent, tail (room after the first available position)
+                     and fragmentation (1 - largest_extent / free, 0.0 if nothing is free)
+            :raises ValueError: if the table does not exist
+        """
+        if table_name not in self.tables:
+            raise ValueError(f"Table {table_name} does not exist")
+        with self._open_table(table_name) as binary_file:
+            if table_name not in self.indexes_built_tables:
+                self._build_table_index(binary_file, table_name)
+            header = self._table_meta(binary_file, table_name).header
+        space = self.string_spaces[table_name]
+        capacity = header['entry_buffer_offset'] - header['string_buffer_offset']
+        used = header['string_buffer_first_available_position'] - header['string_buffer_offset']
+        free = space.free_bytes()
+        largest = space.by_size[-1][0] if space.by_size else 0
+        return {
+            'capacity': capacity,
+            'used': used,
+            'free': free,
+            'extents': len(space.extents),
+            'largest_extent': largest,
+            'tail': capacity - used,
+            'fragmentation': 1 - largest / free if free else 0.0,
+        }
     
+    @instrumented
     def select_entry(self, table_name: str, fields: tuple[str], field_name: str, field_value: Field) -> Field | tuple[Field]:
         """
             Selects the fields of the entry of the given table where fieldname has fieldvalue.
@@ -999,18 +2483,12 @@ class Database:
         # select fields
         selected_fields = []
         # open table file
-        with open(table_path, "rb+") as f:
-            binary_file = BinaryFile(f)
-            # build table index if not already built
-            if table_name not in self.indexes_built_tables:
-                self._build_table_index(binary_file, table_name)
-            # get entry ID from field-specific index
+        with self._open_table(table_name) as binary_file:
             # TODO: get first occurence or last occurence ? need a logic for this
-            entry_id = self.indexes[table_name][field_name][field_value][0]
-            # get entry
-            entry = self.indexes[table_name][entry_id].copy()
-            # Add the id field to the entry
-            entry['id'] = entry_id
+            entries = self._matching_entries(binary_file, table_name, field_name, field_value, limit=1)
+            if not entries:
+                return None
+            entry = entries[0]
             # select fields
             if len(fields) == 1:
                 selected_fields.append(entry[fields[0]])
@@ -1023,6 +2501,7 @@ class Database:
         else:
             return tuple(selected_fields)
 
+    @instrumented
     def select_entries(self, table: str, fields: tuple[str], field_name: str, field_value: Field) -> list[Field | tuple[Field]]:
         """
             Selects the fields of the entries of the given table where fieldname has fieldvalue.
@@ -1041,18 +2520,9 @@ class Database:
             raise ValueError(f"Table {table} is not registered")
         # select entries
         results = []
-        with open(table_path, "rb+") as f:
-            binary_file = BinaryFile(f)
-            # build table index if not already built
-            if table not in self.indexes_built_tables:
-                self._build_table_index(binary_file, table)
-            # get entry IDs from field-specific index
-            entry_ids = self.indexes[table][field_name][field_value]
+        with self._open_table(table) as binary_file:
             # get entries
-            for entry_id in entry_ids:
-                entry = self.indexes[table][entry_id].copy()
-                entry['id'] = entry_id
-                
+            for entry in self._matching_entries(binary_file, table, field_name, field_value):
                 if len(fields) == 1:
                     results.append(entry[fields[0]])
                 else:
@@ -1061,3 +2531,442 @@ class Database:
                         selected_fields.append(entry[field])
                     results.append(tuple(selected_fields))
         return results
+
+    @instrumented
+    def get_entries_range(self, table_name: str, field_name: str, low: Field = None, high: Field = None, include_low: bool = True, include_high: bool = True) -> list[Entry]:
+        """
+            Returns the entries of the given table whose field is in a range of
+            values, ordered by the field (then by ID), e.g. low=5 for CRED >= 5,
+            low=100, high=200 for MNEM BETWEEN 100 AND 200, and the bounds of
+            index.prefix_range with include_high=False for the strings starting
+            with a prefix. Without bounds, all the entries ordered by the field.
+            :param table_name: name of the table
+            :param field_name: name of the field ('id' for the entry ID)
+            :param low: smallest value, None for no lower bound
+            :param high: largest value, None for no upper bound
+            :param include_low: whether low itself is in the range
+            :param include_high: whether high itself is in the range
+            :return: list of entries
+            :raises ValueError: if table or field does not exist, or a bound does not match the field type
+        """
+        self._validate_range(table_name, field_name, low, high)
+        with self._open_table(table_name) as binary_file:
+            entries = self._range_entries(binary_file, table_name, field_name, low, high, include_low, include_high)
+        return entries
+
+    @instrumented
+    def select_entries_range(self, table: str, fields: tuple[str], field_name: str, low: Field = None, high: Field = None, include_low: bool = True, include_high: bool = True) -> list[Field | tuple[Field]]:
+        """
+            Selects the fields of the entries of the given table whose field is in
+            a range of values, ordered by the field (see get_entries_range).
+            :param table: name of the table
+            :param fields: fields to be selected
+            :param field_name: name of the field ('id' for the entry ID)
+            :param low: smallest value, None for no lower bound
+            :param high: largest value, None for no upper bound
+            :param include_low: whether low itself is in the range
+            :param include_high: whether high itself is in the range
+            :return: list of entries
+            :raises ValueError: if table or field does not exist, or a bound does not match the field type
+        """
+        self._validate_range(table, field_name, low, high)
+        with self._open_table(table) as binary_file:
+            entries = self._range_entries(binary_file, table, field_name, low, high, include_low, include_high)
+        if len(fields) == 1:
+            return [entry[fields[0]] for entry in entries]
+        return [tuple(entry[field] for field in fields) for entry in entries]
+
+    @instrumented
+    def find(self, table_name: str, where: dict[str, Field | list[Field]] | list[dict[str, Field | list[Field]]] = None) -> list[Entry]:
+        """
+            Returns the entries of the given table matching a condition, in ID order.
+            The condition is a dict of field -> value that the entries must all hold,
+            e.g. {'CRED': 5, 'COORD': 'G. Joret'}, a list of values matching any
+            of them; or a list of such dicts, matching the entries of any of them
+            (OR groups). No condition (None, {} or []) matches every entry.
+            The IDs holding each value are taken from the index of the field as
+            a RoaringBitmap, the smallest sets of a group are intersected first,
+            then the groups are unioned: combining selective conditions costs
+            time proportional to their entries, not to the table. Until the index
+            of the table is built, the sets are of the positions saved in the index
+            files of the fields if they all have one, and only the records found
+            are read (see _matching_entries).
+            :param table_name: name of the table
+            :param where: condition, a dict or a list of dicts of field ('id' for the entry ID) -> value or list of values
+            :return: list of entries
+            :raises ValueError: if table or a field does not exist, or a value does not match its field type
+            :raises TypeError: if the condition is not a dict or a list of dicts
+        """
+        if table_name not in self.tables:
+            raise ValueError(f"Table {table_name} does not exist")
+        groups = [where] if isinstance(where, dict) else list(where or [])
+        for group in groups:
+            if not isinstance(group, dict):
+                raise TypeError(f"A condition must be a dict of field -> value, got {type(group)}")
+            for field_name, values in group.items():
+                for value in (values if isinstance(values, (list, tuple, set)) else [values]):
+                    self._validate_field_value(table_name, field_name, value)
+        if not groups:
+            # every entry
+            groups = [{}]
+        with self._open_table(table_name) as binary_file:
+            index_files = None
+            if table_name not in self.indexes_built_tables:
+                # the entry IDs ('id') give the positions of every record
+                index_files = {field_name: self._index_file(table_name, field_name)
+                               for group in groups for field_name in (group or ('id',))}
+                if None in index_files.values():
+                    index_files = None
+                    self._build_table_index(binary_file, table_name)
+            found = RoaringBitmap()
+            for group in groups:
+                if not group:
+                    if index_files is not None:
+                        found = RoaringBitmap.from_ids(sorted(index_files['id'].lookup_range()))
+                    else:
+                        found = RoaringBitmap.from_ids(sorted(self.entry_positions[table_name]))
+                    break
+                bitmaps = []
+                for field_name, values in group.items():
+                    index_file = index_files[field_name] if index_files is not None else None
+                    if isinstance(values, (list, tuple, set)):
+                        bitmap = RoaringBitmap()
+                        for value in values:
+                            bitmap = bitmap | self._id_bitmap(table_name, field_name, value, index_file)
+                    else:
+                        bitmap = self._id_bitmap(table_name, field_name, values, index_file)
+                    bitmaps.append(bitmap)
+                # the smallest first, each intersection is at most its size
+                bitmaps.sort(key=len)
+                matching = bitmaps[0]
+                for bitmap in bitmaps[1:]:
+                    if not matching.chunks:
+                        break
+                    matching = matching & bitmap
+                found = found | matching
+            if index_files is None:
+                return self._indexed_entries(table_name, found)
+            # in the order of the positions
+            strings = {}
+            entries = [self._read_entry(binary_file, table_name, position, strings) for position in found]
+            entries.sort(key=lambda entry: entry['id'])
+            return entries
+
+    def _id_bitmap(self, table_name: str, field_name: str, field_value: Field, index_file: IndexFile = None) -> RoaringBitmap:
+        """
+            Returns the IDs of the entries whose field has the given value, or
+            the positions of their records if an index file of the field is given.
+            :param table_name: name of the table (index built without index file)
+            :param field_name: name of the field ('id' for the entry ID)
+            :param field_value: value of the field
+            :param index_file: index file of the field, None to use the index of the table
+            :return: IDs or positions as a RoaringBitmap
+        """
+        if index_file is not None:
+            return RoaringBitmap.from_ids(sorted(index_file.lookup(field_value)))
+        if field_name == 'id':
+            return RoaringBitmap.from_ids(self._lookup_ids(table_name, field_name, field_value))
+        return self._field_index(table_name, field_name).bitmap(field_value)
+
+    @instrumented
+    def get_field_bounds(self, table_name: str, field_name: str) -> tuple[Field, Field] | None:
+        """
+            Returns the smallest and largest values of a field of the given table.
+            :param table_name: name of the table
+            :param field_name: name of the field ('id' for the entry ID)
+            :return: (minimum, maximum), None if the table is empty
+            :raises ValueError: if table or field does not exist
+        """
+        self._validate_range(table_name, field_name, None, None)
+        with self._open_table(table_name) as binary_file:
+            if table_name not in self.indexes_built_tables:
+                self._build_table_index(binary_file, table_name)
+            if field_name == 'id':
+                entry_ids = self.entry_positions[table_name]
+                return (min(entry_ids), max(entry_ids)) if entry_ids else None
+            field_index = self._field_index(table_name, field_name)
+            return (field_index.min(), field_index.max()) if len(field_index) else None
+
+    @instrumented
+    def update_entries(self, table_name: str, cond_name: str, cond_value: Field, update_name: str, update_value: Field) -> bool:
+        """
+            Sets the field update_name to update_value for every entry of the table
+            whose field cond_name has the value cond_value.
+            Records are updated in place: the entry IDs and positions are preserved.
+            :param table_name: name of the table
+            :param cond_name: name of the field of the condition ('id' for the entry ID)
+            :param cond_value: value of the field of the condition
+            :param update_name: name of the updated field
+            :param update_value: new value of the field
+            :return: True if at least one entry was updated, False otherwise
+            :raises ValueError: if table or fields do not exist, or a value does not match its field type
+        """
+        # arg validation
+        self._validate_field_value(table_name, cond_name, cond_value)
+        self._validate_field_value(table_name, update_name, update_value, allow_id=False)
+        codec = self.codecs[table_name]
+        with self._open_table(table_name) as binary_file:
+            # build table index if not already built
+            if table_name not in self.indexes_built_tables:
+                self._build_table_index(binary_file, table_name)
+            entry_ids = list(self._lookup_ids(table_name, cond_name, cond_value))
+            if not entry_ids:
+                return False
+            table_index = self.indexes[table_name]
+            # entries already holding the value are left as they are
+            entry_ids = [entry_id for entry_id in entry_ids if table_index[entry_id][update_name] != update_value]
+            if not entry_ids:
+                return True
+            self._drop_index_files(table_name)
+            field_index = table_index.get(update_name)
+            entry_positions = self.entry_positions[table_name]
+            offset = codec.offset(update_name)
+            # slot value: the integer itself or the position of the string
+            slot = update_value
+            if isinstance(update_value, str):
+                # strings no entry holds after the update are freed first, the new one can take their space
+                released = {}
+                for entry_id in entry_ids:
+                    old_value = table_index[entry_id][update_name]
+                    released[old_value] = released.get(old_value, 0) + 1
+                self._release_strings(binary_file, table_name, released)
+                positions, _, binary_file = self._add_strings_to_buffer(binary_file, [update_value] * len(entry_ids), table_name)
+                slot = positions[update_value]
+            for entry_id in entry_ids:
+                # write the slot in place
+                binary_file.goto(entry_positions[entry_id] + offset)
+                binary_file.write_integer(slot, 4)
+                # move the entry to its new value in the field index, if built
+                entry = table_index[entry_id]
+                if field_index is not None:
+                    field_index.remove(entry[update_name], entry_id)
+                    field_index.add(update_value, entry_id)
+                entry[update_name] = update_value
+        return True
+
+    @instrumented
+    def delete_entries(self, table_name: str, field_name: str, field_value: Field) -> bool:
+        """
+            Deletes every entry of the table whose field has the given value.
+            Each record is unlinked from the list of entries in constant time and
+            pushed onto the list of deleted entries, rooted at the reserved pointer
+            of the entry header, whose slots are reused by the next insertions.
+            The table is compacted once half of its slots or more are deleted
+            (by the background compaction if it is running).
+            :param table_name: name of the table
+            :param field_name: name of the field ('id' for the entry ID)
+            :param field_value: value of the field
+            :return: True if at least one entry was deleted, False otherwise
+            :raises ValueError: if table or field does not exist, or value does not match the field type
+        """
+        # arg validation
+        self._validate_field_value(table_name, field_name, field_value)
+        codec = self.codecs[table_name]
+        with self._open_table(table_name) as binary_file:
+            # build table index if not already built
+            if table_name not in self.indexes_built_tables:
+                self._build_table_index(binary_file, table_name)
+            entry_ids = list(self._lookup_ids(table_name, field_name, field_value))
+            if not entry_ids:
+                return False
+            self._drop_index_files(table_name)
+            entry_header = self._table_meta(binary_file, table_name).entry_header
+            first_pointer = entry_header['first_entry_pointer']
+            last_pointer = entry_header['last_entry_pointer']
+            free_pointer = entry_header['reserved_pointer']
+            entry_positions = self.entry_positions[table_name]
+            table_index = self.indexes[table_name]
+            # string -> number of string fields of the deleted entries holding it
+            released = {}
+            for entry_id in entry_ids:
+                position = entry_positions[entry_id]
+                binary_file.goto(position)
+                record = codec.unpack(binary_file.read_bytes(codec.size))
+                prev_pointer, next_pointer = record[-2], record[-1]
+                for name, _ in codec.string_slots:
+                    value = table_index[entry_id][name]
+                    released[value] = released.get(value, 0) + 1
+                # unlink the record from its neighbours
+                if prev_pointer == -1:
+                    first_pointer = next_pointer
+                else:
+                    binary_file.goto(prev_pointer + codec.next_offset)
+                    binary_file.write_integer(next_pointer, 4)
+                if next_pointer == -1:
+                    last_pointer = prev_pointer
+                else:
+                    binary_file.goto(next_pointer + codec.prev_offset)
+                    binary_file.write_integer(prev_pointer, 4)
+                # push the slot onto the list of deleted entries
+                self._push_free_slot(binary_file, codec, position, free_pointer)
+                free_pointer = position
+                self._remove_from_index(table_name, entry_id)
+            self._write_entry_header(binary_file, table_name, nentries=entry_header['nentries'] - len(entry_ids),
+                                     first_entry_pointer=first_pointer, last_entry_pointer=last_pointer,
+                                     reserved_pointer=free_pointer)
+            # strings no entry holds anymore
+            self._release_strings(binary_file, table_name, released)
+            # the format requires re-encoding a table with half of its slots or more deleted
+            compact = self.compactor is None and self.transaction_files is None and self._needs_compaction(binary_file, table_name)
+        if compact:
+            self.compact(table_name, budget=None)
+        return True
+
+    @synchronized
+    @instrumented
+    def compact(self, table_name: str, budget: int | None = RECORD_RUN, time_budget: float | None = None) -> bool:
+        """
+            Runs one step of the incremental compaction of a table: moves up to
+            budget live records (all if None), or as many as fit in time_budget
+            seconds, from the end of the file into the slots of deleted entries.
+            Each move rewrites the record in its new slot and relinks its
+            neighbours, the moved-from slot joins the deleted entries, so the
+            table stays consistent (and readable) between steps.
+            Once no live record is left past the first nentries slots, the file
+            is truncated after them and the unreferenced strings are reclaimed.
+            :param table_name: name of the table
+            :param budget: maximum number of records moved by this step, None for no limit
+            :param time_budget: maximum duration of this step in seconds, None for no limit
+            :return: True if the table is compacted, False if more steps are needed
+            :raises ValueError: if table name does not exist, or during a transaction
+        """
+        if table_name not in self.tables:
+            raise ValueError(f"Table {table_name} does not exist")
+        if self.transaction_files is not None:
+            raise ValueError("Tables cannot be compacted during a transaction")
+        codec = self.codecs[table_name]
+        deadline = time.perf_counter() + time_budget if time_budget is not None else None
+        with self._open_table(table_name) as binary_file:
+            self._drop_index_files(table_name)
+            # build table index if not already built
+            if table_name not in self.indexes_built_tables:
+                self._build_table_index(binary_file, table_name)
+            meta = self._table_meta(binary_file, table_name)
+            entry_header = meta.entry_header
+            records_start = meta.records_start
+            records_end = records_start + entry_header['nentries'] * codec.size
+            holes, tails = self.compaction_plans.get(table_name) or self._compaction_plan(table_name, records_start, records_end)
+            first_pointer = entry_header['first_entry_pointer']
+            last_pointer = entry_header['last_entry_pointer']
+            free_pointer = entry_header['reserved_pointer']
+            entry_positions = self.entry_positions[table_name]
+            moved = 0
+            while holes and tails and (budget is None or moved < budget) and (deadline is None or time.perf_counter() < deadline):
+                hole, tail = holes.pop(), tails.pop()
+                # the table may have changed since the plan was made
+                binary_file.goto(tail)
+                record = codec.unpack(binary_file.read_bytes(codec.size))
+                if entry_positions.get(record[0]) != tail:
+                    holes.append(hole)
+                    continue
+                binary_file.goto(hole)
+                if entry_positions.get(binary_file.read_integer(4)) == hole or hole > tail:
+                    tails.append(tail)
+                    continue
+                # the dead slot leaves the list of deleted entries and receives the record
+                free_pointer = self._unlink_free_slot(binary_file, codec, hole, free_pointer)
+                binary_file.goto(hole)
+                binary_file.write_bytes(codec.pack_run([record]))
+                # relink its neighbours
+                prev_pointer, next_pointer = record[-2], record[-1]
+                if prev_pointer == -1:
+                    first_pointer = hole
+                else:
+                    binary_file.goto(prev_pointer + codec.next_offset)
+                    binary_file.write_integer(hole, 4)
+                if next_pointer == -1:
+                    last_pointer = hole
+                else:
+                    binary_file.goto(next_pointer + codec.prev_offset)
+                    binary_file.write_integer(hole, 4)
+                # the old slot is now a deleted one
+                self._push_free_slot(binary_file, codec, tail, free_pointer)
+                free_pointer = tail
+                entry_positions[record[0]] = hole
+                moved += 1
+                if moved % RECORD_RUN == 0:
+                    # scattered writes: keep the pending ones few
+                    binary_file.flush()
+            if holes and tails:
+                self._write_entry_header(binary_file, table_name, first_entry_pointer=first_pointer,
+                                         last_entry_pointer=last_pointer, reserved_pointer=free_pointer)
+                self.compaction_plans[table_name] = (holes, tails)
+                return False
+            self.compaction_plans.pop(table_name, None)
+            # the plan is exhausted: done if no live record is left past the end
+            if self._compaction_plan(table_name, records_start, records_end)[1]:
+                self._write_entry_header(binary_file, table_name, first_entry_pointer=first_pointer,
+                                         last_entry_pointer=last_pointer, reserved_pointer=free_pointer)
+                return False
+            # every slot before the end is live, the deleted ones all follow it
+            self._write_entry_header(binary_file, table_name, first_entry_pointer=first_pointer,
+                                     last_entry_pointer=last_pointer, reserved_pointer=-1)
+            binary_file.truncate(records_end)
+            self._reclaim_strings(binary_file, table_name)
+        return True
+
+    def start_compaction(self, budget: int = RECORD_RUN, interval: float = 0.01) -> None:
+        """
+            Starts a background thread compacting the tables with half of their
+            slots or more deleted, by steps of budget records every interval
+            seconds. Meanwhile delete_entries leaves the compaction to it.
+            :param budget: number of records moved per step
+            :param interval: pause between two rounds over the tables, in seconds
+        """
+        if self.compactor is not None:
+            return
+        self.compaction_settings = (budget, interval)
+        self.compactor_stop.clear()
+        self.compactor = threading.Thread(target=self._compaction_loop, args=(budget, interval),
+                                          name=f"compaction-{self.name}", daemon=True)
+        self.compactor.start()
+
+    def stop_compaction(self) -> None:
+        """
+            Stops the background compaction thread, after its current step.
+            :raises ValueError: during a transaction, the thread waits for it to end, or
+                                if the calling thread holds the lock the thread waits for
+        """
+        if self.compactor is None:
+            return
+        if self.transaction_files is not None:
+            raise ValueError("The compaction cannot be stopped during a transaction")
+        # joining the thread would never return
+        if self.lock._is_owned():
+            raise ValueError("The compaction cannot be stopped while holding the database lock")
+        self.compactor_stop.set()
+        self.compactor.join()
+        self.compactor = None
+
+    def _pause_compaction(self) -> tuple[int, float] | None:
+        """
+            Stops the background compaction thread if it runs.
+            :return: its (budget, interval) to start it again with, None if it was not running
+        """
+        if self.compactor is None:
+            return None
+        self.stop_compaction()
+        return self.compaction_settings
+
+    def _compaction_loop(self, budget: int, interval: float) -> None:
+        """
+            Body of the background compaction thread.
+            :param budget: number of records moved per step
+            :param interval: pause between two rounds over the tables, in seconds
+        """
+        while not self.compactor_stop.is_set():
+            for table_name in list(self.tables):
+                if self.compactor_stop.is_set():
+                    break
+                try:
+                    with self.lock:
+                        if table_name not in self.tables:
+                            continue
+                        if table_name not in self.compaction_plans:
+                            with self._open_table(table_name) as binary_file:
+                                if not self._needs_compaction(binary_file, table_name):
+                                    continue
+                        self.compact(table_name, budget)
+                except Exception as e:
+                    print(f"Warning: Could not compact table {table_name}: {e}")
+            self.compactor_stop.wait(interval)
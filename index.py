@@ -0,0 +1,418 @@
+# Author: Waberi Daher
+# Matricule: 000353308
+import re
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from typing import Iterable
+
+# byte -> positions of its set bits
+BYTE_BITS = tuple(tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256))
+# IDs of a chunk of a RoaringBitmap (by their 16 high bits), and largest number
+# of IDs of a chunk kept as an array
+CHUNK_BITS = 16
+CHUNK_BYTES = (1 << CHUNK_BITS) // 8
+SPARSE_CHUNK = 4096
+# non-zero bytes of a bitset, skipped over in C
+NONZERO_BYTE = re.compile(rb'[^\x00]')
+
+
+class Bitmap:
+    """
+    Set of entry IDs as one bit per ID of its span, from a multiple of 8 at or
+    below the smallest one: 1 bit per ID instead of 32 per entry in an array,
+    for the values held by many entries (see FieldIndex).
+    """
+    def __init__(self, entry_ids: Iterable[int] = ()):
+        """
+        :param entry_ids: IDs of the entries
+        """
+        self.base = 0
+        self.bits = bytearray()
+        self.count = 0
+        for entry_id in entry_ids:
+            self.add(entry_id)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, entry_id: int) -> bool:
+        offset = entry_id - self.base
+        return 0 <= offset < 8 * len(self.bits) and bool(self.bits[offset >> 3] >> (offset & 7) & 1)
+
+    def __iter__(self):
+        """
+        Iterates over the IDs in increasing order.
+        """
+        base = self.base
+        for i, byte in enumerate(self.bits):
+            if byte:
+                for bit in BYTE_BITS[byte]:
+                    yield base + 8 * i + bit
+
+    def add(self, entry_id: int) -> None:
+        """
+        Adds an ID, the bitmap grows to cover it if needed.
+        :param entry_id: ID of the entry
+        """
+        if not self.bits:
+            self.base = entry_id & ~7
+            self.bits.append(0)
+        elif entry_id < self.base:
+            # grown in front, by whole bytes
+            grown = (self.base - (entry_id & ~7)) >> 3
+            self.bits[:0] = bytes(grown)
+            self.base -= 8 * grown
+        offset = entry_id - self.base
+        if offset >> 3 >= len(self.bits):
+            self.bits.extend(bytes((offset >> 3) + 1 - len(self.bits)))
+        mask = 1 << (offset & 7)
+        if not self.bits[offset >> 3] & mask:
+            self.bits[offset >> 3] |= mask
+            self.count += 1
+
+    def remove(self, entry_id: int) -> None:
+        """
+        Removes an ID.
+        :param entry_id: ID of the entry
+        :raises ValueError: if the ID is not in the bitmap
+        """
+        if entry_id not in self:
+            raise ValueError(f"Entry {entry_id} is not in the bitmap")
+        offset = entry_id - self.base
+        self.bits[offset >> 3] &= ~(1 << (offset & 7))
+        self.count -= 1
+
+    @property
+    def nbytes(self) -> int:
+        """
+        :return: size of the bits in bytes
+        """
+        return len(self.bits)
+
+
+class RoaringBitmap:
+    """
+    Set of entry IDs split in chunks of 65536 consecutive IDs, like a roaring
+    bitmap: a chunk of up to 4096 IDs is a sorted array of their 16 low bits, a
+    fuller one a bitset of 8192 bytes. An intersection only visits the chunks
+    of the smaller set and probes the other set with each ID of a sparse
+    chunk, a union merges the chunks; two bitsets are combined at once as
+    integers. Combining selective sets thus costs time proportional to their
+    sizes, not to the span of the IDs.
+    """
+    def __init__(self, chunks: dict[int, array | bytes] = None):
+        """
+        :param chunks: 16 high bits -> sorted array of 16 low bits, or bitset of the chunk
+        """
+        self.chunks = chunks if chunks is not None else {}
+
+    @classmethod
+    def from_ids(cls, entry_ids: Iterable[int]) -> 'RoaringBitmap':
+        """
+        :param entry_ids: IDs, in increasing order
+        :return: bitmap of the IDs
+        """
+        chunks = {}
+        for entry_id in entry_ids:
+            chunk = chunks.get(entry_id >> CHUNK_BITS)
+            if chunk is None:
+                chunk = chunks[entry_id >> CHUNK_BITS] = array('H')
+            chunk.append(entry_id & 0xFFFF)
+        return cls({key: _packed(chunk) for key, chunk in chunks.items()})
+
+    def __len__(self) -> int:
+        return sum(len(chunk) if isinstance(chunk, array) else int.from_bytes(chunk, 'little').bit_count()
+                   for chunk in self.chunks.values())
+
+    def __iter__(self):
+        """
+        Iterates over the IDs in increasing order.
+        """
+        for key in sorted(self.chunks):
+            base = key << CHUNK_BITS
+            chunk = self.chunks[key]
+            for low in (chunk if isinstance(chunk, array) else _set_bits(chunk)):
+                yield base + low
+
+    def __and__(self, other: 'RoaringBitmap') -> 'RoaringBitmap':
+        small, large = (self, other) if len(self.chunks) <= len(other.chunks) else (other, self)
+        chunks = {}
+        for key, chunk in small.chunks.items():
+            other_chunk = large.chunks.get(key)
+            if other_chunk is not None:
+                chunk = _intersect(chunk, other_chunk)
+                if len(chunk):
+                    chunks[key] = chunk
+        return RoaringBitmap(chunks)
+
+    def __or__(self, other: 'RoaringBitmap') -> 'RoaringBitmap':
+        chunks = dict(self.chunks)
+        for key, chunk in other.chunks.items():
+            chunks[key] = _union(chunks[key], chunk) if key in chunks else chunk
+        return RoaringBitmap(chunks)
+
+
+def _packed(chunk: array) -> array | bytes:
+    """
+    :param chunk: sorted low bits of the IDs of a chunk
+    :return: the chunk, as a bitset if it holds more than SPARSE_CHUNK IDs
+    """
+    if len(chunk) <= SPARSE_CHUNK:
+        return chunk
+    bits = bytearray(CHUNK_BYTES)
+    for low in chunk:
+        bits[low >> 3] |= 1 << (low & 7)
+    return bytes(bits)
+
+
+def _set_bits(bits: bytes):
+    """
+    Iterates over the positions of the set bits of a bitset in increasing
+    order, in time proportional to its non-zero bytes.
+    :param bits: bitset
+    """
+    for match in NONZERO_BYTE.finditer(bits):
+        i = match.start()
+        for bit in BYTE_BITS[bits[i]]:
+            yield 8 * i + bit
+
+
+def _unpacked(bits: int) -> array | bytes:
+    """
+    :param bits: bitset of a chunk as an integer
+    :return: the chunk, as a sorted array if it holds at most SPARSE_CHUNK IDs
+    """
+    if bits.bit_count() > SPARSE_CHUNK:
+        return bits.to_bytes(CHUNK_BYTES, 'little')
+    return array('H', _set_bits(bits.to_bytes(CHUNK_BYTES, 'little')))
+
+
+def _intersect(a: array | bytes, b: array | bytes) -> array | bytes:
+    """
+    :return: intersection of two chunks
+    """
+    if isinstance(a, bytes) and isinstance(b, bytes):
+        return _unpacked(int.from_bytes(a, 'little') & int.from_bytes(b, 'little'))
+    if isinstance(a, bytes):
+        a, b = b, a
+    if isinstance(b, bytes):
+        return array('H', (low for low in a if b[low >> 3] >> (low & 7) & 1))
+    # the smaller array probes the larger one
+    if len(a) > len(b):
+        a, b = b, a
+    chunk = array('H')
+    for low in a:
+        i = bisect_left(b, low)
+        if i < len(b) and b[i] == low:
+            chunk.append(low)
+    return chunk
+
+
+def _union(a: array | bytes, b: array | bytes) -> array | bytes:
+    """
+    :return: union of two chunks
+    """
+    if isinstance(a, bytes) and isinstance(b, bytes):
+        return (int.from_bytes(a, 'little') | int.from_bytes(b, 'little')).to_bytes(CHUNK_BYTES, 'little')
+    if isinstance(a, bytes):
+        a, b = b, a
+    if isinstance(b, bytes):
+        bits = bytearray(b)
+        for low in a:
+            bits[low >> 3] |= 1 << (low & 7)
+        return bytes(bits)
+    return _packed(array('H', sorted(set(a).union(b))))
+
+
+class FieldIndex:
+    """
+    Index of one field of a table: the IDs of the entries holding each value,
+    in ID order, and the distinct values in sorted order. A value is looked up
+    in the dict, a range of values by a binary search over the sorted values,
+    which also give the entries in the order of the field and its minimum and
+    maximum.
+    The IDs of a value are kept in an array of 32-bit integers (4 bytes per
+    entry). With bitmaps enabled, those of a value held by more than one entry
+    in 16 of its span of IDs are kept in a Bitmap instead, at least half the
+    size, and go back to an array once it is smaller.
+    The values of a field all have the same type (int or str); the strings are
+    sorted by code point, as their UTF-8 encodings are.
+    """
+    def __init__(self, pairs: Iterable[tuple[int | str, int]] = (), bitmaps: bool = False):
+        """
+        :param pairs: (value, entry ID) of the entries, in ID order
+        :param bitmaps: keep the IDs of the dense values in bitmaps
+        """
+        self.bitmaps = bitmaps
+        # value -> IDs of the entries holding it, in ID order
+        self.postings: dict[int | str, array | Bitmap] = {}
+        for value, entry_id in pairs:
+            entry_ids = self.postings.get(value)
+            if entry_ids is None:
+                self.postings[value] = array('i', (entry_id,))
+            else:
+                entry_ids.append(entry_id)
+        if bitmaps:
+            for value in self.postings:
+                self._repack(value)
+        # distinct values, sorted
+        self.values = sorted(self.postings)
+        # value -> its IDs as a RoaringBitmap, made on demand (see bitmap)
+        self.roaring: dict[int | str, RoaringBitmap] = {}
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __contains__(self, value: int | str) -> bool:
+        return value in self.postings
+
+    def get(self, value: int | str) -> array:
+        """
+        :param value: value of the field
+        :return: IDs of the entries holding it, in ID order (empty if none), not to be modified
+        """
+        entry_ids = self.postings.get(value)
+        if entry_ids is None:
+            return array('i')
+        if isinstance(entry_ids, Bitmap):
+            return array('i', entry_ids)
+        return entry_ids
+
+    def items(self):
+        """
+        :return: (value, IDs of the entries holding it) pairs, in no particular order
+        """
+        return self.postings.items()
+
+    def add(self, value: int | str, entry_id: int) -> None:
+        """
+        Records that an entry holds a value.
+        :param value: value of the field
+        :param entry_id: ID of the entry
+        """
+        self.roaring.pop(value, None)
+        entry_ids = self.postings.get(value)
+        if entry_ids is None:
+            self.postings[value] = array('i', (entry_id,))
+            insort(self.values, value)
+            return
+        if isinstance(entry_ids, Bitmap):
+            entry_ids.add(entry_id)
+        elif entry_ids[-1] < entry_id:
+            # new entries come last
+            entry_ids.append(entry_id)
+        else:
+            insort(entry_ids, entry_id)
+        if self.bitmaps:
+            self._repack(value)
+
+    def remove(self, value: int | str, entry_id: int) -> None:
+        """
+        Records that an entry no longer holds a value.
+        :param value: value of the field
+        :param entry_id: ID of the entry
+        """
+        self.roaring.pop(value, None)
+        entry_ids = self.postings[value]
+        entry_ids.remove(entry_id)
+        if not entry_ids:
+            del self.postings[value]
+            del self.values[bisect_left(self.values, value)]
+        elif self.bitmaps:
+            self._repack(value)
+
+    def bitmap(self, value: int | str) -> RoaringBitmap:
+        """
+        :param value: value of the field
+        :return: IDs of the entries holding it as a RoaringBitmap, kept until they change
+        """
+        bitmap = self.roaring.get(value)
+        if bitmap is None:
+            bitmap = self.roaring[value] = RoaringBitmap.from_ids(self.postings.get(value, ()))
+        return bitmap
+
+    def _repack(self, value: int | str) -> None:
+        """
+        Keeps the IDs of a value in a bitmap if it is at most half the size of
+        their array, in an array if it is smaller than their bitmap.
+        :param value: value of the field
+        """
+        entry_ids = self.postings[value]
+        if isinstance(entry_ids, Bitmap):
+            if 4 * len(entry_ids) < entry_ids.nbytes:
+                self.postings[value] = array('i', entry_ids)
+        elif len(entry_ids) > 16 and 2 * ((entry_ids[-1] - (entry_ids[0] & ~7)) // 8 + 1) <= 4 * len(entry_ids):
+            self.postings[value] = Bitmap(entry_ids)
+
+    def nbytes(self) -> int:
+        """
+        :return: size in bytes of the IDs kept for the values (without the dict and the values)
+        """
+        return sum(entry_ids.nbytes if isinstance(entry_ids, Bitmap) else entry_ids.itemsize * len(entry_ids)
+                   for entry_ids in self.postings.values())
+
+    def value_range(self, low: int | str = None, high: int | str = None, include_low: bool = True, include_high: bool = True) -> list[int | str]:
+        """
+        :param low: smallest value, None for no lower bound
+        :param high: largest value, None for no upper bound
+        :param include_low: whether low itself is in the range
+        :param include_high: whether high itself is in the range
+        :return: the distinct values in the range, sorted
+        """
+        start, end = bounds_slice(self.values, low, high, include_low, include_high)
+        return self.values[start:end]
+
+    def range_ids(self, low: int | str = None, high: int | str = None, include_low: bool = True, include_high: bool = True) -> list[int]:
+        """
+        :return: IDs of the entries whose value is in the range (see value_range),
+                 in the order of the values, then of the IDs
+        """
+        entry_ids = []
+        for value in self.value_range(low, high, include_low, include_high):
+            entry_ids.extend(self.postings[value])
+        return entry_ids
+
+    def min(self) -> int | str | None:
+        """
+        :return: smallest value, None if no entry
+        """
+        return self.values[0] if self.values else None
+
+    def max(self) -> int | str | None:
+        """
+        :return: largest value, None if no entry
+        """
+        return self.values[-1] if self.values else None
+
+
+def bounds_slice(values, low=None, high=None, include_low: bool = True, include_high: bool = True) -> tuple[int, int]:
+    """
+    Finds the values of a range in a sorted sequence by binary search.
+    :param values: sorted sequence
+    :param low: smallest value, None for no lower bound
+    :param high: largest value, None for no upper bound
+    :param include_low: whether low itself is in the range
+    :param include_high: whether high itself is in the range
+    :return: (start, end) such that values[start:end] are the values in the range
+    """
+    start = 0
+    if low is not None:
+        start = bisect_left(values, low) if include_low else bisect_right(values, low)
+    end = len(values)
+    if high is not None:
+        end = bisect_right(values, high) if include_high else bisect_left(values, high)
+    return start, max(start, end)
+
+
+def prefix_range(prefix: str) -> tuple[str, str | None]:
+    """
+    Returns the bounds of the strings starting with a prefix, for a range
+    including its low bound and excluding its high bound.
+    :param prefix: prefix of the strings
+    :return: (low, high), high is None if the range has no upper bound
+    """
+    # the prefix with its last character incremented, past its maximum ones
+    stem = prefix.rstrip(chr(0x10FFFF))
+    if not stem:
+        return prefix, None
+    return prefix, stem[:-1] + chr(ord(stem[-1]) + 1)
@@ -0,0 +1,176 @@
+# Author: Waberi Daher
+# Matricule: 000353308
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from index import bounds_slice
+
+# suffix of the index files, <table>.<field>.idx in the directory of the database
+INDEX_SUFFIX = '.idx'
+MAGIC = b'UIDX'
+VERSION = 1
+# magic, version, byte order (0 little, 1 big), kind of keys, stamp of the table file
+# (inode, modification time, size), number of keys, number of positions
+HEADER = struct.Struct('<4sHBBQqqII')
+# kinds of keys
+INTEGER_KEYS, STRING_KEYS = 0, 1
+BYTE_ORDER = 0 if sys.byteorder == 'little' else 1
+
+
+class IndexFile:
+    """
+    Index of one field of a table saved next to its table file, mapped in memory:
+    the values of the field, sorted, each with the positions of the records
+    holding it in ID order. A lookup is a binary search over the mapping, only
+    the positions of the value found are copied.
+    The file holds the stat stamp of the table file it was saved from, it is
+    stale once the table file changed (see write_index_file for the layout).
+    The integers are in the byte order of the machine that saved the file,
+    another one reads it as invalid.
+    """
+    def __init__(self, path: str):
+        """
+        :param path: path of the index file
+        :raises ValueError: if the file is not a valid index file
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.map)
+        try:
+            magic, version, byte_order, self.key_kind, ino, mtime, size, nkeys, npositions = HEADER.unpack_from(view)
+            if magic != MAGIC or version != VERSION or byte_order != BYTE_ORDER or self.key_kind not in (INTEGER_KEYS, STRING_KEYS):
+                raise ValueError(f"{path} is not an index file of version {VERSION} for this machine")
+            self.stamp = (ino, mtime, size)
+            pos = HEADER.size
+            # key i -> positions[offsets[i]:offsets[i + 1]]
+            self.offsets = view[pos:pos + 4 * (nkeys + 1)].cast('I')
+            pos += 4 * (nkeys + 1)
+            self.positions = view[pos:pos + 4 * npositions].cast('i')
+            pos += 4 * npositions
+            if self.key_kind == INTEGER_KEYS:
+                self.keys = view[pos:pos + 4 * nkeys].cast('i')
+                pos += 4 * nkeys
+            else:
+                self.keys = StringKeys(view, pos, nkeys)
+                pos = self.keys.end
+            if pos != len(view) or len(self.offsets) != nkeys + 1 or len(self.positions) != npositions:
+                raise ValueError(f"{path} is truncated")
+        except (ValueError, TypeError, IndexError, struct.error) as e:
+            view.release()
+            self.close()
+            raise ValueError(f"Invalid index file {path}: {e}")
+        # the views taken from it keep the mapping
+        view.release()
+
+    def lookup(self, value: int | str) -> list[int]:
+        """
+        :param value: value of the field
+        :return: positions of the records holding it, in ID order (empty if none)
+        """
+        if isinstance(value, str) and self.key_kind == STRING_KEYS:
+            key = value.encode('utf-8')
+        elif isinstance(value, int) and self.key_kind == INTEGER_KEYS:
+            key = value
+        else:
+            return []
+        i = bisect_left(self.keys, key)
+        if i == len(self.keys) or self.keys[i] != key:
+            return []
+        return self.positions[self.offsets[i]:self.offsets[i + 1]].tolist()
+
+    def lookup_range(self, low: int | str = None, high: int | str = None, include_low: bool = True, include_high: bool = True) -> list[int]:
+        """
+        :param low: smallest value, None for no lower bound
+        :param high: largest value, None for no upper bound
+        :param include_low: whether low itself is in the range
+        :param include_high: whether high itself is in the range
+        :return: positions of the records whose value is in the range, in the
+                 order of the values, then of the IDs
+        """
+        bounds = []
+        for bound in (low, high):
+            if isinstance(bound, str) and self.key_kind == STRING_KEYS:
+                bound = bound.encode('utf-8')
+            elif bound is not None and not (isinstance(bound, int) and self.key_kind == INTEGER_KEYS):
+                return []
+            bounds.append(bound)
+        start, end = bounds_slice(self.keys, *bounds, include_low, include_high)
+        # the positions are stored in the order of the keys
+        return self.positions[self.offsets[start]:self.offsets[end]].tolist()
+
+    def close(self) -> None:
+        """
+        Unmaps the file.
+        """
+        for name in ('offsets', 'positions', 'keys'):
+            view = self.__dict__.pop(name, None)
+            if view is not None:
+                view.release()
+        self.map.close()
+
+
+class StringKeys:
+    """
+    Sorted UTF-8 keys of an index file, as a sequence of bytes for bisect:
+    key i is blob[offsets[i]:offsets[i + 1]].
+    """
+    def __init__(self, view: memoryview, pos: int, nkeys: int):
+        """
+        :param view: view of the index file
+        :param pos: position of the key offsets in the file
+        :param nkeys: number of keys
+        """
+        self.offsets = view[pos:pos + 4 * (nkeys + 1)].cast('I')
+        pos += 4 * (nkeys + 1)
+        self.blob = view[pos:pos + self.offsets[-1]]
+        self.end = pos + self.offsets[-1]
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> bytes:
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]])
+
+    def release(self) -> None:
+        self.offsets.release()
+        self.blob.release()
+
+
+def write_index_file(path: str, stamp: tuple, postings: dict[int | str, list[int]]) -> None:
+    """
+    Saves the index of a field: header, offsets of the positions of each key,
+    positions, then the keys (integers, or offsets of the UTF-8 strings followed
+    by the strings). The file is written aside and renamed, so a crash leaves
+    the previous one, or none.
+    :param path: path of the index file
+    :param stamp: stat stamp of the table file (inode, modification time, size)
+    :param postings: value -> positions of the records holding it, in ID order
+    """
+    string_keys = any(isinstance(value, str) for value in postings)
+    if string_keys:
+        encoded = sorted((value.encode('utf-8'), value) for value in postings)
+    else:
+        encoded = [(value, value) for value in sorted(postings)]
+    offsets = array('I', [0])
+    positions = array('i')
+    for _, value in encoded:
+        positions.extend(postings[value])
+        offsets.append(len(positions))
+    parts = [HEADER.pack(MAGIC, VERSION, BYTE_ORDER, STRING_KEYS if string_keys else INTEGER_KEYS, *stamp, len(encoded), len(positions)),
+             offsets.tobytes(), positions.tobytes()]
+    if string_keys:
+        key_offsets = array('I', [0])
+        for key, _ in encoded:
+            key_offsets.append(key_offsets[-1] + len(key))
+        parts.append(key_offsets.tobytes())
+        parts.extend(key for key, _ in encoded)
+    else:
+        parts.append(array('i', (key for key, _ in encoded)).tobytes())
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(b''.join(parts))
+    os.replace(temp_path, path)
@@ -456,3 +456,789 @@ def test_script_param():
     del _
     process = run(['python3', 'uldb.py', 'script.uldb'], check=True, capture_output=True, text=True)
     assert process.stdout.strip() == expected
+
+########################################
+#             Performances             #
+########################################
+
+def test_size_tracked_without_seeking():
+    from binary import BinaryFile
+    with tmpfile() as f:
+        file = BinaryFile(f)
+        file.write_string('eée')
+        file.write_integer(7, 4)
+        assert file.get_size() == 10
+        # overwriting does not grow the file
+        file.write_integer_to(8, 4, 6)
+        assert file.get_size() == 10
+        with pytest.raises(ValueError):
+            file.goto(11)
+        # trusted callers can skip the bounds checks, short reads still fail
+        with file.unchecked():
+            file.goto(8)
+            with pytest.raises(EOFError):
+                file.read_integer(4)
+        with pytest.raises(ValueError):
+            file.read_integer_from(4, 8)
+
+def test_integer_runs():
+    from binary import BinaryFile
+    with tmpfile() as f:
+        file = BinaryFile(f)
+        assert file.write_integers([1, -1, 0x7fffffff], 4) == 12
+        file.write_integers_to([3, -2], 2, 12)
+        assert file.read_integer_from(4, 4) == -1
+        assert list(file.read_integers_from(4, 3, 0)) == [1, -1, 0x7fffffff]
+        assert list(file.read_integers_from(2, 2, 12)) == [3, -2]
+        with pytest.raises(ValueError):
+            file.write_integers([128], 1)
+        with pytest.raises(ValueError):
+            file.read_integers_from(4, 5, 0)
+
+def test_mmap_backend():
+    from binary import BinaryFile, MmapBinaryFile
+    from database import FieldType
+    tables = {}
+    for db_name, backend in (('mmap_db', MmapBinaryFile), ('file_db', BinaryFile)):
+        db = get_empty_db(db_name)
+        db.create_table('cours', ('MNEMONIQUE', FieldType.INTEGER), ('NOM', FieldType.STRING))
+        db.set_table_backend('cours', backend)
+        for course in COURSES:
+            db.add_entry('cours', {'MNEMONIQUE': course['MNEMONIQUE'], 'NOM': 'Cours ' + str(course['MNEMONIQUE'])})
+        tables[backend] = _read_table_file(Path(db_name) / 'cours.table')
+        with pytest.raises(TypeError):
+            db.set_table_backend('cours', dict)
+        db.delete_table('cours')
+    # both backends produce the exact same file
+    assert tables[MmapBinaryFile] == tables[BinaryFile]
+
+def test_write_buffer_coalesces():
+    from binary import BinaryFile, WriteBuffer
+    with tmpfile() as f:
+        f.write(b'\x00' * 8)
+        f.seek(0)
+        buffered = WriteBuffer(f)
+        file = BinaryFile(buffered)
+        for i in range(8):
+            file.write_integer(i, 1)
+        file.write_integers_to([1, 2], 4, 6)
+        # adjacent and overlapping writes are merged in a single extent
+        assert len(buffered.extents) == 1
+        # reads see the pending writes, the file does not yet
+        assert file.read_integer_from(4, 10) == 2
+        assert file.get_size() == 14
+        f.seek(0)
+        assert f.read() == b'\x00' * 8
+        file.flush()
+        f.seek(0)
+        assert f.read() == bytes(range(6)) + b'\x01\x00\x00\x00\x02\x00\x00\x00'
+
+def test_record_codec():
+    from database import FieldType, RecordCodec
+    codec = RecordCodec([('MNEMONIQUE', FieldType.INTEGER), ('NOM', FieldType.STRING)])
+    assert codec.size == 4 + 2 * 4 + 8
+    assert codec.offset('NOM') == 8
+    record = codec.unpack(codec.pack(7, [101, 40], -1, 96))
+    assert record == (7, 101, 40, -1, 96)
+    assert codec.field(record, 'NOM', {40: 'Programmation'}) == 'Programmation'
+    assert codec.decode(record, {40: 'Programmation'}) == {'MNEMONIQUE': 101, 'NOM': 'Programmation'}
+    assert codec.unpack_run(codec.pack_run([record, record])) == [record, record]
+    # entries are stored as given and read back with their strings
+    db = get_empty_db('codec_db')
+    db.create_table('cours', ('MNEMONIQUE', FieldType.INTEGER), ('NOM', FieldType.STRING))
+    entry = {'MNEMONIQUE': 101, 'NOM': 'Programmation'}
+    db.add_entry('cours', entry)
+    assert entry == {'MNEMONIQUE': 101, 'NOM': 'Programmation'}
+    with pytest.raises(ValueError):
+        db.add_entry('cours', {'MNEMONIQUE': 'INFO-F101', 'NOM': 'Programmation'})
+    assert get_db('codec_db').get_complete_table('cours') == [{'id': 1, **entry}]
+    db.delete_table('cours')
+
+def test_page_cache():
+    from binary import PageCache
+    from database import FieldType
+    # the headers are no longer read per operation: pages large enough to be hit by the records
+    cache = PageCache(max_pages=2, page_size=32)
+    tables = {}
+    for db_name, page_cache in (('cache_db', cache), ('file_db', None)):
+        db = get_empty_db(db_name)
+        db.page_cache = page_cache
+        db.create_table('cours', ('MNEMONIQUE', FieldType.INTEGER), ('NOM', FieldType.STRING))
+        for course in COURSES:
+            db.add_entry('cours', {'MNEMONIQUE': course['MNEMONIQUE'], 'NOM': 'Cours ' + str(course['MNEMONIQUE'])})
+        tables[db_name] = _read_table_file(Path(db_name) / 'cours.table')
+        db.delete_table('cours')
+    stats = cache.stats()
+    assert stats['hits'] > stats['misses'] > 0
+    assert stats['evictions'] > 0 and stats['writebacks'] > 0
+    # the pages of a deleted table are dropped
+    assert stats['pages'] == 0
+    # dirty pages were written back: the file matches a database without cache
+    assert tables['cache_db'] == tables['file_db']
+
+def test_io_stats():
+    from binary import IOStats
+    from database import FieldType
+    db = get_empty_db('io_db')
+    assert db.io_stats() == {}
+    db.io_counters = IOStats()
+    db.create_table('cours', ('MNEMONIQUE', FieldType.INTEGER), ('NOM', FieldType.STRING))
+    for course in COURSES:
+        db.add_entry('cours', {'MNEMONIQUE': course['MNEMONIQUE'], 'NOM': 'Cours ' + str(course['MNEMONIQUE'])})
+    stats = db.io_stats(reset=True)
+    assert stats['create_table']['calls'] == 1
+    assert stats['add_entry']['calls'] == len(COURSES)
+    assert stats['add_entry']['writes'] > 0 and stats['add_entry']['bytes_written'] > 0
+    # string buffer steps are counted apart from add_entry itself
+    assert stats['add_entry/_add_strings_to_buffer']['calls'] == len(COURSES)
+    assert 'add_entry/_add_strings_to_buffer/_expand_string_buffer' in stats
+    assert db.io_stats() == {}
+    db.delete_table('cours')
+    assert db.io_stats()['delete_table']['calls'] == 1
+
+def test_open_files_pool():
+    from database import FieldType
+    db = get_empty_db('pool_db')
+    db.max_open_files = 2
+    for table_name in ('a', 'b', 'c'):
+        db.create_table(table_name, ('X', FieldType.INTEGER), ('S', FieldType.STRING))
+        db.add_entry(table_name, {'X': 1, 'S': table_name})
+    # least recently used table file closed
+    assert list(db.open_files) == ['b', 'c']
+    binary_file = db.open_files['c'][0]
+    assert db.get_entry('c', 'X', 1) == {'id': 1, 'X': 1, 'S': 'c'}
+    assert db.open_files['c'][0] is binary_file
+    # still valid after the file is replaced by a string buffer expansion
+    db.add_entry('c', {'X': 2, 'S': 'a longer string than the buffer holds'})
+    assert get_db('pool_db').get_entries('c', 'X', 2)[0]['S'] == 'a longer string than the buffer holds'
+    assert db.get_table_size('c') == 2
+    db.delete_table('c')
+    assert 'c' not in db.open_files and binary_file.file.closed
+    db.close()
+    assert len(db.open_files) == 0
+    for table_name in ('a', 'b'):
+        db.delete_table(table_name)
+
+def test_string_buffer_doubles():
+    from binary import IOStats
+    from database import FieldType
+    db = get_empty_db('growth_db')
+    db.io_counters = IOStats()
+    db.create_table('noms', ('N', FieldType.INTEGER), ('NOM', FieldType.STRING))
+    for i in range(200):
+        db.add_entry('noms', {'N': i, 'NOM': f"nom {i:04d}"})
+    header = _read_table_file(Path('growth_db') / 'noms.table')
+    string_buffer_offset = int.from_bytes(header[18:22], 'little')
+    entry_buffer_offset = int.from_bytes(header[26:30], 'little')
+    # 200 strings of 10 bytes in a power of 2 buffer, after a logarithmic number of rewrites
+    assert entry_buffer_offset - string_buffer_offset == 2048
+    assert db.io_stats()['add_entry/_add_strings_to_buffer/_expand_string_buffer']['calls'] == 7
+    assert db.get_entry('noms', 'N', 199)['NOM'] == 'nom 0199'
+    db.delete_table('noms')
+
+def test_copy_from():
+    from binary import BinaryFile
+    data = bytes(range(256)) * 64
+    with tmpfile() as f:
+        f.write(data)
+        f.seek(0)
+        source = BinaryFile(f)
+        # unbuffered destination: copied by the kernel, buffered one: by blocks
+        for buffering in (0, -1):
+            with tmpfile() as g:
+                destination = BinaryFile(open(g.fileno(), 'rb+', buffering=buffering, closefd=False))
+                destination.write_bytes(b'head')
+                assert destination.copy_from(source, 10, len(data) - 20) == len(data) - 20
+                destination.write_bytes(b'tail')
+                assert destination.get_size() == len(data) - 12
+                destination.flush()
+                g.seek(0)
+                assert g.read() == b'head' + data[10:-10] + b'tail'
+            with pytest.raises(EOFError):
+                BinaryFile(g).copy_from(source, len(data) - 4, 8)
+
+def test_add_entries():
+    from binary import IOStats
+    from database import FieldType
+    batch_db, single_db = get_empty_db('batch_db'), get_empty_db('single_db')
+    entries = [{'MNEMONIQUE': course['MNEMONIQUE'], 'NOM': course['NOM']} for course in COURSES] * 3
+    for db in (batch_db, single_db):
+        db.create_table('cours', ('MNEMONIQUE', FieldType.INTEGER), ('NOM', FieldType.STRING))
+    batch_db.io_counters = IOStats()
+    batch_db.add_entries('cours', iter(entries))
+    for entry in entries:
+        single_db.add_entry('cours', entry)
+    # same file as entry by entry, with a single expansion of the string buffer
+    assert _read_table_file(Path('batch_db') / 'cours.table') == _read_table_file(Path('single_db') / 'cours.table')
+    assert batch_db.io_stats()['add_entries/_add_strings_to_buffer/_expand_string_buffer']['calls'] == 1
+    assert batch_db.get_entries('cours', 'NOM', COURSES[0]['NOM']) == single_db.get_entries('cours', 'NOM', COURSES[0]['NOM'])
+    # appended after the existing entries
+    batch_db.add_entries('cours', entries[:2])
+    assert batch_db.get_table_size('cours') == len(entries) + 2
+    assert batch_db.get_complete_table('cours')[-1] == {'id': len(entries) + 2, **entries[1]}
+    # nothing written if one entry of the batch is invalid
+    before = _read_table_file(Path('batch_db') / 'cours.table')
+    with pytest.raises(ValueError):
+        batch_db.add_entries('cours', [{'MNEMONIQUE': 1, 'NOM': 'valide'}, {'MNEMONIQUE': 'x', 'NOM': 'invalide'}])
+    assert _read_table_file(Path('batch_db') / 'cours.table') == before
+    batch_db.add_entries('cours', [])
+    with pytest.raises(ValueError):
+        batch_db.add_entries('profs', [])
+    for db in (batch_db, single_db):
+        db.delete_table('cours')
+
+def test_deleted_slots_reused():
+    from database import FieldType
+    db = get_empty_db('churn_db')
+    db.create_table('cours', ('MNEMONIQUE', FieldType.INTEGER), ('NOM', FieldType.STRING))
+    db.add_entries('cours', [{'MNEMONIQUE': i, 'NOM': 'Cours'} for i in range(10)])
+    size = _get_table_size('churn_db/cours.table')
+    # delete/insert churn keeps the file size flat
+    for i in range(10, 100):
+        assert db.delete_entries('cours', 'MNEMONIQUE', i - 10)
+        db.add_entry('cours', {'MNEMONIQUE': i, 'NOM': 'Cours'})
+        assert _get_table_size('churn_db/cours.table') == size
+    db.delete_entries('cours', 'MNEMONIQUE', 95)
+    db.delete_entries('cours', 'id', 98)
+    db.add_entries('cours', [{'MNEMONIQUE': 200, 'NOM': 'Cours'}, {'MNEMONIQUE': 201, 'NOM': 'Cours'}, {'MNEMONIQUE': 202, 'NOM': 'Cours'}])
+    assert _get_table_size('churn_db/cours.table') == size + 20
+    assert db.update_entries('cours', 'MNEMONIQUE', 201, 'NOM', 'Projet')
+    assert not db.update_entries('cours', 'MNEMONIQUE', 95, 'NOM', 'Projet')
+    expected = [i for i in range(90, 100) if i not in (95, 97)] + [200, 201, 202]
+    for reopened in (db, get_db('churn_db')):
+        assert [entry['MNEMONIQUE'] for entry in reopened.get_complete_table('cours')] == expected
+        assert reopened.select_entries('cours', ('MNEMONIQUE',), 'NOM', 'Projet') == [201]
+    db.delete_table('cours')
+
+def test_incremental_compaction():
+    import time
+    from database import FieldType
+    db = get_empty_db('compact_db')
+    db.create_table('cours', ('MNEMONIQUE', FieldType.INTEGER), ('NOM', FieldType.STRING))
+    db.add_entries('cours', [{'MNEMONIQUE': i, 'NOM': f"Cours {i}"} for i in range(100)])
+    size = _get_table_size('compact_db/cours.table')
+    # 40% deleted: still above the threshold
+    for i in range(100):
+        if i % 5 < 2:
+            db.delete_entries('cours', 'MNEMONIQUE', i)
+    assert _get_table_size('compact_db/cours.table') == size
+    expected = db.get_complete_table('cours')
+    steps = 0
+    while not db.compact('cours', budget=4):
+        steps += 1
+        # readable between the steps, from memory and from the file
+        assert db.get_complete_table('cours') == expected
+        assert get_db('compact_db').get_complete_table('cours') == expected
+    assert steps > 1
+    assert _get_table_size('compact_db/cours.table') == size - 40 * 20
+    # unreferenced strings reclaimed
+    db.update_entries('cours', 'NOM', 'Cours 99', 'NOM', 'Projet')
+    db.update_entries('cours', 'MNEMONIQUE', 98, 'NOM', 'Projet')
+    for i in range(97):
+        db.delete_entries('cours', 'MNEMONIQUE', i)
+    assert _get_table_size('compact_db/cours.table') < 200
+    assert get_db('compact_db').get_complete_table('cours') == [
+        {'id': 98, 'MNEMONIQUE': 97, 'NOM': 'Cours 97'},
+        {'id': 99, 'MNEMONIQUE': 98, 'NOM': 'Projet'},
+        {'id': 100, 'MNEMONIQUE': 99, 'NOM': 'Projet'},
+    ]
+    # compacted by the background thread
+    db.start_compaction(budget=2, interval=0.001)
+    db.add_entries('cours', [{'MNEMONIQUE': i, 'NOM': 'Cours'} for i in range(20)])
+    size = _get_table_size('compact_db/cours.table')
+    db.delete_entries('cours', 'NOM', 'Cours')
+    deadline = time.monotonic() + 5
+    while _get_table_size('compact_db/cours.table') == size and time.monotonic() < deadline:
+        time.sleep(0.01)
+    db.stop_compaction()
+    assert _get_table_size('compact_db/cours.table') < size
+    assert db.get_table_size('cours') == 3
+    db.delete_table('cours')
+
+def test_string_space_reused():
+    from database import FieldType
+    db = get_empty_db('strings_db')
+    db.create_table('cours', ('MNEMONIQUE', FieldType.INTEGER), ('NOM', FieldType.STRING))
+    db.add_entries('cours', [{'MNEMONIQUE': i, 'NOM': f"Cours {i} " + 'x' * 50} for i in range(10)])
+    size = _get_table_size('strings_db/cours.table')
+    stats = db.string_buffer_stats('cours')
+    assert stats['free'] == 0 and stats['fragmentation'] == 0.0
+    # the long strings replaced by short ones are reused in place, without expansion
+    for i in range(10):
+        assert db.update_entries('cours', 'MNEMONIQUE', i, 'NOM', f"Projet {i}")
+        assert _get_table_size('strings_db/cours.table') == size
+    assert db.string_buffer_stats('cours')['used'] <= stats['used']
+    # freed by a deletion, then filled again
+    db.delete_entries('cours', 'MNEMONIQUE', 0)
+    stats = db.string_buffer_stats('cours')
+    assert stats['free'] > 0 and stats['extents'] >= 1
+    assert 0.0 <= stats['fragmentation'] < 1.0
+    db.add_entry('cours', {'MNEMONIQUE': 10, 'NOM': 'Projet X'})
+    assert db.string_buffer_stats('cours')['free'] < stats['free']
+    assert _get_table_size('strings_db/cours.table') == size
+    expected = [{'id': i + 1, 'MNEMONIQUE': i, 'NOM': f"Projet {i}"} for i in range(1, 10)]
+    expected.append({'id': 11, 'MNEMONIQUE': 10, 'NOM': 'Projet X'})
+    for reopened in (db, get_db('strings_db')):
+        assert reopened.get_complete_table('cours') == expected
+    assert get_db('strings_db').string_buffer_stats('cours')['free'] == db.string_buffer_stats('cours')['free']
+    db.delete_table('cours')
+
+def test_string_refcounts():
+    from database import FieldType
+    db = get_empty_db('strings_db')
+    db.create_table('cours', ('NOM', FieldType.STRING), ('COORDINATEUR', FieldType.STRING))
+    db.create_table('profs', ('NOM', FieldType.STRING))
+    db.add_entries('cours', [{'NOM': 'Algo', 'COORDINATEUR': 'Algo'}, {'NOM': 'Algo', 'COORDINATEUR': 'Jean'}])
+    db.add_entry('profs', {'NOM': 'Jean'})
+    # interned per table, one reference per field holding the string
+    assert db.string_lookup['cours']['Algo'][1] == 3
+    assert db.string_lookup['cours']['Jean'][1] == 1
+    assert db.string_lookup['profs']['Jean'][1] == 1
+    db.update_entries('cours', 'id', 1, 'COORDINATEUR', 'Jean')
+    assert db.string_lookup['cours']['Algo'][1] == 2
+    assert db.string_lookup['cours']['Jean'][1] == 2
+    # no entry of the table holds the string anymore: its space is freed, the other table keeps its copy
+    db.delete_entries('cours', 'COORDINATEUR', 'Jean')
+    assert 'Jean' not in db.string_lookup['cours'] or db.string_lookup['cours']['Jean'][1] == 0
+    assert db.get_complete_table('profs') == [{'id': 1, 'NOM': 'Jean'}]
+    db.add_entry('cours', {'NOM': 'Jean', 'COORDINATEUR': 'Algo'})
+    for reopened in (db, get_db('strings_db')):
+        # counted once the table is used
+        assert reopened.get_complete_table('cours') == [{'id': 3, 'NOM': 'Jean', 'COORDINATEUR': 'Algo'}]
+        assert reopened.string_lookup['cours']['Jean'][1] == 1
+        assert reopened.string_lookup['cours']['Algo'][1] == 1
+    db.delete_table('cours')
+    db.delete_table('profs')
+
+def test_sequential_record_scan():
+    import os
+    from binary import IOStats
+    from database import FieldType
+    db = get_empty_db('scan_db')
+    db.create_table('cours', ('MNEMONIQUE', FieldType.INTEGER), ('NOM', FieldType.STRING))
+    db.add_entries('cours', [{'MNEMONIQUE': i, 'NOM': f"Cours {i % 10}"} for i in range(300)])
+    # the slots of the deleted entries are reused: the list of entries jumps back and forth in the file
+    for i in range(0, 300, 3):
+        db.delete_entries('cours', 'MNEMONIQUE', i)
+    db.add_entries('cours', [{'MNEMONIQUE': i, 'NOM': f"Cours {i % 10}"} for i in range(300, 400)])
+    expected = db.get_complete_table('cours')
+    expected_ids = db.select_entries('cours', ('id',), 'NOM', 'Cours 1')
+    reopened = get_db('scan_db')
+    assert reopened.get_complete_table('cours') == expected
+    assert reopened.select_entries('cours', ('id',), 'NOM', 'Cours 1') == expected_ids == sorted(expected_ids)
+    # the records are read once, in order
+    reopened.io_counters = IOStats()
+    reopened.indexes_built_tables.remove('cours')
+    assert reopened.get_complete_table('cours') == expected
+    stats = reopened.io_stats()['get_complete_table/_build_table_index']
+    assert stats['bytes_read'] <= os.path.getsize('scan_db/cours.table')
+    db.delete_table('cours')
+
+def test_wal_recovery():
+    import os
+    from subprocess import run
+    from database import FieldType
+    db = get_empty_db('wal_db')
+    db.create_table('cours', ('MNEMONIQUE', FieldType.INTEGER), ('NOM', FieldType.STRING))
+    db.add_entries('cours', [{'MNEMONIQUE': i, 'NOM': f"Cours {i}"} for i in range(10)])
+    db.close()
+    # crash once the operation is committed to the log, before the table file is written
+    crash = '''
+import os
+from binary import WriteBuffer
+from database import Database
+db = Database('wal_db')
+db.enable_wal(sync='full')
+db.add_entry('cours', {'MNEMONIQUE': 10, 'NOM': 'Projet'})
+db.update_entries('cours', 'MNEMONIQUE', 3, 'NOM', 'Algo')
+db.delete_entries('cours', 'MNEMONIQUE', 5)
+WriteBuffer.flush = lambda self: os._exit(1)
+db.add_entry('cours', {'MNEMONIQUE': 11, 'NOM': 'Cours 11'})
+'''
+    assert run(['python3', '-c', crash]).returncode == 1
+    assert os.path.getsize('wal_db/uldb.wal') > 0
+    # a record torn by the crash is ignored
+    with open('wal_db/uldb.wal', 'ab') as f:
+        f.write(b'\x40\x00\x00\x00\x01\x02')
+    expected = [{'id': i + 1, 'MNEMONIQUE': i, 'NOM': 'Algo' if i == 3 else f"Cours {i}"} for i in range(12) if i != 5]
+    expected[-2]['NOM'] = 'Projet'
+    recovered = get_db('wal_db')
+    assert not os.path.exists('wal_db/uldb.wal')
+    assert recovered.get_complete_table('cours') == expected
+    assert recovered.select_entries('cours', ('MNEMONIQUE',), 'NOM', 'Cours 11') == [11]
+    # group commit: one sync for many operations
+    recovered.enable_wal(sync='group', group_size=32, group_interval=60)
+    for i in range(64):
+        recovered.update_entries('cours', 'MNEMONIQUE', 0, 'NOM', f"Projet {i}")
+    assert recovered.wal.commits == 64 and recovered.wal.syncs == 2
+    recovered.disable_wal()
+    assert get_db('wal_db').get_entry('cours', 'MNEMONIQUE', 0)['NOM'] == 'Projet 63'
+    recovered.delete_table('cours')
+
+def test_wal_with_compaction():
+    import threading
+    from database import FieldType
+    db = get_empty_db('wal_db')
+    db.create_table('cours', ('MNEMONIQUE', FieldType.INTEGER), ('NOM', FieldType.STRING))
+    db.add_entries('cours', [{'MNEMONIQUE': i, 'NOM': f"Cours {i}"} for i in range(20)])
+    db.start_compaction(budget=2, interval=0)
+    # the compaction thread is stopped without a deadlock, then started again
+    toggled = threading.Thread(target=lambda: (db.enable_wal(sync='off'), db.disable_wal()), daemon=True)
+    toggled.start()
+    toggled.join(10)
+    assert not toggled.is_alive()
+    assert db.compactor is not None and db.compactor.is_alive()
+    assert db.compaction_settings == (2, 0)
+    db.delete_entries('cours', 'NOM', 'Cours 3')
+    # joining it from a thread holding the lock fails instead of hanging
+    with db.lock, pytest.raises(ValueError):
+        db.stop_compaction()
+    db.stop_compaction()
+    assert db.compactor is None and db.wal is None
+    assert db.get_table_size('cours') == 19
+    db.delete_table('cours')
+
+def test_transactions():
+    import os
+    from subprocess import run
+    from database import FieldType
+    db = get_empty_db('transaction_db')
+    db.create_table('cours', ('MNEMONIQUE', FieldType.INTEGER), ('NOM', FieldType.STRING))
+    db.create_table('profs', ('NOM', FieldType.STRING))
+    db.add_entries('cours', [{'MNEMONIQUE': i, 'NOM': f"Cours {i}"} for i in range(10)])
+    db.close()
+    with open('transaction_db/cours.table', 'rb') as f:
+        before = f.read()
+    # nothing reaches the files before the commit
+    db.begin()
+    for i in range(10, 1010):
+        db.add_entry('cours', {'MNEMONIQUE': i, 'NOM': 'Projet'})
+    db.delete_entries('cours', 'MNEMONIQUE', 0)
+    assert db.get_table_size('cours') == 1009
+    with open('transaction_db/cours.table', 'rb') as f:
+        assert f.read() == before
+    with pytest.raises(ValueError):
+        db.begin()
+    db.commit()
+    assert get_db('transaction_db').get_table_size('cours') == 1009
+    # rolled back, even when the string buffer of a table was expanded
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.add_entries('profs', [{'NOM': f"Professeur {i}" * 4} for i in range(100)])
+            db.update_entries('cours', 'MNEMONIQUE', 1, 'NOM', 'Algo')
+            raise RuntimeError
+    for reopened in (db, get_db('transaction_db')):
+        assert reopened.get_table_size('profs') == 0
+        assert reopened.get_entry('cours', 'MNEMONIQUE', 1)['NOM'] == 'Cours 1'
+    assert not os.path.exists('transaction_db/profs.table.bak')
+    with pytest.raises(ValueError):
+        db.rollback()
+    # with the log, a transaction interrupted by a crash is undone, a committed one redone
+    crash = '''
+import os
+from binary import WriteBuffer
+from database import Database
+from wal import WriteAheadLog
+db = Database('transaction_db')
+db.enable_wal(sync='full')
+with db.transaction():
+    db.add_entries('profs', [{'NOM': f"Professeur {i}" * 4} for i in range(100)])
+    db.update_entries('cours', 'MNEMONIQUE', 1, 'NOM', 'Algo')
+    if COMMITTED:
+        WriteBuffer.flush = lambda self: os._exit(1)
+    else:
+        WriteAheadLog.commit_transaction = lambda self: os._exit(1)
+'''
+    assert run(['python3', '-c', crash.replace('COMMITTED', 'False')]).returncode == 1
+    recovered = get_db('transaction_db')
+    assert recovered.get_table_size('profs') == 0
+    assert recovered.get_entry('cours', 'MNEMONIQUE', 1)['NOM'] == 'Cours 1'
+    assert run(['python3', '-c', crash.replace('COMMITTED', 'True')]).returncode == 1
+    recovered = get_db('transaction_db')
+    assert recovered.get_table_size('profs') == 100
+    assert recovered.get_entry('cours', 'MNEMONIQUE', 1)['NOM'] == 'Algo'
+    assert not os.path.exists('transaction_db/profs.table.bak')
+    recovered.delete_table('cours')
+    recovered.delete_table('profs')
+
+def test_table_metadata():
+    from binary import IOStats
+    from database import FieldType
+    db = get_empty_db('meta_db')
+    db.create_table('cours', ('MNEMONIQUE', FieldType.INTEGER), ('NOM', FieldType.STRING))
+    db.add_entries('cours', [{'MNEMONIQUE': i, 'NOM': f"Cours {i}" * 3} for i in range(100)])
+    db.delete_entries('cours', 'MNEMONIQUE', 7)
+    db.update_entries('cours', 'MNEMONIQUE', 8, 'NOM', 'Algo')
+    db.compact('cours', budget=None)
+    db.add_entry('cours', {'MNEMONIQUE': 100, 'NOM': 'Projet'})
+    # the metadata kept in memory matches the file
+    meta = db.table_meta['cours']
+    with db._open_table('cours') as binary_file:
+        header = db._parse_header(binary_file)
+        assert meta.header == header
+        assert meta.entry_header == db._parse_entry_header(binary_file, header)
+    assert meta.entry_header['nentries'] == 100 and meta.entry_header['last_used_id'] == 101
+    # the size of a table is read from memory
+    db.io_counters = IOStats()
+    assert db.get_table_size('cours') == 100
+    assert db.io_stats()['get_table_size'] == {'calls': 1, 'seeks': 0, 'reads': 0, 'writes': 0,
+                                               'bytes_read': 0, 'bytes_written': 0, 'get_size': 0}
+    db.io_counters = None
+    # parsed again when the changes made to it are dropped
+    db.begin()
+    db.delete_entries('cours', 'MNEMONIQUE', 9)
+    assert db.get_table_size('cours') == 99
+    db.rollback()
+    assert db.get_table_size('cours') == get_db('meta_db').get_table_size('cours') == 100
+    db.delete_table('cours')
+
+def test_preallocation():
+    import os
+    from subprocess import run
+    from binary import BinaryFile, MmapBinaryFile
+    from database import FieldType
+    tables = {}
+    for db_name, extent in (('exact_db', 0), ('prealloc_db', 4096)):
+        db = get_empty_db(db_name)
+        db.preallocate_extent = extent
+        db.create_table('cours', ('MNEMONIQUE', FieldType.INTEGER), ('NOM', FieldType.STRING))
+        db.set_table_backend('cours', MmapBinaryFile)
+        for i in range(300):
+            db.add_entry('cours', {'MNEMONIQUE': i, 'NOM': f"Cours {i % 7}"})
+        db.set_table_backend('cours', BinaryFile)
+        db.add_entries('cours', [{'MNEMONIQUE': i, 'NOM': f"Cours {i}"} for i in range(300, 400)])
+        db.delete_entries('cours', 'MNEMONIQUE', 3)
+        if extent:
+            # allocated by extents while the file is open
+            assert os.path.getsize(f"{db_name}/cours.table") > len(tables['exact_db'])
+        assert db.get_table_size('cours') == 399
+        db.close()
+        with open(f"{db_name}/cours.table", 'rb') as f:
+            tables[db_name] = f.read()
+    # the preallocated space is released on close
+    assert tables['prealloc_db'] == tables['exact_db']
+    # or on load, after a crash
+    crash = '''
+import os
+from database import Database
+db = Database('prealloc_db')
+db.preallocate_extent = 1 << 16
+db.add_entries('cours', [{'MNEMONIQUE': i, 'NOM': 'Projet'} for i in range(400, 410)])
+os._exit(1)
+'''
+    assert run(['python3', '-c', crash]).returncode == 1
+    assert os.path.getsize('prealloc_db/cours.table') >= 1 << 16
+    recovered = get_db('prealloc_db')
+    assert recovered.get_table_size('cours') == 409
+    assert os.path.getsize('prealloc_db/cours.table') == len(tables['prealloc_db']) + 9 * recovered.codecs['cours'].size
+    recovered.add_entry('cours', {'MNEMONIQUE': 410, 'NOM': 'Algo'})
+    assert recovered.get_complete_table('cours')[-1] == {'id': 411, 'MNEMONIQUE': 410, 'NOM': 'Algo'}
+    recovered.delete_table('cours')
+    get_db('exact_db').delete_table('cours')
+
+def test_lazy_indexes():
+    from database import Database, FieldType
+    db = get_empty_db('lazy_db')
+    db.create_table('cours', ('MNEMONIQUE', FieldType.INTEGER), ('NOM', FieldType.STRING))
+    db.create_table('profs', ('NOM', FieldType.STRING), ('BUREAU', FieldType.INTEGER))
+    db.add_entries('cours', [{'MNEMONIQUE': i, 'NOM': f"Cours {i % 3}"} for i in range(20)])
+    db.add_entries('profs', [{'NOM': f"Prof {i}", 'BUREAU': i} for i in range(5)])
+    # only the headers are read at open
+    db = get_db('lazy_db')
+    assert db.indexes_built_tables == []
+    # a lookup builds its table and its field
+    assert db.get_entry('cours', 'MNEMONIQUE', 4) == {'id': 5, 'MNEMONIQUE': 4, 'NOM': 'Cours 1'}
+    assert db.indexes_built_tables == ['cours']
+    assert 'MNEMONIQUE' in db.indexes['cours'] and 'NOM' not in db.indexes['cours']
+    # changes keep the built fields up to date, the others are built from the entries
+    db.update_entries('cours', 'MNEMONIQUE', 4, 'NOM', 'Algo')
+    db.add_entry('cours', {'MNEMONIQUE': 20, 'NOM': 'Algo'})
+    assert 'NOM' not in db.indexes['cours']
+    assert db.select_entries('cours', ('id',), 'NOM', 'Algo') == [5, 21]
+    assert db.get_entries('cours', 'MNEMONIQUE', 20) == [{'id': 21, 'MNEMONIQUE': 20, 'NOM': 'Algo'}]
+    # built at once on demand
+    db = Database('lazy_db', warm_up=True)
+    assert sorted(db.indexes_built_tables) == ['cours', 'profs']
+    assert {'MNEMONIQUE', 'NOM'} <= set(db.indexes['cours']) and {'NOM', 'BUREAU'} <= set(db.indexes['profs'])
+    db.close()
+    db = get_db('lazy_db')
+    db.build_indexes('profs')
+    assert db.indexes_built_tables == ['profs']
+    db.delete_table('cours')
+    db.delete_table('profs')
+    assert db.entry_positions == {} and db.table_meta == {}
+
+def test_lazy_string_buffer():
+    from database import FieldType
+    db = get_empty_db('lazy_db')
+    db.create_table('cours', ('MNEMONIQUE', FieldType.INTEGER), ('NOM', FieldType.STRING))
+    db.add_entry('cours', {'MNEMONIQUE': 0, 'NOM': 'Algo'})
+    db.close()
+    # the string buffer expanded by an insertion before the table is built
+    db = get_db('lazy_db')
+    db.add_entries('cours', [{'MNEMONIQUE': 1, 'NOM': 'Algo'}, {'MNEMONIQUE': 2, 'NOM': 'x' * 5000}])
+    db.delete_entries('cours', 'MNEMONIQUE', 0)
+    db.close()
+    assert get_db('lazy_db').get_complete_table('cours') == [
+        {'id': 2, 'MNEMONIQUE': 1, 'NOM': 'Algo'}, {'id': 3, 'MNEMONIQUE': 2, 'NOM': 'x' * 5000}]
+    # the strings of a rolled back transaction are forgotten, the table is not built
+    db = get_db('lazy_db')
+    db.begin()
+    db.add_entry('cours', {'MNEMONIQUE': 3, 'NOM': 'X'})
+    db.rollback()
+    db.add_entry('cours', {'MNEMONIQUE': 4, 'NOM': 'X'})
+    db.add_entry('cours', {'MNEMONIQUE': 5, 'NOM': 'Y'})
+    assert [e['NOM'] for e in get_db('lazy_db').get_complete_table('cours')] == ['Algo', 'x' * 5000, 'X', 'Y']
+    db.delete_table('cours')
+
+def test_index_files():
+    import os
+    import shutil
+    from database import FieldType
+    db = get_empty_db('index_file_db')
+    db.persist_indexes = True
+    db.create_table('cours', ('MNEMONIQUE', FieldType.INTEGER), ('NOM', FieldType.STRING))
+    db.add_entries('cours', [{'MNEMONIQUE': i % 10, 'NOM': f"Cours {i % 7}"} for i in range(100)])
+    db.delete_entries('cours', 'MNEMONIQUE', 3)
+    lookups = [('MNEMONIQUE', 4), ('NOM', 'Cours 2'), ('id', 5), ('id', 4), ('MNEMONIQUE', 3), ('NOM', 'Algo'), ('MNEMONIQUE', 'Algo')]
+    expected = [db.get_entries('cours', field, value) for field, value in lookups]
+    db.close()
+    # saved for the entry IDs and the fields looked up
+    assert {'cours.id.idx', 'cours.MNEMONIQUE.idx', 'cours.NOM.idx'} <= set(os.listdir('index_file_db'))
+    # the next process answers from them without reading the whole table
+    db = get_db('index_file_db')
+    assert [db.get_entries('cours', field, value) for field, value in lookups] == expected
+    assert db.get_entry('cours', 'NOM', 'Cours 2') == expected[1][0]
+    assert db.select_entries('cours', ('id', 'MNEMONIQUE'), 'NOM', 'Cours 2') == [(e['id'], e['MNEMONIQUE']) for e in expected[1]]
+    assert db.indexes_built_tables == []
+    # removed before the table changes
+    shutil.copy('index_file_db/cours.NOM.idx', 'index_file_db/stale.idx')
+    db.update_entries('cours', 'MNEMONIQUE', 4, 'NOM', 'Algo')
+    assert not any(name.startswith('cours.') and name.endswith('.idx') for name in os.listdir('index_file_db'))
+    db.close()
+    # a file saved from another state of the table is ignored and removed
+    os.replace('index_file_db/stale.idx', 'index_file_db/cours.NOM.idx')
+    db = get_db('index_file_db')
+    assert [e['id'] for e in db.get_entries('cours', 'NOM', 'Algo')] == [e['id'] for e in expected[0]]
+    assert db.indexes_built_tables == ['cours']
+    assert not os.path.exists('index_file_db/cours.NOM.idx')
+    # so is a damaged one
+    db.persist_indexes = True
+    db.close()
+    with open('index_file_db/cours.NOM.idx', 'rb+') as f:
+        f.truncate(os.path.getsize('index_file_db/cours.NOM.idx') - 1)
+    db = get_db('index_file_db')
+    assert len(db.get_entries('cours', 'NOM', 'Algo')) == 10
+    assert not os.path.exists('index_file_db/cours.NOM.idx')
+    db.delete_table('cours')
+    assert os.listdir('index_file_db') == []
+
+def test_range_queries():
+    from database import FieldType
+    from index import prefix_range
+    db = get_empty_db('range_db')
+    db.persist_indexes = True
+    db.create_table('cours', ('MNEMONIQUE', FieldType.INTEGER), ('NOM', FieldType.STRING), ('CRED', FieldType.INTEGER))
+    names = ['Algo', 'Algèbre', 'Analyse', 'Bases de données', 'Alg', 'Chimie']
+    db.add_entries('cours', [{'MNEMONIQUE': 100 + 10 * i, 'NOM': names[i % 6], 'CRED': i % 7} for i in range(30)])
+    db.update_entries('cours', 'MNEMONIQUE', 150, 'CRED', 6)
+    db.delete_entries('cours', 'CRED', 2)
+    entries = db.get_complete_table('cours')
+    def expected(field, keep):
+        return sorted((e for e in entries if keep(e[field])), key=lambda e: (e[field], e['id']))
+    # ordered by the field, then by ID
+    assert db.get_entries_range('cours', 'CRED', 5) == expected('CRED', lambda v: v >= 5)
+    assert db.get_entries_range('cours', 'MNEMONIQUE', 150, 200) == expected('MNEMONIQUE', lambda v: 150 <= v <= 200)
+    assert db.get_entries_range('cours', 'MNEMONIQUE', 150, 200, include_low=False, include_high=False) == expected('MNEMONIQUE', lambda v: 150 < v < 200)
+    assert db.get_entries_range('cours', 'CRED') == expected('CRED', lambda v: True)
+    assert db.get_entries_range('cours', 'CRED', 4, 3) == []
+    assert db.get_entries_range('cours', 'id', 3, 6) == [e for e in entries if 3 <= e['id'] <= 6]
+    assert db.get_entries_range('cours', 'NOM', *prefix_range('Alg'), include_high=False) == expected('NOM', lambda v: v.startswith('Alg'))
+    assert db.select_entries_range('cours', ('NOM',), 'CRED', None, 1) == [e['NOM'] for e in expected('CRED', lambda v: v <= 1)]
+    assert db.get_field_bounds('cours', 'NOM') == ('Alg', 'Chimie')
+    assert db.get_field_bounds('cours', 'CRED') == (0, 6)
+    # from the index files, after a restart
+    db.close()
+    db = get_db('range_db')
+    assert db.get_entries_range('cours', 'CRED', 5) == expected('CRED', lambda v: v >= 5)
+    assert db.get_entries_range('cours', 'NOM', *prefix_range('Al'), include_high=False) == expected('NOM', lambda v: v.startswith('Al'))
+    assert db.indexes_built_tables == []
+    with pytest.raises(ValueError):
+        db.get_entries_range('cours', 'CRED', 'Algo')
+    db.delete_table('cours')
+    db.create_table('profs', ('NOM', FieldType.STRING))
+    assert db.get_field_bounds('profs', 'NOM') is None and db.get_entries_range('profs', 'NOM', 'A') == []
+    db.delete_table('profs')
+
+def test_dense_bitmaps():
+    from array import array
+    from database import FieldType
+    from index import Bitmap, FieldIndex
+    db = get_empty_db('bitmap_db')
+    db.create_table('cours', ('MNEMONIQUE', FieldType.INTEGER), ('CRED', FieldType.INTEGER))
+    db.add_entries('cours', [{'MNEMONIQUE': i, 'CRED': 5 if i % 10 else i % 7} for i in range(200)])
+    expected = {cred: db.get_entries('cours', 'CRED', cred) for cred in range(7)}
+    # arrays of 32-bit IDs by default
+    assert all(type(ids) is array for _, ids in db.indexes['cours']['CRED'].items())
+    db.close()
+    db = get_db('bitmap_db')
+    db.dense_bitmaps = True
+    assert {cred: db.get_entries('cours', 'CRED', cred) for cred in range(7)} == expected
+    postings = db.indexes['cours']['CRED'].postings
+    # a bitmap for the value of most entries, arrays for the rare ones
+    assert isinstance(postings[5], Bitmap) and isinstance(postings[0], array)
+    assert postings[5].nbytes == 26
+    db.update_entries('cours', 'CRED', 0, 'CRED', 5)
+    db.delete_entries('cours', 'MNEMONIQUE', 7)
+    assert [e['id'] for e in db.get_entries('cours', 'CRED', 5)] == sorted(
+        [e['id'] for e in expected[5] if e['id'] != 8] + [e['id'] for e in expected[0]])
+    assert db.get_entries_range('cours', 'CRED', 5, 6) == sorted(
+        (e for e in db.get_complete_table('cours') if e['CRED'] >= 5), key=lambda e: (e['CRED'], e['id']))
+    # back to an array once its entries are few
+    index = FieldIndex(((1, entry_id) for entry_id in range(1, 101)), bitmaps=True)
+    assert isinstance(index.postings[1], Bitmap)
+    for entry_id in range(2, 100):
+        index.remove(1, entry_id)
+    assert list(index.get(1)) == [1, 100] and isinstance(index.postings[1], array)
+    db.delete_table('cours')
+
+def test_find():
+    from database import FieldType
+    from index import RoaringBitmap
+    db = get_empty_db('find_db')
+    db.create_table('cours', ('MNEMONIQUE', FieldType.INTEGER), ('CRED', FieldType.INTEGER), ('COORD', FieldType.STRING))
+    coords = ['G. Joret', 'J. Cardinal', 'S. Fiorini']
+    db.add_entries('cours', [{'MNEMONIQUE': 100 + i, 'CRED': i % 6, 'COORD': coords[i % 3]} for i in range(60)])
+    db.delete_entries('cours', 'CRED', 4)
+    entries = db.get_complete_table('cours')
+    # AND
+    assert db.find('cours', {'CRED': 5, 'COORD': 'G. Joret'}) == [e for e in entries if e['CRED'] == 5 and e['COORD'] == 'G. Joret']
+    # OR groups, and any of a list of values
+    assert db.find('cours', [{'CRED': 5, 'COORD': 'G. Joret'}, {'CRED': [0, 1], 'COORD': 'S. Fiorini'}, {'id': 2}]) == [
+        e for e in entries if (e['CRED'] == 5 and e['COORD'] == 'G. Joret') or (e['CRED'] in (0, 1) and e['COORD'] == 'S. Fiorini') or e['id'] == 2]
+    assert db.find('cours', {'CRED': 4}) == [] and db.find('cours') == entries
+    assert db.find('cours', {}) == db.find('cours', []) == entries
+    # the bitmaps follow the changes
+    assert len(db.find('cours', {'COORD': 'J. Cardinal'})) == 10
+    db.update_entries('cours', 'MNEMONIQUE', 100, 'COORD', 'J. Cardinal')
+    db.add_entry('cours', {'MNEMONIQUE': 200, 'CRED': 5, 'COORD': 'J. Cardinal'})
+    assert [e['MNEMONIQUE'] for e in db.find('cours', {'COORD': 'J. Cardinal', 'CRED': [0, 5]})] == [100, 200]
+    # answered from the index files of the fields after a restart, without building the table
+    wheres = [{'COORD': 'J. Cardinal', 'CRED': [0, 5]}, [{'CRED': 5, 'COORD': 'G. Joret'}, {'id': 2}], None]
+    expected = [db.find('cours', where) for where in wheres]
+    db.persist_indexes = True
+    db.close()
+    db = get_db('find_db')
+    assert [db.find('cours', where) for where in wheres] == expected
+    assert db.indexes_built_tables == []
+    for where in ({'CRED': 'cinq'}, {'ECTS': 5}):
+        with pytest.raises(ValueError):
+            db.find('cours', where)
+    with pytest.raises(TypeError):
+        db.find('cours', ['CRED'])
+    # chunks of 65536 IDs, sparse or dense
+    a = RoaringBitmap.from_ids(range(0, 200000, 3))
+    b = RoaringBitmap.from_ids([5, 6, 9, 70000, 70002, 199998])
+    assert list(a & b) == [6, 9, 70002, 199998] and len(a | b) == len(a) + 2
+    assert list(a & RoaringBitmap.from_ids(range(0, 200000, 2)))[:3] == [0, 6, 12]
+    db.delete_table('cours')
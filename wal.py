@@ -0,0 +1,295 @@
+# Author: Waberi Daher
+# Matricule: 000353308
+import os
+import struct
+import time
+import zlib
+
+# name of the log file in the directory of the database
+WAL_FILE = 'uldb.wal'
+# sync modes of the log
+SYNC_MODES = ('full', 'group', 'off')
+# record header: size of the body, crc32 of the body
+RECORD_HEADER = struct.Struct('<II')
+# change header: position in the table file, number of bytes written (-1 for a truncation)
+CHANGE_HEADER = struct.Struct('<ii')
+# kinds of records: changes of an operation, changes of a transaction (replayed
+# once its commit record is found), commit of a transaction
+OPERATION, TRANSACTION, COMMIT = 0, 1, 2
+
+
+class TableJournal:
+    """
+    Changes made to one table file since the last commit, as a BinaryFile records
+    them (see BinaryFile.journal): the bytes written at each position and the
+    truncations, in order. commit() appends them to the log as one record,
+    before they reach the table file.
+    """
+    def __init__(self, wal: 'WriteAheadLog', table_name: str, transaction: bool = False):
+        """
+        :param wal: log the changes are committed to
+        :param table_name: name of the table of the file
+        :param transaction: True if the changes belong to a transaction, committed by WriteAheadLog.commit_transaction
+        """
+        self.wal = wal
+        self.table_name = table_name
+        self.transaction = transaction
+        # (position, bytes written) or (size, None) for a truncation
+        self.changes: list[tuple[int, bytes | None]] = []
+
+    def write(self, pos: int, data: bytes) -> None:
+        """
+        Records bytes written at pos.
+        """
+        self.changes.append((pos, bytes(data)))
+
+    def truncate(self, size: int) -> None:
+        """
+        Records a truncation of the file to size bytes.
+        """
+        self.changes.append((size, None))
+
+    def commit(self) -> None:
+        """
+        Appends the recorded changes to the log as one record, if any.
+        """
+        if self.changes:
+            self.wal.append(self.table_name, self.changes, self.transaction)
+            self.changes = []
+
+    def discard(self) -> None:
+        """
+        Forgets the recorded changes (e.g. the file they apply to is replaced).
+        """
+        self.changes = []
+
+
+class WriteAheadLog:
+    """
+    Redo log of the changes made to the table files of a database. Every change
+    is appended to the log before it is written to its table file: each record
+    holds the bytes written to one table file by an operation (records of
+    entries, pointers, headers, appended strings) and its truncations, with a
+    checksum so a record torn by a crash is ignored. After a crash, replay()
+    writes the committed records again, which brings every table file back to
+    the state of its last committed operation. The records of a transaction are
+    only replayed if its commit record follows them, so the tables it changed
+    are restored together.
+    A checkpoint makes the table files durable and empties the log.
+
+    Sync modes (when the log reaches the disk):
+    - 'full': every commit is synced, nothing committed is lost.
+    - 'group': the commits are synced by groups: once group_size of them are
+      waiting, or by the first commit made group_interval seconds or more after
+      the first waiting one (flush() syncs the rest). A process crash loses
+      nothing, a system crash can lose the last group.
+    - 'off': the log is never synced, it only protects against process crashes.
+    """
+    def __init__(self, path: str, sync: str = 'group', group_size: int = 64, group_interval: float = 0.05, checkpoint_size: int = 1 << 24):
+        """
+        :param path: path of the log file (created if needed)
+        :param sync: sync mode ('full', 'group' or 'off')
+        :param group_size: number of commits synced together in 'group' mode
+        :param group_interval: longest time in seconds a commit waits for its sync in 'group' mode
+        :param checkpoint_size: size of the log in bytes from which a checkpoint is due
+        :raises ValueError: if the sync mode or a group parameter is invalid
+        """
+        if sync not in SYNC_MODES:
+            raise ValueError(f"Unknown sync mode {sync}, choose from {', '.join(SYNC_MODES)}")
+        if group_size < 1 or group_interval < 0:
+            raise ValueError(f"Invalid group commit parameters: size {group_size}, interval {group_interval}")
+        self.path = path
+        self.sync = sync
+        self.group_size = group_size
+        self.group_interval = group_interval
+        self.checkpoint_size = checkpoint_size
+        self.directory = os.path.dirname(path)
+        self.file = open(path, 'ab')
+        # commits not synced yet, and when the first of them was made
+        self.pending = 0
+        self.pending_since = 0.0
+        # paths of the table files changed since the last checkpoint
+        self.dirty: set[str] = set()
+        # number of commits (operations and transactions) and of syncs
+        self.commits = 0
+        self.syncs = 0
+
+    def append(self, table_name: str, changes: list[tuple[int, bytes | None]], transaction: bool = False) -> None:
+        """
+        Appends the changes of a table file to the log as one record, which is
+        synced according to the sync mode, unless it belongs to a transaction.
+        :param table_name: name of the table
+        :param changes: (position, bytes written) or (size, None) for a truncation, in order
+        :param transaction: True if the record is part of a transaction, synced with its commit record
+        """
+        name = table_name.encode('utf-8')
+        parts = [bytes((TRANSACTION if transaction else OPERATION,)), len(name).to_bytes(2, 'little'), name]
+        for pos, data in changes:
+            if data is None:
+                parts.append(CHANGE_HEADER.pack(pos, -1))
+            else:
+                parts.append(CHANGE_HEADER.pack(pos, len(data)))
+                parts.append(data)
+        self._write_record(b''.join(parts))
+        self.dirty.add(os.path.join(self.directory, f"{table_name}.table"))
+        if not transaction:
+            self._commit()
+
+    def commit_transaction(self) -> None:
+        """
+        Appends the commit record of the transaction whose records were just
+        appended, synced according to the sync mode.
+        """
+        self._write_record(bytes((COMMIT,)))
+        self._commit()
+
+    def _write_record(self, body: bytes) -> None:
+        """
+        Writes a record with its header to the log.
+        :param body: body of the record
+        """
+        self.file.write(RECORD_HEADER.pack(len(body), zlib.crc32(body)) + body)
+        # in the operating system before the table file is written
+        self.file.flush()
+
+    def _commit(self) -> None:
+        """
+        Syncs the records written according to the sync mode.
+        """
+        self.commits += 1
+        if self.sync == 'full':
+            self._sync()
+        elif self.sync == 'group':
+            if self.pending == 0:
+                self.pending_since = time.monotonic()
+            self.pending += 1
+            if self.pending >= self.group_size or time.monotonic() - self.pending_since >= self.group_interval:
+                self._sync()
+
+    def _sync(self) -> None:
+        """
+        Syncs the log to the disk.
+        """
+        os.fsync(self.file.fileno())
+        self.pending = 0
+        self.syncs += 1
+
+    def flush(self) -> None:
+        """
+        Syncs the commits still waiting for their group, if any.
+        """
+        if self.pending and self.sync != 'off':
+            self._sync()
+
+    def needs_checkpoint(self) -> bool:
+        """
+        :return: True once the log is larger than checkpoint_size
+        """
+        return self.file.tell() >= self.checkpoint_size
+
+    def checkpoint(self) -> None:
+        """
+        Syncs the table files changed since the last checkpoint, whose changes
+        must all have been written to them, and empties the log.
+        """
+        for path in self.dirty:
+            sync_file(path)
+        self.dirty.clear()
+        self.file.truncate(0)
+        self.file.seek(0)
+        if self.sync != 'off':
+            os.fsync(self.file.fileno())
+        self.pending = 0
+
+    def close(self) -> None:
+        """
+        Checkpoints and closes the log.
+        """
+        if not self.file.closed:
+            self.checkpoint()
+            self.file.close()
+
+
+def sync_file(path: str) -> None:
+    """
+    Syncs a file to the disk, if it exists.
+    :param path: path of the file (or of a directory)
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def replay(path: str) -> tuple[int, int]:
+    """
+    Writes the committed records of a log to their table files, stopping at the
+    first torn or corrupted record, syncs the table files and removes the log.
+    The records of a transaction without its commit record are dropped, those
+    of tables whose file no longer exists are skipped.
+    :param path: path of the log file
+    :return: number of records replayed, number of transactions committed
+    """
+    directory = os.path.dirname(path)
+    with open(path, 'rb') as f:
+        log = f.read()
+    files = {}
+    replayed = committed = 0
+    # records of the transaction in progress
+    transaction = []
+    pos = 0
+    try:
+        while pos + RECORD_HEADER.size <= len(log):
+            size, crc = RECORD_HEADER.unpack_from(log, pos)
+            body = log[pos + RECORD_HEADER.size:pos + RECORD_HEADER.size + size]
+            if len(body) < size or zlib.crc32(body) != crc:
+                break
+            pos += RECORD_HEADER.size + size
+            if body[0] == TRANSACTION:
+                transaction.append(body)
+                continue
+            bodies = [body] if body[0] == OPERATION else transaction
+            if body[0] == COMMIT:
+                committed += 1
+                transaction = []
+            for body in bodies:
+                _apply_record(body, directory, files)
+            replayed += len(bodies)
+    finally:
+        for table_file in files.values():
+            if table_file is not None:
+                table_file.flush()
+                os.fsync(table_file.fileno())
+                table_file.close()
+    os.remove(path)
+    return replayed, committed
+
+
+def _apply_record(body: bytes, directory: str, files: dict) -> None:
+    """
+    Writes the changes of a record to its table file.
+    :param body: body of the record
+    :param directory: directory of the table files
+    :param files: path -> table file opened by the replay (None if it does not exist)
+    """
+    name_size = int.from_bytes(body[1:3], 'little')
+    table_path = os.path.join(directory, f"{body[3:3 + name_size].decode('utf-8')}.table")
+    if table_path not in files:
+        files[table_path] = open(table_path, 'rb+') if os.path.exists(table_path) else None
+    table_file = files[table_path]
+    offset = 3 + name_size
+    while offset < len(body):
+        change_pos, change_size = CHANGE_HEADER.unpack_from(body, offset)
+        offset += CHANGE_HEADER.size
+        if change_size == -1:
+            if table_file is not None:
+                table_file.truncate(change_pos)
+            continue
+        if table_file is not None:
+            table_file.seek(change_pos)
+            table_file.write(body[offset:offset + change_size])
+        offset += change_size